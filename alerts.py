@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+
+import cv2
+
+EVENT_TITLES = {
+    'fall': '跌倒检测报警',
+    'person': '人物检测报警'
+}
+
+EVENT_STATUS = {
+    'fall': '检测到人员跌倒',
+    'person': '检测到人员'
+}
+
+
+# 令牌桶：每 interval 秒补充一个令牌，最多积攒 capacity 个
+class TokenBucket:
+    def __init__(self, interval, capacity=1):
+        self.rate = 1.0 / interval if interval and interval > 0 else float('inf')
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self._last = time.monotonic()
+
+    def consume(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# 一次持续中的事件（同一摄像头、同一人、同一类型）
+class Incident:
+    def __init__(self, now):
+        self.started = now
+        self.last_seen = now
+        self.last_alert = now
+        self.alerts = 0
+
+
+# 报警引擎：按 (摄像头, 跟踪ID, 事件类型) 去重
+# - 新事件立即报警；同一事件持续期间只有超过 repeat_intervals[事件类型] 秒才再次升级报警
+# - 事件 clear_after 秒未再出现视为结束，之后再出现算新事件
+# - digest_window 内的多条报警合并成一条消息，发送频率再由令牌桶统一限制；
+#   urgent_types（默认跌倒）的报警不受令牌桶限制，下一次合并时立即发出，不会被例行的有人报警耗尽额度而延误
+# 检测线程只调用 observe()，截图保存、消息拼接和发送都在后台线程完成；
+# 截图真正保存后记录时间，画面上的 "Screenshot Saved" 提示由 screenshot_saved_since() 决定
+# 配置了 event_store 时，每条报警和每次发送都写入事件历史
+class AlertEngine:
+    def __init__(self, notifier, notification_config, screenshot_dir=None,
+                 notification_interval=300, burst=3, repeat_intervals=None,
+                 clear_after=10.0, digest_window=2.0, event_store=None, urgent_types=('fall',)):
+        self.notifier = notifier
+        self.notification_config = notification_config
+        self.screenshot_dir = screenshot_dir
+        self.event_store = event_store
+        self.repeat_intervals = repeat_intervals or {}
+        self.clear_after = clear_after
+        self.digest_window = digest_window
+        self.urgent_types = frozenset(urgent_types)
+        self.bucket = TokenBucket(notification_interval, burst)
+
+        self.observed = 0
+        self.fired = 0
+        self.digests_sent = 0
+        self.rate_limited = 0
+        self.urgent_sent = 0
+        self._incidents = {}
+        self._pending = {}
+        self._screenshot_times = {}  # 摄像头 -> 最近一次保存截图的时间
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="alert-engine", daemon=True)
+        self._thread.start()
+
+    # 检测线程每帧对每个活跃事件调用一次；返回 True 表示本次触发了报警
+    # （报警只是进入队列，可能还在合并 / 限流，截图和发送由后台线程稍后完成）
+    # 只做字典查找和时间比较，触发时才拷贝一份画面用于截图
+    # clip 为同一事件的录像文件路径，记录到事件历史中
+    def observe(self, camera, track_id, event_type, frame=None, count=None, clip=None):
+        now = time.monotonic()
+        key = (camera, track_id, event_type)
+        with self._lock:
+            self.observed += 1
+            incident = self._incidents.get(key)
+            if incident is None or now - incident.last_seen > self.clear_after:
+                incident = Incident(now)
+                self._incidents[key] = incident
+                fire = True
+            else:
+                repeat_interval = self.repeat_intervals.get(event_type)
+                fire = repeat_interval is not None and now - incident.last_alert >= repeat_interval
+            incident.last_seen = now
+            if not fire:
+                return False
+
+            incident.last_alert = now
+            incident.alerts += 1
+            self.fired += 1
+            # 同一事件在一次发送前多次报警时逐条保留，合并进同一条消息并分别写入事件历史
+            self._pending.setdefault(key, []).append({
+                "time": time.time(),
+                "duration": now - incident.started,
+                "repeat": incident.alerts > 1,
+                "count": count,
+                "clip": clip,
+                "frame": frame.copy() if frame is not None else None
+            })
+        return True
+
+    # 该摄像头在 since 之后是否已经保存过报警截图（截图在后台发送时才保存）
+    def screenshot_saved_since(self, camera, since):
+        with self._lock:
+            return self._screenshot_times.get(camera, 0.0) >= since
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join(timeout=self.digest_window + 1)
+        self._flush(force=True)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "active_incidents": len(self._incidents),
+                "pending": sum(len(alerts) for alerts in self._pending.values()),
+                "observed": self.observed,
+                "fired": self.fired,
+                "digests_sent": self.digests_sent,
+                "rate_limited": self.rate_limited,
+                "urgent_sent": self.urgent_sent
+            }
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.digest_window):
+            self._flush()
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            # 清理已经结束的事件
+            for key in [k for k, v in self._incidents.items() if now - v.last_seen > self.clear_after]:
+                del self._incidents[key]
+            if not self._pending:
+                return
+            urgent = any(key[2] in self.urgent_types for key in self._pending)
+            if urgent:
+                # 紧急报警不占用令牌，排队中的例行报警一并合并发出
+                self.urgent_sent += 1
+            elif not force and not self.bucket.consume(now):
+                # 超出发送频率，报警留在队列中与后续报警合并
+                self.rate_limited += 1
+                return
+            pending, self._pending = self._pending, {}
+            self.digests_sent += 1
+
+        message = self._build_message(pending)
+        self.notifier.dispatch(message, self.notification_config)
+        if self.event_store is not None:
+            cameras = sorted({key[0] for key in pending if key[0]})
+            self.event_store.record_event(cameras[0] if len(cameras) == 1 else None, 'alert_sent',
+                                          detail={"events": sum(len(alerts) for alerts in pending.values()),
+                                                  "cameras": cameras})
+
+    def _save_screenshot(self, key, alert):
+        camera, track_id, event_type = key
+        parts = ['detection' if event_type == 'person' else event_type]
+        if camera:
+            parts.append(str(camera))
+        if track_id is not None:
+            parts.append(f"id{track_id}")
+        parts.append(time.strftime('%Y%m%d_%H%M%S', time.localtime(alert["time"])))
+        name = '_'.join(parts)
+        path = os.path.join(self.screenshot_dir, name + '.jpg')
+        # 同一秒内同一事件的多张截图加序号，不互相覆盖
+        index = 1
+        while os.path.exists(path):
+            path = os.path.join(self.screenshot_dir, f"{name}_{index}.jpg")
+            index += 1
+        cv2.imwrite(path, alert["frame"])
+        with self._lock:
+            self._screenshot_times[camera] = time.time()
+        return path
+
+    def _build_message(self, pending):
+        event_types = {key[2] for key in pending}
+        title = EVENT_TITLES['fall'] if 'fall' in event_types else EVENT_TITLES.get(next(iter(event_types)), '监控报警')
+
+        events = [(key, alert) for key, alerts in pending.items() for alert in alerts]
+        lines = []
+        screenshots = []
+        for key, alert in sorted(events, key=lambda item: item[1]["time"]):
+            camera, track_id, event_type = key
+            subject = []
+            if camera:
+                subject.append(f"摄像头 {camera}")
+            if track_id is not None:
+                subject.append(f"人员 ID {track_id}")
+            if event_type == 'person' and alert["count"]:
+                status = f"检测到 {alert['count']} 人"
+            else:
+                status = EVENT_STATUS.get(event_type, event_type)
+            if alert["repeat"]:
+                status += f"（已持续 {int(alert['duration'])} 秒）"
+            lines.append(f"{' / '.join(subject)}: {status}" if subject else f"状态: {status}")
+
+            screenshot = None
+            if alert["frame"] is not None and self.screenshot_dir:
+                try:
+                    screenshot = self._save_screenshot(key, alert)
+                    screenshots.append(screenshot)
+                except Exception as e:
+                    print(f"保存报警截图失败: {e}")
+
+            if self.event_store is not None:
+                self.event_store.record_event(camera, event_type, track_id, alert["count"],
+                                              snapshot=screenshot, clip=alert["clip"],
+                                              detail={"repeat": alert["repeat"],
+                                                      "duration": round(alert["duration"], 1)},
+                                              now=alert["time"])
+
+        message = f"【{title}】\n\n时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n" + "\n".join(lines)
+        if screenshots:
+            message += "\n\n截图已保存到: " + "\n".join(screenshots)
+        message += "\n\n请及时查看监控画面！"
+
+        print(f"[{time.strftime('%H:%M:%S')}] 发送报警通知: 共 {len(events)} 条事件")
+        for path in screenshots:
+            print(f"[{time.strftime('%H:%M:%S')}] 截图已保存: {path}")
+        return message
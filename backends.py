@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'fp16', 'int8')
+
+
+# 根据模型大小 (n/s/m/l/x) 和任务得到 .pt 文件名
+def model_filename(model_size='l', task='detect'):
+    suffix = '-pose' if task == 'pose' else ''
+    return f'yolo11{model_size}{suffix}.pt'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# 推理模型包装：统一 PyTorch / ONNX Runtime / OpenVINO 的调用方式
+# 每次调用自动带上导出时的输入尺寸，调用方仍按 model(frame) / model.track(frame) 使用
+# ONNX / OpenVINO 模型按固定 batch 导出：多张图片按 batch 分组推理，最后一组不足时用最后一张补齐，
+# 补齐部分的结果丢弃，调用方可以传入任意数量的图片（运动门控跳帧、ROI / 分块都会改变数量）
+class InferenceModel:
+    def __init__(self, yolo, backend, imgsz, precision, path, batch=None):
+        self.yolo = yolo
+        self.backend = backend
+        self.imgsz = imgsz
+        self.precision = precision
+        self.path = path
+        self.batch = batch  # None 表示任意 batch（PyTorch）
+
+    def __call__(self, source, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self._run(self.yolo, source, kwargs)
+
+    def track(self, source, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self._run(self.yolo.track, source, kwargs)
+
+    def _run(self, predict, source, kwargs):
+        if not self.batch:
+            return predict(source, **kwargs)
+        images = source if isinstance(source, list) else [source]
+        results = []
+        for i in range(0, len(images), self.batch):
+            chunk = images[i:i + self.batch]
+            padded = chunk + [chunk[-1]] * (self.batch - len(chunk))
+            results += list(predict(padded, **kwargs))[:len(chunk)]
+        return results
+
+    # 清空跟踪器：已有轨迹和编号全部丢弃，下一次 track() 重新分配编号
+    def reset_tracker(self):
+        predictor = getattr(self.yolo, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            tracker.reset()
+
+    # 预热：首次推理要初始化线程池、分配内存，放在开始采集之前完成
+    def warmup(self, runs=2):
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        start = time.time()
+        for _ in range(runs):
+            self(dummy, verbose=False)
+        if runs:
+            print(f"模型预热完成: {runs} 次，耗时 {time.time() - start:.2f} 秒")
+
+    def describe(self):
+        return {
+            "backend": self.backend,
+            "model": os.path.basename(self.path),
+            "imgsz": self.imgsz,
+            "precision": self.precision
+        }
+
+
+# 导出并缓存模型：缓存放在 .pt 旁边（或 cache_dir），文件名带 .pt 内容的哈希，
+# .pt 更新后自动重新导出，否则直接复用上次导出的结果
+def export_model(pt_path, backend, imgsz, precision, batch=1, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(pt_path), 'model_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stem = os.path.splitext(os.path.basename(pt_path))[0]
+    key = f"{stem}_{file_hash(pt_path)[:12]}_{imgsz}_{precision}_b{batch}"
+    if backend == 'onnx':
+        cached = os.path.join(cache_dir, key + '.onnx')
+    else:
+        cached = os.path.join(cache_dir, key + '_openvino_model')
+    if os.path.exists(cached):
+        print(f"使用已缓存的 {backend} 模型: {cached}")
+        return cached
+
+    print(f"首次使用 {backend} 后端，正在导出模型（只需一次）...")
+    start = time.time()
+    export_args = {
+        'format': backend,
+        'imgsz': imgsz,
+        'batch': batch,
+        'half': precision == 'fp16',
+        # OpenVINO 原生支持 INT8 量化导出；ONNX 的 INT8 在下方用 onnxruntime 动态量化
+        'int8': precision == 'int8' and backend == 'openvino'
+    }
+    from ultralytics import YOLO
+    exported = YOLO(pt_path).export(**export_args)
+
+    if backend == 'onnx' and precision == 'int8':
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(exported, cached, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        except ImportError:
+            print("未安装 onnxruntime 量化工具，INT8 回退为 FP32")
+            shutil.move(exported, cached)
+    else:
+        shutil.move(exported, cached)
+
+    print(f"模型导出完成，耗时 {time.time() - start:.1f} 秒: {cached}")
+    return cached
+
+
+# 按配置加载推理模型，backend 导出失败时回退到 PyTorch
+def load_model(pt_path, backend='pytorch', imgsz=640, precision='fp32', batch=1,
+               cache_dir=None, warmup_runs=2, task=None):
+    if backend not in BACKENDS:
+        print(f"未知的推理后端 {backend}，使用 pytorch")
+        backend = 'pytorch'
+    if precision not in PRECISIONS:
+        print(f"未知的推理精度 {precision}，使用 fp32")
+        precision = 'fp32'
+
+    path = pt_path
+    if backend != 'pytorch':
+        try:
+            path = export_model(pt_path, backend, imgsz, precision, batch, cache_dir)
+        except Exception as e:
+            print(f"导出 {backend} 模型失败: {e}，回退到 pytorch")
+            backend = 'pytorch'
+            path = pt_path
+
+    # ultralytics（连同 torch）导入要好几秒，推迟到真正加载模型时，服务可以先启动
+    from ultralytics import YOLO
+    print(f"正在加载模型: {path} (后端: {backend}, 输入尺寸: {imgsz}, 精度: {precision})")
+    yolo = YOLO(path, task=task)
+    model = InferenceModel(yolo, backend, imgsz, precision, path, batch if backend != 'pytorch' else None)
+    model.warmup(warmup_runs)
+    return model
+
+
+# 预加载一组 (模型大小, 输入尺寸) 档位，返回 {(大小, 尺寸): 模型}
+# PyTorch 同一大小只加载一次，各输入尺寸共用权重（和跟踪器状态）；其他后端按尺寸分别导出
+# 加载失败的档位（如缺少模型文件）跳过
+def load_variants(levels, path_for_size, backend='pytorch', precision='fp32', batch=1,
+                  cache_dir=None, warmup_runs=1, task=None):
+    variants = {}
+    loaded = {}
+    for size, imgsz in levels:
+        try:
+            base = loaded.get(size)
+            if base is not None and base.backend == 'pytorch':
+                model = InferenceModel(base.yolo, base.backend, imgsz, base.precision, base.path, base.batch)
+                model.warmup(warmup_runs)
+            else:
+                model = load_model(path_for_size(size), backend, imgsz, precision, batch, cache_dir,
+                                   warmup_runs, task)
+                loaded.setdefault(size, model)
+        except Exception as e:
+            print(f"加载模型档位 {size}@{imgsz} 失败: {e}")
+            continue
+        variants[(size, imgsz)] = model
+    return variants
+
+
+# 读取录制好的视频片段（最多 max_frames 帧）
+def read_clip(clip_path, max_frames):
+    cap = cv2.VideoCapture(clip_path)
+    frames = []
+    while len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+# 在同一段视频上比较各后端 / 模型大小 / 精度组合的 FPS 和 p50/p99 延迟
+def compare(clip_path, backends, sizes, imgsz, precisions, max_frames=200, cache_dir=None):
+    frames = read_clip(clip_path, max_frames)
+    if not frames:
+        raise SystemExit(f"无法读取视频: {clip_path}")
+
+    app_path = os.path.dirname(os.path.abspath(__file__))
+    report = []
+    for size in sizes:
+        pt_path = os.path.join(app_path, model_filename(size))
+        for backend in backends:
+            for precision in precisions:
+                model = load_model(pt_path, backend, imgsz, precision, cache_dir=cache_dir)
+                if model.backend != backend:
+                    continue  # 导出失败已回退，跳过
+                latencies = []
+                start = time.perf_counter()
+                for frame in frames:
+                    t0 = time.perf_counter()
+                    model(frame, verbose=False)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                elapsed = time.perf_counter() - start
+                entry = dict(model.describe(),
+                             frames=len(frames),
+                             fps=round(len(frames) / elapsed, 2),
+                             p50_ms=round(float(np.percentile(latencies, 50)), 2),
+                             p99_ms=round(float(np.percentile(latencies, 99)), 2))
+                print(json.dumps(entry, ensure_ascii=False))
+                report.append(entry)
+
+    report.sort(key=lambda item: item["fps"], reverse=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较不同推理后端在本机上的速度")
+    parser.add_argument('--compare', required=True, metavar='CLIP', help="录制好的视频文件")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--sizes', nargs='+', default=['n', 's', 'm', 'l'])
+    parser.add_argument('--precisions', nargs='+', default=['fp32'], choices=PRECISIONS)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--output', help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = compare(args.compare, args.backends, args.sizes, args.imgsz, args.precisions, args.frames)
+    print("\n按 FPS 排序:")
+    for item in results:
+        print(f"  {item['backend']:<9} {item['model']:<28} {item['precision']:<5} "
+              f"{item['fps']:>7.2f} FPS  p50 {item['p50_ms']:.1f} ms  p99 {item['p99_ms']:.1f} ms")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
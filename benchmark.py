@@ -0,0 +1,217 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from alerts import AlertEngine
+from backends import load_model, model_filename
+from cascade import PoseCascade
+from fall_detection import FallDetector, classify_falls
+from postprocess import detect_frame, draw_persons
+from streaming import BASE_LEVEL, ConnectionManager, FrameCache, StreamEncoder, encode_for_clients
+
+STAGES = ('decode', 'inference', 'pose', 'postprocess', 'draw', 'encode', 'broadcast')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# 替代 NotificationManager：只计数，不发送任何通知
+class StubNotifier:
+    def __init__(self):
+        self.dispatched = 0
+
+    def dispatch(self, message, config=None):
+        self.dispatched += 1
+
+
+# 帧来源：视频文件，或图片目录 / 通配符（按文件名排序）
+class FrameSource:
+    def __init__(self, source):
+        self.source = source
+        self.cap = None
+        self.images = None
+        if os.path.isdir(source):
+            self.images = sorted(f for f in glob.glob(os.path.join(source, '*'))
+                                 if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif any(ch in source for ch in '*?['):
+            self.images = sorted(glob.glob(source))
+        else:
+            self.cap = cv2.VideoCapture(source)
+            if not self.cap.isOpened():
+                raise SystemExit(f"无法打开视频: {source}")
+        self._index = 0
+
+    def read(self):
+        if self.cap is not None:
+            return self.cap.read()
+        if self._index >= len(self.images):
+            return False, None
+        frame = cv2.imread(self.images[self._index])
+        self._index += 1
+        return frame is not None, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+
+
+def summarize(samples):
+    arr = np.asarray(samples, dtype=np.float64) * 1000
+    if arr.size == 0:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "total_s": 0.0}
+    return {
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "total_s": round(float(arr.sum()) / 1000, 3)
+    }
+
+
+# 无界面回放：调用与 main.py / main2.py 相同的检测（detect_frame）、跌倒判定（classify_falls）、
+# 按需编码（StreamEncoder / encode_for_clients）和推送（ConnectionManager）函数，逐阶段计时
+# cascade 为 PoseCascade 时按两级检测回放：model 是第一级人体检测模型
+def run_benchmark(model, source, mode='fall', max_frames=None, cascade=None):
+    frames = FrameSource(source)
+    notifier = StubNotifier()
+    alert_engine = AlertEngine(notifier, {}, digest_window=0.5)
+    fall_detector = FallDetector()
+    frame_cache = FrameCache()
+    encoder = StreamEncoder()
+    manager = ConnectionManager()
+
+    timings = {stage: [] for stage in STAGES}
+    latencies = []
+    person_total = 0
+    count = 0
+    start_all = time.perf_counter()
+
+    while max_frames is None or count < max_frames:
+        t0 = time.perf_counter()
+        success, frame = frames.read()
+        t1 = time.perf_counter()
+        if not success:
+            break
+
+        detections = detect_frame(model, frame, track=mode == 'fall')
+        t2 = time.perf_counter()
+
+        if cascade is not None:
+            cascade.estimate([(frame, persons) for persons in detections])
+        t2b = time.perf_counter()
+
+        person_count = sum(len(persons) for persons in detections)
+        if mode == 'fall':
+            groups, _ = classify_falls(fall_detector, detections, alert_engine)
+        else:
+            if person_count:
+                alert_engine.observe(None, None, 'person', frame, person_count)
+            groups = [(persons, "Person Detected", (0, 255, 0)) for persons in detections]
+        t3 = time.perf_counter()
+
+        for persons, label, color in groups:
+            draw_persons(frame, persons, label, color)
+        cv2.putText(frame, f"Person Count: {person_count}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        t4 = time.perf_counter()
+
+        # 没有真实客户端，按有 MJPEG / 快照观看者计算：每帧编码基准画质存入共享缓存
+        wanted = manager.wanted_levels(encoder.floor)
+        encoded = encode_for_clients(encoder, frame_cache, frame, {"person_count": person_count}, wanted,
+                                     base_needed=True)
+        t5 = time.perf_counter()
+
+        # 推送阶段：投递给 ConnectionManager，并生成各类客户端要发送的消息（不含网络发送）
+        manager.publish(encoded, wanted)
+        if BASE_LEVEL in encoded:
+            encoded[BASE_LEVEL].json_message()
+            encoded[BASE_LEVEL].mjpeg_part()
+        t6 = time.perf_counter()
+
+        for stage, duration in zip(STAGES, (t1 - t0, t2 - t1, t2b - t2, t3 - t2b, t4 - t3, t5 - t4, t6 - t5)):
+            timings[stage].append(duration)
+        latencies.append(t6 - t0)
+        person_total += person_count
+        count += 1
+
+    elapsed = time.perf_counter() - start_all
+    frames.release()
+    alert_engine.stop()
+
+    return {
+        "source": source,
+        "mode": mode,
+        "frames": count,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_fps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+        "avg_person_count": round(person_total / count, 2) if count else 0.0,
+        "pose_crops": cascade.crops if cascade is not None else None,
+        "encoder": encoder.snapshot(),
+        "alerts": {"fired": alert_engine.fired, "digests": notifier.dispatched},
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线回放视频，测量检测流程各阶段的性能")
+    parser.add_argument('source', help="视频文件、图片目录或通配符（如 'frames/*.jpg'）")
+    parser.add_argument('--mode', choices=['fall', 'detect'], default='fall',
+                        help="fall: main.py 的跟踪 + 跌倒判定；detect: main2.py 的人物检测")
+    parser.add_argument('--backend', default='pytorch')
+    parser.add_argument('--size', default='l', help="模型大小 n/s/m/l")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--precision', default='fp32')
+    parser.add_argument('--cascade', metavar='POSE_SIZE',
+                        help="两级检测：--size / --imgsz 为第一级检测模型，这里指定第二级姿态模型大小")
+    parser.add_argument('--pose-imgsz', type=int, default=256)
+    parser.add_argument('--frames', type=int, help="最多处理的帧数")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--output', help="将 JSON 报告写入文件")
+    args = parser.parse_args()
+
+    app_path = os.path.dirname(os.path.abspath(__file__))
+    cascade = None
+    if args.cascade:
+        pose_model = load_model(os.path.join(app_path, model_filename(args.cascade, 'pose')), args.backend,
+                                args.pose_imgsz, args.precision, warmup_runs=args.warmup, task='pose')
+        cascade = PoseCascade(pose_model)
+    # 不用两级检测时，跌倒判定需要姿态模型直接输出关键点
+    task = 'pose' if args.mode == 'fall' and cascade is None else 'detect'
+    model = load_model(os.path.join(app_path, model_filename(args.size, task)),
+                       args.backend, args.imgsz, args.precision, warmup_runs=args.warmup,
+                       task=task if task == 'pose' else None)
+
+    report = run_benchmark(model, args.source, args.mode, args.frames, cascade=cascade)
+    report["model"] = model.describe()
+    report["pose_model"] = cascade.describe() if cascade is not None else None
+    report["platform"] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+    report["timestamp"] = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
@@ -0,0 +1,223 @@
+import json
+import os
+import sys
+import threading
+
+import cv2
+
+# 配置中可用的采集后端名称
+CAPTURE_BACKENDS = {
+    'default': cv2.CAP_ANY,
+    'dshow': cv2.CAP_DSHOW,
+    'msmf': cv2.CAP_MSMF,
+    'v4l2': cv2.CAP_V4L2,
+    'gstreamer': cv2.CAP_GSTREAMER,
+    'ffmpeg': cv2.CAP_FFMPEG
+}
+
+
+# 摄像头缓存文件放在可写目录（打包后为 exe 所在目录）
+def default_cache_path():
+    if hasattr(sys, '_MEIPASS'):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, 'camera_cache.json')
+
+
+# 摄像头索引在各平台上依次尝试的后端
+def platform_backends():
+    if sys.platform.startswith('win'):
+        return ['default', 'dshow']
+    if sys.platform.startswith('linux'):
+        return ['v4l2', 'default']
+    return ['default']
+
+
+# 根据视频源类型选择后端：GStreamer 管道 / 网络流 / 文件 / 摄像头索引
+def resolve_backend(source, backend='auto'):
+    if backend != 'auto':
+        return backend
+    if isinstance(source, str):
+        if '!' in source:
+            return 'gstreamer'
+        if '://' in source:
+            return 'ffmpeg'
+        return 'default'
+    return platform_backends()[0]
+
+
+def load_cached_device(cache_path=None):
+    try:
+        with open(cache_path or default_cache_path(), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached['index'], cached['backend']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_cached_device(index, backend, cache_path=None):
+    try:
+        with open(cache_path or default_cache_path(), 'w', encoding='utf-8') as f:
+            json.dump({'index': index, 'backend': backend}, f)
+    except OSError as e:
+        print(f"保存摄像头缓存失败: {e}")
+
+
+# 预分配的帧缓冲区环：read() 直接解码到复用的 NumPy 数组里，不再每帧分配新内存
+# 返回的帧在之后 size - 1 次读取内保持有效；exclude 中的缓冲区（仍被使用者持有）会被跳过
+class FrameRing:
+    def __init__(self, size=4):
+        self.buffers = [None] * max(2, size)
+        self._index = 0
+
+    def next(self, exclude=()):
+        for _ in range(len(self.buffers)):
+            index = self._index
+            self._index = (index + 1) % len(self.buffers)
+            buf = self.buffers[index]
+            if buf is None or not any(buf is held for held in exclude):
+                return index, buf
+        raise RuntimeError("帧缓冲区全部被占用，请增大 ring_size")
+
+    def store(self, index, frame):
+        self.buffers[index] = frame
+
+
+# 视频采集：缓冲区只保留 1 帧避免画面滞后，帧解码到复用缓冲区，
+# 摄像头 / 网络流断开时自动重连（退避重试，reconnect_delay 为 None 时不重连），文件读完时 read() 返回 False
+class Capture:
+    def __init__(self, source, backend='auto', ring_size=4, mjpeg=True, width=None, height=None, fps=None,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.source = source
+        self.backend = resolve_backend(source, backend)
+        self.mjpeg = mjpeg
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ring = FrameRing(ring_size)
+        self.cap = None
+        self.frame_shape = None  # 打开时读到的第一帧的尺寸
+        self.frames = 0
+        self.reconnects = 0
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_file(self):
+        return isinstance(self.source, str) and '://' not in self.source and '!' not in self.source
+
+    def _create(self):
+        api = CAPTURE_BACKENDS.get(self.backend, cv2.CAP_ANY)
+        if self.backend == 'ffmpeg':
+            # RTSP 默认走 TCP，避免 UDP 丢包花屏；并尽量使用硬件解码
+            os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', 'rtsp_transport;tcp')
+            if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+                return cv2.VideoCapture(self.source, api,
+                                        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        return cv2.VideoCapture(self.source, api)
+
+    def _configure(self, cap):
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if isinstance(self.source, int):
+            # USB 摄像头用 MJPEG 传输，高分辨率下帧率不受 USB 带宽限制
+            if self.mjpeg:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            if self.width:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            if self.height:
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+            if self.fps:
+                cap.set(cv2.CAP_PROP_FPS, self.fps)
+
+    # 打开视频源并读取一帧验证，失败返回 False
+    def open(self):
+        cap = self._create()
+        if not cap.isOpened():
+            cap.release()
+            return False
+        self._configure(cap)
+        self.cap = cap
+        success, frame = self._read_into_ring()
+        if success:
+            self.frame_shape = frame.shape
+        else:
+            cap.release()
+            self.cap = None
+        return success
+
+    def isOpened(self):
+        return not self._closed.is_set() and self.cap is not None
+
+    def _read_into_ring(self, exclude=()):
+        index, buf = self.ring.next(exclude)
+        success, frame = self.cap.read(buf) if buf is not None else self.cap.read()
+        if success and frame is not buf:
+            self.ring.store(index, frame)  # 首次读取或分辨率变化时才分配
+        return success, frame
+
+    # 读取下一帧；断流时阻塞重连，直到成功或 release()
+    # exclude: 调用方仍在使用、不能被覆盖的帧
+    def read(self, exclude=()):
+        with self._lock:
+            while not self._closed.is_set() and self.cap is not None:
+                success, frame = self._read_into_ring(exclude)
+                if success:
+                    self.frames += 1
+                    return True, frame
+                if self.is_file or self.reconnect_delay is None or not self._reconnect():
+                    break
+            return False, None
+
+    def _reconnect(self):
+        print(f"视频源 {self.source} 断开，正在重连...")
+        self.cap.release()
+        delay = self.reconnect_delay
+        while not self._closed.wait(delay):
+            if self.open():
+                self.reconnects += 1
+                print(f"视频源 {self.source} 已重连")
+                return True
+            delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+    def release(self):
+        self._closed.set()
+        with self._lock:
+            if self.cap is not None:
+                self.cap.release()
+
+    def get(self, prop):
+        return self.cap.get(prop) if self.cap is not None else 0
+
+    def snapshot(self):
+        return {
+            "source": str(self.source),
+            "backend": self.backend,
+            "frames": self.frames,
+            "reconnects": self.reconnects
+        }
+
+
+# 按索引查找可用摄像头：优先尝试上次成功的设备和后端，成功后写入缓存
+# 返回已打开的 Capture，全部失败时返回 None
+def open_camera(camera_indices, backend='auto', cache_path=None, **options):
+    backends = platform_backends() if backend == 'auto' else [backend]
+    candidates = [(index, name) for index in camera_indices for name in backends]
+    cached = load_cached_device(cache_path)
+    if cached is not None and cached[0] in camera_indices and cached[1] in backends:
+        if cached in candidates:
+            candidates.remove(cached)
+        candidates.insert(0, cached)
+
+    for index, name in candidates:
+        print(f"尝试打开摄像头 {index} ({name} 后端)...")
+        capture = Capture(index, name, **options)
+        if capture.open():
+            print(f"成功! 使用摄像头 {index} ({name} 后端)")
+            if cached != (index, name):
+                save_cached_device(index, name, cache_path)
+            return capture
+    return None
@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+
+from pipeline import StageStats
+from postprocess import extract_persons, offset_persons
+
+
+# 两组框 (N, 4) / (M, 4) 之间的 IoU 矩阵 (N, M)
+def box_iou(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(np.clip(a[:, 2:] - a[:, :2], 0, None), axis=1)
+    area_b = np.prod(np.clip(b[:, 2:] - b[:, :2], 0, None), axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+# 两级检测的第二级：第一级的小模型（如 yolo11n）低分辨率检测整幅画面找到人，
+# 这里只把每个人的裁剪图合并成一个 batch 送入姿态模型，关键点映射回整幅画面后填入第一级的检测结果。
+# 画面中没人时完全不调用姿态模型；框和跟踪编号仍以第一级为准，姿态模型只提供关键点
+class PoseCascade:
+    def __init__(self, pose_model, padding=0.15, min_size=16, match_iou=0.3):
+        self.pose_model = pose_model
+        self.padding = padding      # 裁剪时人框四周扩展的比例，给姿态模型留出上下文
+        self.min_size = min_size    # 短边小于该像素数的人框太小，不做姿态估计
+        self.match_iou = match_iou  # 裁剪图中的姿态框与第一级人框的最小 IoU
+        self.stats = StageStats()
+        self.crops = 0
+        self.matched = 0
+
+    # 人框扩展后裁剪，返回 [(人员下标, (x1, y1, x2, y2)), ...]
+    def plan(self, frame, persons):
+        h, w = frame.shape[:2]
+        regions = []
+        for i, (x1, y1, x2, y2) in enumerate(persons['xyxy'].tolist()):
+            bw, bh = x2 - x1, y2 - y1
+            if min(bw, bh) < self.min_size:
+                continue
+            dx, dy = bw * self.padding, bh * self.padding
+            regions.append((i, (int(max(0, x1 - dx)), int(max(0, y1 - dy)),
+                                int(min(w, x2 + dx)), int(min(h, y2 + dy)))))
+        return regions
+
+    # items: [(画面, 人员数组), ...]，可以来自多路摄像头；关键点原地写入各人员数组，返回裁剪图数量
+    def estimate(self, items):
+        jobs = []
+        crops = []
+        for frame, persons in items:
+            if len(persons) == 0:
+                continue
+            for i, (x1, y1, x2, y2) in self.plan(frame, persons):
+                jobs.append((persons, i, x1, y1))
+                crops.append(np.ascontiguousarray(frame[y1:y2, x1:x2]))
+        if not crops:
+            return 0
+
+        start = time.monotonic()
+        # PyTorch 所有裁剪图一次推理；ONNX / OpenVINO 由 InferenceModel 按导出的 batch 分组
+        results = self.pose_model(crops, verbose=False)
+
+        for (persons, i, x1, y1), r in zip(jobs, results):
+            poses = offset_persons(extract_persons(r), x1, y1)
+            if len(poses) == 0:
+                continue
+            # 裁剪图中可能有相邻的人，取与第一级人框重合最多的那个
+            iou = box_iou(persons['xyxy'][i:i + 1], poses['xyxy'])[0]
+            best = int(iou.argmax())
+            if iou[best] < self.match_iou:
+                continue
+            persons['keypoints'][i] = poses['keypoints'][best]
+            persons['vertical_dist'][i] = poses['vertical_dist'][best]
+            self.matched += 1
+
+        self.crops += len(crops)
+        self.stats.record(time.monotonic() - start)
+        return len(crops)
+
+    def describe(self):
+        return dict(self.pose_model.describe(), padding=self.padding)
+
+    def snapshot(self):
+        return dict(self.stats.snapshot(), crops=self.crops, matched=self.matched)
@@ -0,0 +1,300 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frame_stats (
+    camera TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    avg_person_count REAL NOT NULL,
+    max_person_count INTEGER NOT NULL,
+    PRIMARY KEY (camera, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS hourly_stats (
+    camera TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    person_seconds INTEGER NOT NULL,
+    person_sum REAL NOT NULL,
+    max_person_count INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    PRIMARY KEY (camera, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    event_type TEXT NOT NULL,
+    track_id INTEGER,
+    person_count INTEGER,
+    snapshot TEXT,
+    clip TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events (camera, ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events (event_type, ts);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+"""
+
+EVENT_COLUMNS = ('id', 'camera', 'ts', 'event_type', 'track_id', 'person_count', 'snapshot', 'clip', 'detail')
+
+DEFAULT_CAMERA = 'default'
+
+
+# 时间参数：Unix 时间戳或 ISO 格式字符串（如 2024-05-01T08:00），None 原样返回
+def parse_time(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def format_time(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+
+# 单路摄像头当前这一秒的聚合
+class _SecondAggregate:
+    def __init__(self, second):
+        self.second = second
+        self.frames = 0
+        self.person_sum = 0
+        self.max_person_count = 0
+
+
+# 检测历史的 SQLite 存储
+# - 逐帧人数在内存中按秒聚合，每路每秒只写一行，同时累加到按小时的汇总表
+# - 离散事件（出现人员、跌倒、发送报警）单独成表，按摄像头 / 类型 / 时间建索引
+# - 视频线程只往内存列表追加，后台线程每 flush_interval 秒用一个事务批量写入
+# 按小时统计直接读汇总表，事件列表用 id 游标分页，数月的数据也能在毫秒级返回
+class EventStore:
+    def __init__(self, db_path, flush_interval=1.0, max_pending=100000):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.written_seconds = 0
+        self.written_events = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self._seconds = {}        # 摄像头 -> 当前这一秒的聚合
+        self._pending_seconds = deque()
+        self._pending_events = deque()
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._read_conn = self._connect(check_same_thread=False)
+        self._read_lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._writer_loop, name="event-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # ---------- 写入（视频线程调用，只操作内存） ----------
+
+    def record_frame(self, camera, person_count, now=None):
+        if now is None:
+            now = time.time()
+        camera = camera or DEFAULT_CAMERA
+        second = int(now)
+        with self._lock:
+            agg = self._seconds.get(camera)
+            if agg is None or agg.second != second:
+                if agg is not None:
+                    self._append(self._pending_seconds, (camera, agg))
+                agg = self._seconds[camera] = _SecondAggregate(second)
+            agg.frames += 1
+            agg.person_sum += person_count
+            agg.max_person_count = max(agg.max_person_count, person_count)
+
+    def record_event(self, camera, event_type, track_id=None, person_count=None,
+                     snapshot=None, clip=None, detail=None, now=None):
+        if now is None:
+            now = time.time()
+        row = (camera or DEFAULT_CAMERA, now, event_type, track_id, person_count, snapshot, clip,
+               json.dumps(detail, ensure_ascii=False) if detail is not None else None)
+        with self._lock:
+            self._append(self._pending_events, row)
+
+    # 写盘长时间跟不上时丢弃最旧的记录，内存占用有上限
+    def _append(self, pending, item):
+        if len(pending) >= self.max_pending:
+            pending.popleft()
+            self.dropped += 1
+        pending.append(item)
+
+    # ---------- 后台批量写入 ----------
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while not self._stop_event.wait(self.flush_interval):
+            self._flush(conn)
+        self._flush(conn, final=True)
+        conn.close()
+
+    def _flush(self, conn, final=False):
+        with self._lock:
+            if final:
+                # 退出时把尚未结束的这一秒也写入
+                self._pending_seconds.extend(self._seconds.items())
+                self._seconds = {}
+            seconds, self._pending_seconds = self._pending_seconds, deque()
+            events, self._pending_events = self._pending_events, deque()
+        if not seconds and not events:
+            return
+
+        start = time.perf_counter()
+        try:
+            with conn:
+                if seconds:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO frame_stats VALUES (?, ?, ?, ?, ?)",
+                        [(camera, agg.second, agg.frames, agg.person_sum / agg.frames, agg.max_person_count)
+                         for camera, agg in seconds])
+                    conn.executemany(
+                        "INSERT INTO hourly_stats VALUES (?, ?, 1, ?, ?, ?, ?) "
+                        "ON CONFLICT (camera, hour) DO UPDATE SET "
+                        "seconds = seconds + 1, "
+                        "person_seconds = person_seconds + excluded.person_seconds, "
+                        "person_sum = person_sum + excluded.person_sum, "
+                        "max_person_count = MAX(max_person_count, excluded.max_person_count), "
+                        "frames = frames + excluded.frames",
+                        [(camera, agg.second - agg.second % 3600, int(agg.max_person_count > 0),
+                          agg.person_sum / agg.frames, agg.max_person_count, agg.frames)
+                         for camera, agg in seconds])
+                if events:
+                    conn.executemany(
+                        "INSERT INTO events (camera, ts, event_type, track_id, person_count, snapshot, clip, detail) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", events)
+        except sqlite3.Error as e:
+            print(f"写入事件数据库失败: {e}")
+            return
+        self.written_seconds += len(seconds)
+        self.written_events += len(events)
+        self.flushes += 1
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join(timeout=10)
+        with self._read_lock:
+            self._read_conn.close()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "db_path": self.db_path,
+                "pending_seconds": len(self._pending_seconds),
+                "pending_events": len(self._pending_events),
+                "written_seconds": self.written_seconds,
+                "written_events": self.written_events,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "last_flush_ms": self.last_flush_ms
+            }
+
+    # ---------- 查询（HTTP 接口调用） ----------
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _filters(camera=None, start=None, end=None, column='ts'):
+        clauses, params = [], []
+        if camera:
+            clauses.append("camera = ?")
+            params.append(camera)
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} < ?")
+            params.append(end)
+        return clauses, params
+
+    @staticmethod
+    def _event_dict(row):
+        event = dict(zip(EVENT_COLUMNS, row))
+        event["time"] = format_time(event["ts"])
+        event["detail"] = json.loads(event["detail"]) if event["detail"] else None
+        return event
+
+    # 按时间倒序分页：下一页把返回的 next_before_id 作为 before_id 传入
+    def query_events(self, camera=None, event_type=None, start=None, end=None, limit=50, before_id=None):
+        clauses, params = self._filters(camera, start, end)
+        if event_type:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        if before_id is not None:
+            # 游标：排在 before_id 这条事件之后的记录，可以直接沿 (camera, ts) 索引倒序扫描
+            clauses.append("(ts, id) < (SELECT ts, id FROM events WHERE id = ?)")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(f"SELECT {', '.join(EVENT_COLUMNS)} FROM events {where} "
+                           f"ORDER BY ts DESC, id DESC LIMIT ?", params + [limit])
+        events = [self._event_dict(row) for row in rows]
+        return {
+            "events": events,
+            "next_before_id": events[-1]["id"] if len(events) == limit else None
+        }
+
+    def get_event(self, event_id):
+        rows = self._query(f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE id = ?", (event_id,))
+        return self._event_dict(rows[0]) if rows else None
+
+    # 每小时统计：有人的秒数、平均 / 最大人数，以及各类事件数量
+    def hourly_counts(self, camera=None, start=None, end=None):
+        clauses, params = self._filters(camera, start - start % 3600 if start is not None else None, end,
+                                        column='hour')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        hours = {}
+        for hour, seconds, person_seconds, person_sum, max_count, frames in self._query(
+                "SELECT hour, SUM(seconds), SUM(person_seconds), SUM(person_sum), MAX(max_person_count), "
+                f"SUM(frames) FROM hourly_stats {where} GROUP BY hour ORDER BY hour", params):
+            hours[hour] = {
+                "hour": hour,
+                "time": format_time(hour),
+                "seconds": seconds,
+                "person_seconds": person_seconds,
+                "avg_person_count": round(person_sum / seconds, 3) if seconds else 0.0,
+                "max_person_count": max_count,
+                "frames": frames,
+                "events": {}
+            }
+
+        clauses, params = self._filters(camera, start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        for hour, event_type, count in self._query(
+                "SELECT CAST(ts / 3600 AS INTEGER) * 3600 AS hour, event_type, COUNT(*) "
+                f"FROM events {where} GROUP BY hour, event_type", params):
+            entry = hours.setdefault(hour, {"hour": hour, "time": format_time(hour), "seconds": 0,
+                                            "person_seconds": 0, "avg_person_count": 0.0,
+                                            "max_person_count": 0, "frames": 0, "events": {}})
+            entry["events"][event_type] = count
+        return [hours[hour] for hour in sorted(hours)]
+
+    # 逐秒人数记录，用于绘制时间段内的人数曲线
+    def frame_stats(self, camera=None, start=None, end=None, limit=3600):
+        clauses, params = self._filters(camera or DEFAULT_CAMERA, start, end)
+        rows = self._query("SELECT ts, frames, avg_person_count, max_person_count FROM frame_stats "
+                           f"WHERE {' AND '.join(clauses)} ORDER BY ts LIMIT ?", params + [limit])
+        return [{"ts": ts, "frames": frames, "avg_person_count": round(avg, 3), "max_person_count": max_count}
+                for ts, frames, avg, max_count in rows]
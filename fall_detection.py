@@ -0,0 +1,250 @@
+import time
+
+import numpy as np
+
+# 跌倒状态：站立 -> 正在跌倒 -> 倒地 -> 已起身
+STANDING, FALLING, ON_GROUND, RECOVERED = 0, 1, 2, 3
+STATE_NAMES = {
+    STANDING: 'standing',
+    FALLING: 'falling',
+    ON_GROUND: 'on_ground',
+    RECOVERED: 'recovered'
+}
+
+# COCO 17 关键点中的肩膀和髋部编号
+SHOULDERS = [5, 6]
+HIPS = [11, 12]
+
+
+# 基于跟踪 ID 的时序跌倒检测
+# 每个跟踪目标一个环形缓冲区，记录最近的躯干角度、髋部高度和时间戳；
+# 所有人的特征、速度和状态转移都用 NumPy 一次性向量化计算，每帧开销在亚毫秒级，相对推理可忽略。
+# 相比单帧的长宽比判定，弯腰、坐下不会误报，同一次跌倒也不会每帧重复触发。
+class FallDetector:
+    def __init__(self, history=30, capacity=16, keypoint_conf=0.3,
+                 lying_angle=60.0, angle_velocity=120.0, hip_drop_rate=1.0, velocity_window=0.5,
+                 on_ground_seconds=1.0, falling_timeout=2.0, slow_fall_seconds=3.0,
+                 recover_seconds=1.5, reset_seconds=5.0, evict_after=2.0):
+        self.history = history
+        self.keypoint_conf = keypoint_conf
+        self.lying_angle = lying_angle            # 躯干与竖直方向夹角超过该值视为躺着（度）
+        self.angle_velocity = angle_velocity      # 躯干角速度阈值（度/秒）
+        self.hip_drop_rate = hip_drop_rate        # 髋部下落速度阈值（身高/秒）
+        self.velocity_window = velocity_window    # 计算速度时回看的时间窗口（秒）
+        self.on_ground_seconds = on_ground_seconds  # 跌倒动作后持续躺着多久确认为倒地
+        self.falling_timeout = falling_timeout    # 跌倒动作后这么久仍未躺下则视为误报
+        self.slow_fall_seconds = slow_fall_seconds  # 没有明显速度但持续躺着多久视为倒地
+        self.recover_seconds = recover_seconds
+        self.reset_seconds = reset_seconds
+        self.evict_after = evict_after
+
+        self._slots = {}  # 跟踪 ID -> 缓冲区行号
+        self._free = []
+        self.capacity = 0
+        self._resize(capacity)
+
+    def _resize(self, capacity):
+        old = self.capacity
+        h = self.history
+
+        def grow(name, shape, fill, dtype):
+            arr = np.full(shape, fill, dtype=dtype)
+            if old:
+                arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+
+        grow('times', (capacity, h), -np.inf, np.float64)
+        grow('angles', (capacity, h), 0.0, np.float32)
+        grow('hips', (capacity, h), 0.0, np.float32)
+        grow('head', (capacity,), 0, np.intp)
+        grow('ref_height', (capacity,), 0.0, np.float32)
+        grow('state', (capacity,), STANDING, np.int8)
+        grow('state_since', (capacity,), 0.0, np.float64)
+        grow('lying_since', (capacity,), np.nan, np.float64)
+        grow('upright_since', (capacity,), np.nan, np.float64)
+        grow('last_seen', (capacity,), 0.0, np.float64)
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def _reset_slot(self, slot):
+        self.times[slot] = -np.inf
+        self.head[slot] = 0
+        self.ref_height[slot] = 0
+        self.state[slot] = STANDING
+        self.lying_since[slot] = np.nan
+        self.upright_since[slot] = np.nan
+
+    def _slot_for(self, track_id, now):
+        slot = self._slots.get(track_id)
+        if slot is None:
+            if not self._free:
+                self._resize(self.capacity * 2)
+            slot = self._free.pop()
+            self._reset_slot(slot)
+            self.state_since[slot] = now
+            self._slots[track_id] = slot
+        return slot
+
+    # 本帧没有被跟踪的人（空画面或跟踪器还没分配编号）时调用，让离开画面的目标照常过期
+    def expire(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        self._evict(now)
+
+    # 清除长时间未出现的跟踪目标，释放缓冲区
+    def _evict(self, now):
+        stale = [tid for tid, slot in self._slots.items() if now - self.last_seen[slot] > self.evict_after]
+        for tid in stale:
+            self._free.append(self._slots.pop(tid))
+
+    # 清除所有跟踪目标的历史，跟踪器编号重新分配（如换了检测模型）时调用
+    def reset(self):
+        self._free.extend(self._slots.values())
+        self._slots.clear()
+
+    # 输入当前帧所有被跟踪的人，返回每个人的状态编号数组（与输入顺序一致）
+    # boxes: (N, 4) xywh；keypoints: (N, 17, 3) 或 None（普通检测模型）
+    def update(self, track_ids, boxes, keypoints=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        n = len(track_ids)
+        if n == 0:
+            self._evict(now)
+            return np.zeros(0, dtype=np.int8)
+
+        slots = np.fromiter((self._slot_for(tid, now) for tid in track_ids), dtype=np.intp, count=n)
+        rows = np.arange(n)
+        boxes = np.asarray(boxes, dtype=np.float32)
+        w = boxes[:, 2]
+        h = np.maximum(boxes[:, 3], 1.0)
+
+        # --- 特征：躯干角度（0 为直立，90 为水平）和髋部高度 ---
+        box_angle = np.degrees(np.arctan2(w, h))
+        if keypoints is not None and len(keypoints) == n:
+            kpts = np.asarray(keypoints, dtype=np.float32)
+            shoulders = kpts[:, SHOULDERS]
+            hips = kpts[:, HIPS]
+            valid = (shoulders[:, :, 2].min(axis=1) >= self.keypoint_conf) & \
+                    (hips[:, :, 2].min(axis=1) >= self.keypoint_conf)
+            hip_mid = hips[:, :, :2].mean(axis=1)
+            torso = shoulders[:, :, :2].mean(axis=1) - hip_mid
+            torso_angle = np.degrees(np.arctan2(np.abs(torso[:, 0]), -torso[:, 1]))
+            angle = np.where(valid, torso_angle, box_angle)
+            hip_y = np.where(valid, hip_mid[:, 1], boxes[:, 1])
+        else:
+            angle = box_angle
+            hip_y = boxes[:, 1]
+
+        # 参考身高：新目标取当前框高，之后只在直立时平滑更新
+        ref = self.ref_height[slots]
+        ref = np.where(ref <= 0, h, np.where(angle < 30, 0.9 * ref + 0.1 * h, ref))
+        self.ref_height[slots] = ref
+
+        # --- 速度：与 velocity_window 内最早的一帧比较，窗口内无历史时用上一帧 ---
+        times = self.times[slots]
+        in_window = times >= now - self.velocity_window
+        ref_idx = np.where(in_window.any(axis=1),
+                           np.where(in_window, times, np.inf).argmin(axis=1),
+                           times.argmax(axis=1))
+        t_ref = times[rows, ref_idx]
+        has_ref = np.isfinite(t_ref) & (t_ref < now)
+        dt = np.where(has_ref, now - t_ref, 1.0)
+        angle_vel = np.where(has_ref, (angle - self.angles[slots, ref_idx]) / dt, 0.0)
+        hip_rate = np.where(has_ref, (hip_y - self.hips[slots, ref_idx]) / (dt * ref), 0.0)
+
+        # 写入环形缓冲区
+        head = self.head[slots]
+        self.times[slots, head] = now
+        self.angles[slots, head] = angle
+        self.hips[slots, head] = hip_y
+        self.head[slots] = (head + 1) % self.history
+        self.last_seen[slots] = now
+
+        # --- 躺倒 / 直立的持续时间 ---
+        lying = (angle >= self.lying_angle) | (w / h > 1.2)
+        lying_since = self.lying_since[slots]
+        lying_since = np.where(lying, np.where(np.isnan(lying_since), now, lying_since), np.nan)
+        upright_since = self.upright_since[slots]
+        upright_since = np.where(~lying, np.where(np.isnan(upright_since), now, upright_since), np.nan)
+        self.lying_since[slots] = lying_since
+        self.upright_since[slots] = upright_since
+        lying_time = np.where(lying, now - lying_since, 0.0)
+        upright_time = np.where(~lying, now - upright_since, 0.0)
+
+        # --- 状态机 ---
+        state = self.state[slots]
+        in_state = now - self.state_since[slots]
+        sudden = (angle_vel >= self.angle_velocity) | (hip_rate >= self.hip_drop_rate)
+        upright_states = (state == STANDING) | (state == RECOVERED)
+
+        new_state = state.copy()
+        new_state[upright_states & sudden] = FALLING
+        new_state[upright_states & ~sudden & (lying_time >= self.slow_fall_seconds)] = ON_GROUND
+        falling = state == FALLING
+        new_state[falling & (lying_time >= self.on_ground_seconds)] = ON_GROUND
+        new_state[falling & ~lying & (in_state >= self.falling_timeout)] = STANDING
+        new_state[(state == ON_GROUND) & (upright_time >= self.recover_seconds)] = RECOVERED
+        new_state[(state == RECOVERED) & (upright_time >= self.reset_seconds)] = STANDING
+
+        changed = new_state != state
+        self.state_since[slots[changed]] = now
+        self.state[slots] = new_state
+
+        self._evict(now)
+        return new_state
+
+    def state_of(self, track_id):
+        slot = self._slots.get(track_id)
+        return int(self.state[slot]) if slot is not None else None
+
+    def snapshot(self):
+        slots = list(self._slots.values())
+        states = self.state[slots] if slots else np.zeros(0, dtype=np.int8)
+        return {
+            "tracks": len(slots),
+            "falling": int((states == FALLING).sum()),
+            "on_ground": int((states == ON_GROUND).sum())
+        }
+
+
+# 按跌倒状态分组的标注文字和颜色
+STATE_GROUPS = (
+    (ON_GROUND, "FALL DETECTED!", (0, 0, 255)),  # 红色警告
+    (FALLING, "Falling...", (0, 165, 255)),  # 橙色
+    (RECOVERED, "Recovered", (0, 255, 255)),  # 黄色
+)
+
+
+# 一帧的跌倒判定：所有被跟踪的人一次性更新时序状态，倒地的人交给报警引擎去重，
+# 返回按状态分组的 [(人员数组, 文字, 颜色), ...]（稍后统一画框）和本帧是否有人正在跌倒 / 倒地
+# 跟踪器尚未分配编号（-1）的人不做判定，归为正常；main.py 和 benchmark.py 共用
+# 整帧都没有被跟踪的人时不会调用 update()，需要单独让旧目标过期
+def classify_falls(fall_detector, detections, alert_engine=None, camera=None):
+    groups = []
+    fall_in_frame = False
+    updated = False
+    for persons in detections:
+        if len(persons) == 0:
+            continue
+        states = np.full(len(persons), -1, dtype=np.int8)
+        tracked = persons['track_id'] >= 0
+        if tracked.any():
+            states[tracked] = fall_detector.update(persons['track_id'][tracked],
+                                                   persons['xywh'][tracked],
+                                                   persons['keypoints'][tracked])
+            updated = True
+
+        if alert_engine is not None:
+            for track_id in persons['track_id'][states == ON_GROUND].tolist():
+                alert_engine.observe(camera, track_id, 'fall')
+        fall_in_frame = fall_in_frame or bool(((states == ON_GROUND) | (states == FALLING)).any())
+
+        normal = np.ones(len(persons), dtype=bool)
+        for state, label, color in STATE_GROUPS:
+            mask = states == state
+            groups.append((persons[mask], label, color))
+            normal &= ~mask
+        groups.append((persons[normal], "Normal", (0, 255, 0)))  # 绿色正常
+    if not updated:
+        fall_detector.expire()
+    return groups, fall_in_frame
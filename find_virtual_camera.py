@@ -1,24 +1,49 @@
+import sys
+
 import cv2
 
+from capture import Capture, platform_backends, load_cached_device, save_cached_device
+
+# 用法:
+#   python find_virtual_camera.py        列出所有可用摄像头
+#   python find_virtual_camera.py 1      把摄像头 1 设为首选，main.py / main2.py 启动时优先打开
+if len(sys.argv) > 1:
+    index = int(sys.argv[1])
+    for backend in platform_backends():
+        capture = Capture(index, backend, ring_size=2, reconnect_delay=None)
+        if capture.open():
+            capture.release()
+            save_cached_device(index, backend)
+            print(f"已将摄像头 {index} ({backend} 后端) 设为首选")
+            break
+    else:
+        print(f"摄像头 {index} 无法打开")
+    sys.exit(0)
+
 print("检测所有可用的摄像头...")
 print("=" * 50)
 
+cached = load_cached_device()
+if cached is not None:
+    print(f"当前首选摄像头: {cached[0]} ({cached[1]} 后端)")
+
+backend = platform_backends()[0]
 for i in range(10):
-    cap = cv2.VideoCapture(i)
-    if cap.isOpened():
-        ret, frame = cap.read()
+    capture = Capture(i, backend, ring_size=2, reconnect_delay=None)
+    if capture.open():
+        ret, frame = capture.read()
         if ret:
             print(f"摄像头 {i}: 可用 (分辨率: {frame.shape[1]}x{frame.shape[0]})")
             cv2.imshow(f"Camera {i}", frame)
         else:
             print(f"摄像头 {i}: 设备存在但无法读取")
-        cap.release()
+        capture.release()
     else:
         print(f"摄像头 {i}: 不可用")
 
 print("=" * 50)
 print("查看上面的窗口，找到 OBS 虚拟摄像头的画面")
-print("记住对应的摄像头索引号，然后修改 main.py 中的 camera_indices")
+print("记住对应的摄像头索引号，运行 python find_virtual_camera.py <索引> 设为首选")
 print("按任意键关闭...")
 cv2.waitKey(0)
 cv2.destroyAllWindows()
@@ -0,0 +1,179 @@
+import collections
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 各模型大小的相对计算量（按 YOLO11 检测模型的 GFLOPs），用于给档位排序
+MODEL_COST = {'n': 6.5, 's': 21.5, 'm': 68.0, 'l': 86.9, 'x': 194.9}
+MAX_STREAM_FLOOR = 2
+
+
+# 按当前模型自动生成档位：同一模型依次缩小推理尺寸，大模型再加上 n 模型的各个尺寸，按计算量从高到低排列
+def default_levels(model_size, imgsz):
+    sizes = [model_size] if model_size == 'n' else [model_size, 'n']
+    candidates = set()
+    for size in sizes:
+        for factor in (1.0, 0.75, 0.5):
+            candidates.add((size, max(160, int(imgsz * factor) // 32 * 32)))
+    return sorted(candidates, key=lambda level: MODEL_COST.get(level[0], 100.0) * level[1] ** 2, reverse=True)
+
+
+# 闭环画质调节：按目标帧率和 CPU 预算在预加载的模型档位之间切换
+# - 负载 = 每帧处理耗时 × 目标帧率，超过 1 表示按目标帧率处理不过来
+# - 进程 CPU 占比超过预算时先限速：只按目标帧率处理（due() 返回 False 的帧跳过推理）；
+#   按目标帧率折算后仍超预算才视为过载
+# - 过载立即降一档；连续 upgrade_windows 个统计窗口负载低于 upgrade_load 且已知上一档跟得上才升一档
+# - 刚升档就又过载时，下次升档前的等待时间加倍，避免在两档之间来回切换
+# 档位切换由调用方完成：record() 返回 True 时按 current() 换用对应的模型
+class QualityGovernor:
+    def __init__(self, levels, target_fps=10.0, cpu_budget=0.8, window=2.0, upgrade_load=0.6,
+                 upgrade_windows=3, hold=10.0, max_hold=300.0):
+        # levels: [(模型大小, 推理尺寸), ...]，从高到低；越往后推流画质下限越低
+        self.levels = [{"model": size, "imgsz": imgsz, "stream_floor": min(i, MAX_STREAM_FLOOR)}
+                       for i, (size, imgsz) in enumerate(levels)]
+        self.target_fps = target_fps
+        self.cpu_budget = cpu_budget  # 本进程最多占用整机 CPU 的比例
+        self.window = window
+        self.upgrade_load = upgrade_load
+        self.upgrade_windows = upgrade_windows
+        self.base_hold = hold
+        self.max_hold = max_hold
+
+        self.index = 0
+        self.load = 0.0
+        self.cpu = None
+        self.fps = 0.0
+        self.hold = hold
+        self.throttled = False
+        self.skips = 0
+        self.decisions = collections.deque(maxlen=20)
+        self._cost = {}  # 档位 -> (每帧处理耗时的滑动平均, 测量时间)
+        self._good_windows = 0
+        self._last_change = time.monotonic()
+        self._last_direction = None
+        self._window_start = time.monotonic()
+        self._busy = 0.0
+        self._frames = 0
+        self._last_due = 0.0
+        self._process = psutil.Process() if psutil is not None else None
+        self._cpu_count = (psutil.cpu_count() or 1) if psutil is not None else 1
+        if self._process is not None:
+            self._process.cpu_percent(None)  # 第一次调用只是开始计时
+
+    def current(self):
+        return self.levels[self.index]
+
+    def key(self):
+        level = self.current()
+        return level["model"], level["imgsz"]
+
+    # 本帧是否需要推理：限速时只按目标帧率处理
+    def due(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.throttled and now - self._last_due < 1.0 / self.target_fps:
+            self.skips += 1
+            return False
+        self._last_due = now
+        return True
+
+    # 限速时距离下一次可以推理还有多少秒，多路模式的推理线程据此等待
+    def next_due(self, now=None):
+        if not self.throttled:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._last_due + 1.0 / self.target_fps - now)
+
+    # 每处理完一帧（或多路模式的一个 batch）调用一次，seconds 为本帧的处理耗时；档位变化时返回 True
+    def record(self, seconds):
+        self._busy += seconds
+        self._frames += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return False
+
+        avg = self._busy / self._frames
+        self.load = avg * self.target_fps
+        self.fps = self._frames / elapsed
+        if self._process is not None:
+            self.cpu = self._process.cpu_percent(None) / 100.0 / self._cpu_count
+        previous = self._cost.get(self.index)
+        self._cost[self.index] = (avg if previous is None else 0.7 * previous[0] + 0.3 * avg, now)
+        self._window_start, self._busy, self._frames = now, 0.0, 0
+        return self._decide(now)
+
+    def _decide(self, now):
+        if now - self._last_change > self.max_hold:
+            self.hold = self.base_hold  # 长时间稳定后恢复正常的等待时间
+        # CPU 超预算先限速；限速后占用降到预算一半以下说明不限速也够用，解除限速
+        cpu_over = False
+        if self.cpu is not None:
+            if self.cpu > self.cpu_budget:
+                self.throttled = True
+            elif self.cpu < self.cpu_budget * 0.5:
+                self.throttled = False
+            # 折算到目标帧率下的 CPU 占用
+            projected = self.cpu * min(1.0, self.target_fps / self.fps) if self.fps > 0 else self.cpu
+            cpu_over = projected > self.cpu_budget
+        if self.load > 1.0 or cpu_over:
+            self._good_windows = 0
+            if self.index >= len(self.levels) - 1:
+                return False
+            # 刚升档就过载：这一档跟不上，拉长下次升档前的等待
+            if self._last_direction == 'up' and now - self._last_change < 2 * self.hold:
+                self.hold = min(self.hold * 2, self.max_hold)
+            return self._switch(self.index + 1, now, 'cpu' if cpu_over and self.load <= 1.0 else 'load')
+
+        cpu_ok = self.cpu is None or self.cpu < self.cpu_budget * 0.8
+        if self.load < self.upgrade_load and cpu_ok and self.index > 0:
+            self._good_windows += 1
+        else:
+            self._good_windows = 0
+        if self._good_windows < self.upgrade_windows or now - self._last_change < self.hold:
+            return False
+        # 最近 max_hold 秒内测过上一档的耗时，预计跟不上就不升；更早的测量可能已过时（画面、机器负载变了），重新试
+        cost = self._cost.get(self.index - 1)
+        if cost is not None and now - cost[1] < self.max_hold and cost[0] * self.target_fps > 0.9:
+            return False
+        return self._switch(self.index - 1, now, 'headroom')
+
+    def _switch(self, index, now, reason):
+        before = self.levels[self.index]
+        after = self.levels[index]
+        self._last_direction = 'up' if index < self.index else 'down'
+        self.index = index
+        self._last_change = now
+        self._good_windows = 0
+        self.decisions.append({
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "from": f"{before['model']}@{before['imgsz']}",
+            "to": f"{after['model']}@{after['imgsz']}",
+            "reason": reason,
+            "load": round(self.load, 2),
+            "cpu": round(self.cpu, 2) if self.cpu is not None else None
+        })
+        print(f"画质调节: {before['model']}@{before['imgsz']} -> {after['model']}@{after['imgsz']} "
+              f"（负载 {self.load:.2f}，原因 {reason}）")
+        return True
+
+    def snapshot(self):
+        return {
+            "level": self.index,
+            "current": self.current(),
+            "target_fps": self.target_fps,
+            "cpu_budget": self.cpu_budget,
+            "load": round(self.load, 3),
+            "cpu": round(self.cpu, 3) if self.cpu is not None else None,
+            "fps": round(self.fps, 1),
+            "throttled": self.throttled,
+            "skips": self.skips,
+            "hold_seconds": self.hold,
+            "levels": self.levels,
+            "costs_ms": {i: round(cost * 1000, 1) for i, (cost, _) in sorted(self._cost.items())},
+            "decisions": list(self.decisions)[-5:]
+        }
@@ -0,0 +1,681 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+HTTP_PATHS = ('/', '/snapshot.jpg', '/metrics', '/ready')
+CLIENT_KINDS = ('normal', 'legacy', 'slow', 'churn')
+
+
+# ---------- 被测服务：main2.py + 合成画面 + 替身检测模型，不需要摄像头和模型文件 ----------
+
+# 合成摄像头：固定纹理背景上有几个来回移动的亮色人形方块，按设定帧率出帧
+# 和 capture.Capture 一样轮流复用 ring_size 个缓冲区，长时间运行不会因分配画面而涨内存
+class SyntheticCamera:
+    def __init__(self, width=1280, height=720, fps=15.0, persons=2, ring_size=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.persons = persons
+        # 带噪声的背景，JPEG 体积接近真实画面；亮度低于替身模型的检测阈值
+        self.background = rng.integers(40, 140, (height, width, 3), dtype=np.uint8)
+        self.background = cv2.GaussianBlur(self.background, (5, 5), 0)
+        self.ring = [np.empty_like(self.background) for _ in range(max(3, ring_size))]
+        self.frames = 0
+        self._opened = True
+        self._next = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, exclude=()):
+        if not self._opened:
+            return False, None
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next + self.frame_interval, time.monotonic() - self.frame_interval)
+        # 和 Capture 一样跳过调用方仍持有的缓冲区
+        for offset in range(len(self.ring)):
+            frame = self.ring[(self.frames + offset) % len(self.ring)]
+            if not any(frame is held for held in exclude):
+                break
+        else:
+            raise RuntimeError("帧缓冲区全部被占用，请增大 ring_size")
+        np.copyto(frame, self.background)
+        t = self.frames * self.frame_interval
+        pw, ph = self.width // 12, self.height // 3
+        for i in range(self.persons):
+            phase = (t * (0.2 + 0.1 * i) + i / max(self.persons, 1)) % 1.0
+            x = int((self.width - pw) * abs(2 * phase - 1))
+            y = self.height // 2 - ph // 2 + (i % 2) * self.height // 8
+            cv2.rectangle(frame, (x, y), (x + pw, y + ph), (230, 230, 230), -1)
+        self.frames += 1
+        return True, frame
+
+    def release(self):
+        self._opened = False
+
+    def snapshot(self):
+        return {"source": "synthetic", "backend": None, "frames": self.frames, "reconnects": 0}
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class _Result:
+    def __init__(self, data):
+        self.boxes = _Boxes(data)
+        self.keypoints = None
+
+
+# 替身检测模型：接口同 backends.InferenceModel，按亮度阈值找出合成画面中的人形方块，
+# 每次调用固定等待 cost_ms 模拟推理耗时（等待期间释放 GIL，与真实推理一致）
+class StandInModel:
+    def __init__(self, imgsz=640, cost_ms=30.0):
+        self.backend = 'pytorch'
+        self.imgsz = imgsz
+        self.precision = 'fp32'
+        self.path = 'stand-in'
+        self.cost = cost_ms / 1000.0
+
+    def __call__(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        if self.cost:
+            time.sleep(self.cost)
+        return [_Result(self._detect(image)) for image in images]
+
+    def track(self, source, **kwargs):
+        return self(source, **kwargs)
+
+    def _detect(self, image):
+        small = cv2.resize(image, (image.shape[1] // 4, image.shape[0] // 4), interpolation=cv2.INTER_NEAREST)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = [cv2.boundingRect(c) for c in contours]
+        data = np.array([[x * 4, y * 4, (x + w) * 4, (y + h) * 4, 0.9, 0] for x, y, w, h in boxes if w * h >= 16],
+                        dtype=np.float32).reshape(-1, 6)
+        return data
+
+    def warmup(self, runs=1):
+        pass
+
+    def describe(self):
+        return {"backend": "stand-in", "model": self.path, "imgsz": self.imgsz, "precision": self.precision}
+
+
+SERVE_CONFIG = """\
+camera_sources = []
+worker_processes = 0
+headless = True
+pipeline_mode = 'pipeline'
+governor_enabled = False
+motion_gate_enabled = False
+clip_recording_enabled = {record}
+clip_quota_mb = 100
+clip_path = {clips!r}
+screenshot_path = {screenshots!r}
+event_db_path = {events!r}
+"""
+
+
+# --serve：在本进程中运行 main2.py，摄像头和模型替换为合成画面和替身模型
+# 运行时配置写到工作目录下的 config.py，放在 sys.path 最前面，不读取程序目录中的正式配置
+def serve(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='loadtest_')
+    os.makedirs(workdir, exist_ok=True)
+    with open(os.path.join(workdir, 'config.py'), 'w', encoding='utf-8') as f:
+        f.write(SERVE_CONFIG.format(record=not args.no_record,
+                                    clips=os.path.join(workdir, 'clips'),
+                                    screenshots=os.path.join(workdir, 'screenshots'),
+                                    events=os.path.join(workdir, 'events.db')))
+    sys.path.insert(0, workdir)
+
+    # main2 用 from ... import 取得这两个函数，必须在导入 main2 之前替换
+    import backends
+    import capture
+    def load_stand_in(pt_path, backend='pytorch', imgsz=640, *rest, **kwargs):
+        return StandInModel(imgsz, args.detect_ms)
+
+    backends.load_model = load_stand_in
+    capture.open_camera = lambda *a, ring_size=3, **k: SyntheticCamera(args.width, args.height, args.fps,
+                                                                       args.persons, ring_size)
+
+    import uvicorn
+    import main2
+    main2.server = uvicorn.Server(uvicorn.Config(main2.app, host=args.host, port=args.port, log_level='warning'))
+    main2.server.run()
+
+
+# ---------- 统计 ----------
+
+# 对数分桶的延迟直方图（毫秒），内存占用固定，适合跑几天的长稳测试
+class LatencyHistogram:
+    def __init__(self, low=0.5, high=60000.0, factor=1.1):
+        self.low = low
+        self.factor = factor
+        self.counts = [0] * (int(math.log(high / low, factor)) + 2)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        ms = max(ms, 0.0)
+        index = 0 if ms <= self.low else min(int(math.log(ms / self.low, self.factor)) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        if not self.total:
+            return None
+        target = q / 100 * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return round(min(self.low * self.factor ** index, self.max), 2)
+        return round(self.max, 2)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 2) if self.total else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.max, 2)
+        }
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+# 每类客户端的统计：推送延迟，以及每次连接结束时记下的该连接平均帧率
+# 慢客户端的帧在自己的接收缓冲区里排队，延迟本来就高，单独统计
+class KindStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.connections = 0
+        self.active = 0
+        self.frames = 0
+        self.bytes = 0
+        self.errors = 0
+        self.server_closed = 0
+        self.fps = []
+
+    def summary(self):
+        return {
+            "connections": self.connections,
+            "frames": self.frames,
+            "megabytes": round(self.bytes / 1e6, 1),
+            "errors": self.errors,
+            "server_closed": self.server_closed,
+            "fps_p5": percentile(self.fps, 5),
+            "fps_p50": percentile(self.fps, 50),
+            "fps_mean": round(float(np.mean(self.fps)), 2) if self.fps else None,
+            "latency_ms": self.latency.summary()
+        }
+
+
+# ---------- 负载 ----------
+
+class LoadTest:
+    def __init__(self, args, base_url, server_pid=None):
+        self.args = args
+        self.base_url = base_url.rstrip('/')
+        self.ws_url = 'ws' + self.base_url[len('http'):] + '/ws'
+        self.server = psutil.Process(server_pid) if psutil is not None and server_pid else None
+        self.window_latency = LatencyHistogram()  # 进度输出用（不含慢客户端），每次输出后清零
+        self.kinds = {kind: KindStats() for kind in CLIENT_KINDS}
+        self.http = {path: {"latency": LatencyHistogram(), "errors": 0} for path in HTTP_PATHS}
+        self.samples = []
+        self.running = True
+        self.started = time.monotonic()
+        self._self_process = psutil.Process() if psutil is not None else None
+
+    # 客户端类型按比例分配，同一类型的客户端错开分布在连接顺序中
+    def plan_clients(self):
+        n = self.args.clients
+        counts = {
+            'slow': int(round(n * self.args.slow_ratio)),
+            'churn': int(round(n * self.args.churn_ratio)),
+            'legacy': int(round(n * self.args.legacy_ratio))
+        }
+        counts['normal'] = max(0, n - sum(counts.values()))
+        kinds = [kind for kind, count in counts.items() for _ in range(count)]
+        random.Random(self.args.seed).shuffle(kinds)
+        return kinds
+
+    async def client(self, index, kind, delay):
+        import websockets
+        await asyncio.sleep(delay)
+        rng = random.Random(self.args.seed + index)
+        stats = self.kinds[kind]
+        url = self.ws_url + ('' if kind == 'legacy' else '?format=binary')
+        while self.running:
+            frames = [0]  # 本次连接收到的帧数，连接异常断开时也要用来算帧率
+            connected_at = None
+            try:
+                # 慢客户端的接收队列很小，读得慢时很快就顶到 TCP 缓冲区，服务器能感知到拥塞
+                async with websockets.connect(url, max_size=None, max_queue=2 if kind == 'slow' else 16,
+                                              open_timeout=30) as ws:
+                    stats.connections += 1
+                    stats.active += 1
+                    connected_at = time.monotonic()
+                    lifetime = rng.uniform(1.0, self.args.churn_max) if kind == 'churn' else None
+                    try:
+                        await self._receive(ws, kind, stats, connected_at, lifetime, frames)
+                    finally:
+                        stats.active -= 1
+                    if kind == 'churn' and self.running and rng.random() < 0.5:
+                        # 一半直接断开 TCP，不走关闭握手，模拟断网 / 浏览器崩溃
+                        ws.transport.abort()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self.running:
+                    break
+                if isinstance(e, websockets.exceptions.ConnectionClosed):
+                    stats.server_closed += 1
+                else:
+                    stats.errors += 1
+            finally:
+                if connected_at is not None:
+                    elapsed = time.monotonic() - connected_at
+                    if elapsed >= self.args.min_fps_window:
+                        stats.fps.append(frames[0] / elapsed)
+            if not self.running:
+                break
+            await asyncio.sleep(rng.uniform(0.5, 2.0) if kind == 'churn' else 1.0)
+
+    async def _receive(self, ws, kind, stats, connected_at, lifetime, frames):
+        sent_at = None
+        while self.running:
+            timeout = None
+            if lifetime is not None:
+                timeout = lifetime - (time.monotonic() - connected_at)
+                if timeout <= 0:
+                    break
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout)
+            except asyncio.TimeoutError:
+                break
+            now = time.time()
+            if isinstance(message, str):
+                data = json.loads(message).get("data", {})
+                sent_at = data.get("time")
+                if kind != 'legacy':
+                    continue  # 二进制格式：元数据之后紧跟 JPEG，收到 JPEG 才算一帧
+                stats.bytes += len(message)
+            else:
+                stats.bytes += len(message)
+            frames[0] += 1
+            stats.frames += 1
+            if sent_at is not None:
+                ms = (now - sent_at) * 1000
+                stats.latency.record(ms)
+                if kind != 'slow':
+                    self.window_latency.record(ms)
+            if kind == 'slow':
+                await asyncio.sleep(self.args.slow_delay)
+
+    async def poller(self, index):
+        rng = random.Random(self.args.seed + 10000 + index)
+        await asyncio.sleep(rng.uniform(0, self.args.poll_interval))
+        while self.running:
+            path = HTTP_PATHS[rng.randrange(len(HTTP_PATHS))]
+            start = time.perf_counter()
+            ok = await asyncio.to_thread(self._get, path)
+            entry = self.http[path]
+            if ok:
+                entry["latency"].record((time.perf_counter() - start) * 1000)
+            else:
+                entry["errors"] += 1
+            await asyncio.sleep(self.args.poll_interval)
+
+    def _get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=10) as response:
+                response.read()
+                return True
+        except urllib.error.HTTPError as e:
+            e.read()
+            return path == '/snapshot.jpg' and e.code == 503  # 还没有画面时快照返回 503，属正常
+        except Exception:
+            return False
+
+    def fetch_json(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=10) as response:
+                return json.loads(response.read())
+        except Exception:
+            return None
+
+    # 服务进程的资源占用；压测进程本身的 CPU 一并记下，它跑满时测出的延迟不可信
+    def sample(self, phase):
+        entry = {"t": round(time.monotonic() - self.started, 1), "phase": phase,
+                 "clients": sum(stats.active for stats in self.kinds.values())}
+        if self.server is not None:
+            try:
+                with self.server.oneshot():
+                    entry["cpu"] = round(self.server.cpu_percent(None) / 100.0, 3)
+                    entry["rss_mb"] = round(self.server.memory_info().rss / 2 ** 20, 1)
+                    entry["threads"] = self.server.num_threads()
+                    entry["fds"] = (self.server.num_fds() if hasattr(self.server, 'num_fds')
+                                    else self.server.num_handles())
+            except psutil.Error:
+                entry["server_gone"] = True
+        if self._self_process is not None:
+            entry["harness_cpu"] = round(self._self_process.cpu_percent(None) / 100.0, 3)
+        self.samples.append(entry)
+        return entry
+
+    async def sampler(self, phase_ref):
+        while self.running:
+            await asyncio.sleep(self.args.sample_interval)
+            self.sample(phase_ref[0])
+
+    async def progress(self):
+        last_frames = 0
+        while self.running:
+            await asyncio.sleep(self.args.report_interval)
+            frames = sum(stats.frames for stats in self.kinds.values())
+            latest = self.samples[-1] if self.samples else {}
+            window = self.window_latency.summary()
+            self.window_latency = LatencyHistogram()
+            print(f"[{time.monotonic() - self.started:7.0f}s] 在线 {latest.get('clients', 0):4d}  "
+                  f"收帧 {(frames - last_frames) / self.args.report_interval:7.1f}/s  "
+                  f"延迟 p50 {window['p50']} ms p99 {window['p99']} ms  "
+                  f"服务 CPU {latest.get('cpu')}  RSS {latest.get('rss_mb')} MB  FD {latest.get('fds')}")
+            last_frames = frames
+
+    async def run(self):
+        phase = ['baseline']
+        if self._self_process is not None:
+            self._self_process.cpu_percent(None)
+        if self.server is not None:
+            self.server.cpu_percent(None)
+        await asyncio.sleep(self.args.settle)
+        baseline = self.sample('baseline')
+
+        kinds = self.plan_clients()
+        print(f"开始压测: {len(kinds)} 个 WebSocket 客户端 "
+              f"({', '.join(f'{k} {kinds.count(k)}' for k in CLIENT_KINDS)})，{self.args.pollers} 个 HTTP 轮询，"
+              f"持续 {self.args.duration} 秒")
+        phase[0] = 'load'
+        load_start = time.monotonic()
+        tasks = [asyncio.create_task(self.client(i, kind, self.args.ramp * i / max(len(kinds), 1)))
+                 for i, kind in enumerate(kinds)]
+        tasks += [asyncio.create_task(self.poller(i)) for i in range(self.args.pollers)]
+        helpers = [asyncio.create_task(self.sampler(phase)), asyncio.create_task(self.progress())]
+
+        await asyncio.sleep(self.args.duration)
+        server_state = self.fetch_json('/')
+        load_seconds = time.monotonic() - load_start
+
+        # 所有客户端断开后等一会，再看连接、线程和文件描述符有没有释放
+        self.running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in helpers:
+            task.cancel()
+        await asyncio.gather(*helpers, return_exceptions=True)
+        phase[0] = 'after'
+        await asyncio.sleep(self.args.settle)
+        after = self.sample('after')
+        return self.report(baseline, after, server_state, load_seconds)
+
+    def report(self, baseline, after, server_state, load_seconds):
+        load = [s for s in self.samples if s["phase"] == 'load' and "rss_mb" in s]
+        # 前 10% 为预热（连接建立、缓冲区分配），RSS 增长速度只看之后的部分；时间太短时斜率没有意义
+        steady = load[len(load) // 10:]
+        if steady and steady[-1]["t"] - steady[0]["t"] < 60:
+            steady = []
+        server = {}
+        if load:
+            cpu = [s["cpu"] for s in load]
+            server.update(cpu_mean=round(float(np.mean(cpu)), 3), cpu_max=round(max(cpu), 3),
+                          rss_peak_mb=max(s["rss_mb"] for s in load),
+                          threads_peak=max(s["threads"] for s in load),
+                          fds_peak=max(s["fds"] for s in load))
+        if len(steady) >= 3:
+            t = np.array([s["t"] for s in steady])
+            rss = np.array([s["rss_mb"] for s in steady])
+            server["rss_slope_mb_per_hour"] = round(float(np.polyfit(t, rss, 1)[0]) * 3600, 2)
+        for key in ('rss_mb', 'fds', 'threads'):
+            if key in baseline and key in after:
+                server[f"{key}_baseline"] = baseline[key]
+                server[f"{key}_after"] = after[key]
+        if "fds" in baseline and "fds" in after:
+            server["fd_leak"] = after["fds"] - baseline["fds"]
+        harness = [s["harness_cpu"] for s in load if "harness_cpu" in s]
+
+        # 总体延迟不含慢客户端
+        latency = LatencyHistogram()
+        for kind, stats in self.kinds.items():
+            if kind != 'slow':
+                latency.merge(stats.latency)
+        websocket = (server_state or {}).get("websocket") or {}
+        clients = websocket.get("clients", [])
+        return {
+            "version": git_version(),
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(self.args).items() if k not in ('output', 'compare')},
+            "load_seconds": round(load_seconds, 1),
+            "latency_ms": latency.summary(),
+            "clients": {kind: stats.summary() for kind, stats in self.kinds.items()},
+            "http": {path: dict(entry["latency"].summary(), errors=entry["errors"])
+                     for path, entry in self.http.items()},
+            "server": server,
+            "harness_cpu_mean": round(float(np.mean(harness)), 3) if harness else None,
+            "server_stream": {
+                "connected": websocket.get("count"),
+                "skipped": sum(c.get("skipped", 0) for c in clients),
+                "deferred": sum(c.get("deferred", 0) for c in clients),
+                "levels": {str(level): sum(1 for c in clients if c.get("level") == level)
+                           for level in sorted({c.get("level") for c in clients})},
+                "encoder": (server_state or {}).get("stream")
+            },
+            "samples": self.samples
+        }
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def wait_ready(base_url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"被测服务启动失败，退出码 {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/ready', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("等待被测服务就绪超时")
+
+
+# 启动被测服务子进程，输出写到 server.log
+def start_server(args, workdir):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--workdir', workdir,
+               '--host', '127.0.0.1', '--port', str(args.port), '--fps', str(args.fps),
+               '--width', str(args.width), '--height', str(args.height), '--persons', str(args.persons),
+               '--detect-ms', str(args.detect_ms)]
+    if args.no_record:
+        command.append('--no-record')
+    log = open(os.path.join(workdir, 'server.log'), 'w', encoding='utf-8')
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    return subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env), log
+
+
+def stop_server(process, timeout=30):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"\n推送延迟（不含慢客户端）: p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+          f"最大 {latency['max']} ms（{latency['count']} 帧）")
+    for kind, stats in report["clients"].items():
+        if stats["connections"]:
+            print(f"  {kind:<7} 连接 {stats['connections']:5d}  每客户端帧率 p5 {stats['fps_p5']}  "
+                  f"p50 {stats['fps_p50']}  延迟 p99 {stats['latency_ms']['p99']} ms  "
+                  f"错误 {stats['errors']}  服务端断开 {stats['server_closed']}")
+    for path, stats in report["http"].items():
+        if stats["count"] or stats["errors"]:
+            print(f"  GET {path:<14} {stats['count']:6d} 次  p50 {stats['p50']} ms  p99 {stats['p99']} ms  "
+                  f"失败 {stats['errors']}")
+    server = report["server"]
+    if server:
+        print(f"服务进程: CPU 平均 {server.get('cpu_mean')} 峰值 {server.get('cpu_max')}  "
+              f"RSS {server.get('rss_mb_baseline')} -> {server.get('rss_mb_after')} MB "
+              f"（{server.get('rss_slope_mb_per_hour')} MB/小时）  "
+              f"FD {server.get('fds_baseline')} -> {server.get('fds_after')}  "
+              f"线程 {server.get('threads_baseline')} -> {server.get('threads_after')}")
+    if report["harness_cpu_mean"] is not None and report["harness_cpu_mean"] > 0.8 * (report["cpu_count"] or 1):
+        print("警告: 压测进程自身 CPU 接近跑满，延迟和帧率偏悲观，建议在另一台机器上运行压测端")
+
+
+# 与上一版本的报告逐项对比
+COMPARE_KEYS = (
+    ("latency_ms", "p50"), ("latency_ms", "p99"),
+    ("clients", "normal", "fps_p5"), ("clients", "normal", "fps_p50"), ("clients", "slow", "fps_p50"),
+    ("server", "cpu_mean"), ("server", "rss_peak_mb"), ("server", "rss_slope_mb_per_hour"),
+    ("server", "fd_leak"), ("server", "threads_after")
+)
+
+
+def compare_reports(old, new):
+    print(f"\n对比 {old.get('version')} ({old.get('time')}) -> {new.get('version')} ({new.get('time')})")
+    for keys in COMPARE_KEYS:
+        before, after = old, new
+        for key in keys:
+            before = before.get(key) if isinstance(before, dict) else None
+            after = after.get(key) if isinstance(after, dict) else None
+        change = ''
+        if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+            change = f"{(after - before) / abs(before) * 100:+.1f}%"
+        print(f"  {'.'.join(keys):<28} {str(before):>10} -> {str(after):<10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main2.py 的 WebSocket / HTTP 压力与长稳测试")
+    parser.add_argument('--url', help="压测已在运行的服务（如 http://192.168.1.10:8000），不指定时自动启动被测服务")
+    parser.add_argument('--pid', type=int, help="配合 --url 使用：被测服务的进程号，用于采集 CPU / 内存 / FD")
+    parser.add_argument('--clients', type=int, default=200, help="WebSocket 客户端数")
+    parser.add_argument('--slow-ratio', type=float, default=0.1, help="慢客户端比例")
+    parser.add_argument('--slow-delay', type=float, default=0.5, help="慢客户端每收一帧后等待的秒数")
+    parser.add_argument('--churn-ratio', type=float, default=0.1, help="反复断开重连的客户端比例")
+    parser.add_argument('--churn-max', type=float, default=20.0, help="断线客户端单次连接最长秒数")
+    parser.add_argument('--legacy-ratio', type=float, default=0.1, help="使用旧版 base64 JSON 格式的客户端比例")
+    parser.add_argument('--pollers', type=int, default=4, help="HTTP 轮询协程数")
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=300, help="压测时长（秒），长稳测试可设为数天")
+    parser.add_argument('--ramp', type=float, default=10.0, help="所有客户端在这段时间内逐个连上")
+    parser.add_argument('--settle', type=float, default=5.0, help="压测前后各等待的秒数，用于测量基线和泄漏")
+    parser.add_argument('--sample-interval', type=float, default=5.0)
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    parser.add_argument('--min-fps-window', type=float, default=3.0, help="连接时长不足该秒数的不计入帧率统计")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="将报告写入 JSON 文件")
+    parser.add_argument('--compare', metavar='REPORT', help="与之前的报告对比")
+    # 被测服务参数（自动启动时传给 --serve）
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fps', type=float, default=15.0, help="合成画面帧率")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--persons', type=int, default=2, help="合成画面中的人数")
+    parser.add_argument('--detect-ms', type=float, default=30.0, help="替身模型每次推理的模拟耗时")
+    parser.add_argument('--no-record', action='store_true', help="关闭事件录像")
+    parser.add_argument('--workdir', help="被测服务的配置、日志、数据库目录，默认临时目录")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--host', default='127.0.0.1', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    if psutil is None:
+        print("未安装 psutil，不采集服务进程的 CPU / 内存 / FD")
+
+    process = log = None
+    if args.url:
+        base_url, pid = args.url, args.pid
+    else:
+        args.workdir = args.workdir or tempfile.mkdtemp(prefix='loadtest_')
+        print(f"启动被测服务，日志: {os.path.join(args.workdir, 'server.log')}")
+        process, log = start_server(args, args.workdir)
+        base_url, pid = f"http://127.0.0.1:{args.port}", process.pid
+    try:
+        wait_ready(base_url, 120, process)
+        report = asyncio.run(LoadTest(args, base_url, pid).run())
+    finally:
+        if process is not None:
+            stop_server(process)
+            log.close()
+    if process is not None:
+        report["server_exit_code"] = process.returncode
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
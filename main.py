@@ -1,8 +1,28 @@
 import cv2
-from ultralytics import YOLO
+import numpy as np
 import os
 import sys
+import threading
+import time
 from notification import NotificationManager
+from backends import load_model, load_variants, model_filename
+from scheduler import MotionGatedScheduler
+from alerts import AlertEngine
+from fall_detection import FallDetector, classify_falls
+from postprocess import detect_frame, draw_persons
+from tiling import TiledDetector
+from cascade import PoseCascade
+from propagation import KeyframePropagator
+from governor import QualityGovernor, default_levels
+from capture import open_camera
+from recorder import ClipRecorder
+import metrics
+from metrics import observe_stage
+from pipeline import StageStats
+from startup import StartupTracker
+
+# 启动计时：模型加载和打开摄像头同时进行，各阶段耗时通过监控端口的 /ready 查看
+startup = StartupTracker()
 
 # 获取应用程序路径
 def get_app_path():
@@ -12,12 +32,121 @@ def get_app_path():
     else:
         return os.path.dirname(os.path.abspath(__file__))
 
-# 1. 加载 YOLO11 姿态检测模型
+# 获取可写路径（用于保存录像等）
+def get_writable_path():
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+# 加载推理后端配置
+# 后端可选 pytorch / onnx / openvino，首次使用时导出并缓存，之后直接加载
+try:
+    import config
+    inference_backend = getattr(config, 'inference_backend', 'pytorch')
+    model_size = getattr(config, 'model_size', 'l')
+    inference_imgsz = getattr(config, 'inference_imgsz', 640)
+    inference_precision = getattr(config, 'inference_precision', 'fp32')
+    warmup_runs = getattr(config, 'warmup_runs', 1)
+except ImportError:
+    inference_backend = 'pytorch'
+    model_size = 'l'
+    inference_imgsz = 640
+    inference_precision = 'fp32'
+    warmup_runs = 1
+
+# 加载两级检测配置
+# 第一级小模型低分辨率检测整幅画面找人，第二级只对每个人的裁剪图做姿态估计
+try:
+    import config
+    cascade_enabled = getattr(config, 'cascade_enabled', True)
+    detector_size = getattr(config, 'detector_size', 'n')
+    detector_imgsz = getattr(config, 'detector_imgsz', 320)
+    pose_model_size = getattr(config, 'pose_model_size', 's')
+    pose_imgsz = getattr(config, 'pose_imgsz', 256)
+    pose_crop_padding = getattr(config, 'pose_crop_padding', 0.15)
+except ImportError:
+    cascade_enabled = True
+    detector_size = 'n'
+    detector_imgsz = 320
+    pose_model_size = 's'
+    pose_imgsz = 256
+    pose_crop_padding = 0.15
+
+# 加载自适应画质调节配置
+# 按目标帧率和 CPU 预算在预加载的模型大小 / 推理尺寸之间自动切换
+try:
+    import config
+    governor_enabled = getattr(config, 'governor_enabled', True)
+    governor_target_fps = getattr(config, 'governor_target_fps', 10)
+    governor_cpu_budget = getattr(config, 'governor_cpu_budget', 0.8)
+    governor_levels = getattr(config, 'governor_levels', None)
+except ImportError:
+    governor_enabled = True
+    governor_target_fps = 10
+    governor_cpu_budget = 0.8
+    governor_levels = None
+
+# 加载监控指标配置：main.py 没有 Web 服务，单独开一个端口提供 /metrics 和 /ready
+# 在加载模型之前启动，启动过程中就能查看进度
+try:
+    import config
+    metrics_port = getattr(config, 'metrics_port', 8001)
+except ImportError:
+    metrics_port = 8001
+
+if metrics_port:
+    try:
+        metrics.start_http_server(metrics_port, startup=startup)
+    except OSError as e:
+        print(f"监控指标端口 {metrics_port} 无法使用: {e}")
+
+# 1. YOLO11 模型，在后台线程中加载并预热，同时主线程打开摄像头（见下方第 2 步）
 app_path = get_app_path()
-model_path = os.path.join(app_path, 'yolo11l.pt')
-print(f"正在加载模型: {model_path}")
 
-model = YOLO(model_path)
+# 两级检测时第一级为人体检测 + 跟踪模型；否则用单个姿态模型整幅画面推理，同时得到人框和关键点
+if cascade_enabled:
+    base_size, base_imgsz, base_task = detector_size, detector_imgsz, None
+else:
+    base_size, base_imgsz, base_task = model_size, inference_imgsz, 'pose'
+
+def model_path_for(size):
+    return os.path.join(app_path, model_filename(size, base_task or 'detect'))
+
+# 导出的 ONNX / OpenVINO 模型缓存在可写目录下；打包后 .pt 所在的 _MEIPASS 是临时目录，退出即删除
+model_cache_dir = os.path.join(get_writable_path(), 'model_cache')
+
+governor = None
+model_variants = {}
+model = None
+cascade = None
+
+def load_models():
+    global governor, model_variants, model, cascade
+    # 画质调节开启时预加载所有档位，运行中切换不需要再加载模型
+    if governor_enabled:
+        levels = [tuple(level) for level in (governor_levels or default_levels(base_size, base_imgsz))]
+        model_variants = load_variants(levels, model_path_for, inference_backend, inference_precision,
+                                       cache_dir=model_cache_dir, warmup_runs=warmup_runs, task=base_task)
+        levels = [level for level in levels if level in model_variants]
+        if levels:
+            governor = QualityGovernor(levels, governor_target_fps, governor_cpu_budget)
+
+    if governor is not None:
+        model = model_variants[governor.key()]
+    else:
+        model = load_model(model_path_for(base_size), inference_backend, base_imgsz, inference_precision,
+                           cache_dir=model_cache_dir, warmup_runs=warmup_runs, task=base_task)
+
+    # 第二级：裁剪图姿态估计，提供跌倒判定需要的关键点
+    if cascade_enabled:
+        pose_model = load_model(os.path.join(app_path, model_filename(pose_model_size, 'pose')),
+                                inference_backend, pose_imgsz, inference_precision, cache_dir=model_cache_dir,
+                                warmup_runs=warmup_runs, task='pose')
+        cascade = PoseCascade(pose_model, pose_crop_padding)
+
+model_loader = threading.Thread(target=startup.run, args=('model', load_models), name="model-loader", daemon=True)
+model_loader.start()
 
 # 2. 初始化通知管理器
 notifier = NotificationManager()
@@ -33,33 +162,138 @@ try:
         'email_to': getattr(config, 'email_to', None),
         'email_from': getattr(config, 'email_from', None),
         'email_password': getattr(config, 'email_password', None),
-        'smtp_server': getattr(config, 'smtp_server', 'smtp.qq.com')
+        'smtp_server': getattr(config, 'smtp_server', 'smtp.qq.com'),
+        'smtp_port': getattr(config, 'smtp_port', 587),
+        'smtp_starttls': getattr(config, 'smtp_starttls', True)
     }
     print("通知配置已加载")
 except ImportError:
     print("未找到 config.py，使用默认配置（无通知）")
     notification_config = {}
 
+# 加载报警去重与限流配置
+try:
+    import config
+    notification_interval = getattr(config, 'notification_interval', 300)
+    alert_burst = getattr(config, 'alert_burst', 3)
+    fall_repeat_interval = getattr(config, 'fall_repeat_interval', 30)
+    alert_clear_after = getattr(config, 'alert_clear_after', 10)
+except ImportError:
+    notification_interval = 300
+    alert_burst = 3
+    fall_repeat_interval = 30
+    alert_clear_after = 10
+
+# 按 (摄像头, 跟踪ID, 事件类型) 去重：每个人每次跌倒只报警一次，持续跌倒才升级再报
+alert_engine = AlertEngine(
+    notifier,
+    notification_config,
+    notification_interval=notification_interval,
+    burst=alert_burst,
+    repeat_intervals={'fall': fall_repeat_interval},
+    clear_after=alert_clear_after
+)
+
+# 加载事件录像配置
+# 内存中保留最近几秒的画面，检测到跌倒时在后台写成 MP4（含跌倒前后的画面）
+try:
+    import config
+    clip_recording_enabled = getattr(config, 'clip_recording_enabled', True)
+    clip_path = getattr(config, 'clip_path', None)
+    clip_pre_roll = getattr(config, 'clip_pre_roll', 5)
+    clip_post_roll = getattr(config, 'clip_post_roll', 10)
+    clip_fps = getattr(config, 'clip_fps', 10)
+    clip_quota_mb = getattr(config, 'clip_quota_mb', 2048)
+except ImportError:
+    clip_recording_enabled = True
+    clip_path = None
+    clip_pre_roll = 5
+    clip_post_roll = 10
+    clip_fps = 10
+    clip_quota_mb = 2048
+
+recorder = None
+if clip_recording_enabled:
+    clip_dir = clip_path or os.path.join(get_writable_path(), 'clips')
+    recorder = ClipRecorder(clip_dir, None, clip_pre_roll, clip_post_roll, clip_fps, quota_mb=clip_quota_mb)
+    print(f"事件录像保存路径: {clip_dir}")
+
+# 时序跌倒检测：按跟踪编号记录每个人最近的姿态，用状态机判定 站立 -> 跌倒中 -> 倒地 -> 起身
+fall_detector = FallDetector()
+
+# 加载运动门控推理调度配置
+# 画面静止且无人时降低推理频率，有运动或有人时立即恢复全速
+try:
+    import config
+    motion_gate_enabled = getattr(config, 'motion_gate_enabled', True)
+    motion_threshold = getattr(config, 'motion_threshold', 0.01)
+    idle_inference_fps = getattr(config, 'idle_inference_fps', 1.0)
+    idle_timeout = getattr(config, 'idle_timeout', 10.0)
+except ImportError:
+    motion_gate_enabled = True
+    motion_threshold = 0.01
+    idle_inference_fps = 1.0
+    idle_timeout = 10.0
+
+scheduler = None
+if motion_gate_enabled:
+    scheduler = MotionGatedScheduler(motion_threshold, idle_inference_fps, idle_timeout)
+
+# 加载关键帧检测配置
+# 每 keyframe_interval 帧做一次完整检测，中间帧用光流外推人框和关键点，跌倒判定仍每帧更新
+try:
+    import config
+    keyframe_interval = getattr(config, 'keyframe_interval', 1)
+    propagation_min_confidence = getattr(config, 'propagation_min_confidence', 0.5)
+    propagation_motion_spike = getattr(config, 'propagation_motion_spike', 0.1)
+except ImportError:
+    keyframe_interval = 1
+    propagation_min_confidence = 0.5
+    propagation_motion_spike = 0.1
+
+propagator = None
+if keyframe_interval > 1:
+    propagator = KeyframePropagator(keyframe_interval, propagation_min_confidence, propagation_motion_spike)
+
+# 加载感兴趣区域 (ROI) 配置
+# 跟踪需要稳定的画面坐标，这里只裁剪到 ROI 的外接矩形，不做分块
+try:
+    import config
+    rois = (getattr(config, 'camera_rois', None) or {}).get('default')
+except ImportError:
+    rois = None
+
+tiler = TiledDetector(rois) if rois else None
+
+# 加载视频采集配置
+# 上次成功打开的摄像头和后端会缓存到 camera_cache.json，下次启动优先尝试
+try:
+    import config
+    capture_backend = getattr(config, 'capture_backend', 'auto')
+    capture_mjpeg = getattr(config, 'capture_mjpeg', True)
+    capture_width = getattr(config, 'capture_width', None)
+    capture_height = getattr(config, 'capture_height', None)
+    capture_fps = getattr(config, 'capture_fps', None)
+    capture_reconnect_delay = getattr(config, 'capture_reconnect_delay', 1.0)
+except ImportError:
+    capture_backend = 'auto'
+    capture_mjpeg = True
+    capture_width = None
+    capture_height = None
+    capture_fps = None
+    capture_reconnect_delay = 1.0
+
 # 2. 尝试打开摄像头，支持多种后端
 print("正在尝试打开摄像头...")
 
 # 优先使用 OBS 虚拟摄像头（索引 1），如果失败则尝试物理摄像头（索引 0）
 camera_indices = [1, 0]  # 1=虚拟摄像头, 0=物理摄像头
 
-cap = None
-for camera_idx in camera_indices:
-    print(f"尝试打开摄像头 {camera_idx}...")
-    cap = cv2.VideoCapture(camera_idx)
-    if cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            print(f"成功! 使用摄像头 {camera_idx}")
-            break
-        else:
-            cap.release()
-    cap = None
+cap = startup.run('camera', lambda: open_camera(camera_indices, capture_backend, mjpeg=capture_mjpeg,
+                                                width=capture_width, height=capture_height, fps=capture_fps,
+                                                reconnect_delay=capture_reconnect_delay))
 
-if cap is None or not cap.isOpened():
+if cap is None:
     print("\n错误: 无法打开摄像头!")
     print("请检查:")
     print("1. 如果使用 OBS 虚拟摄像头，请确保在 OBS 中已启动虚拟摄像机")
@@ -67,63 +301,141 @@ if cap is None or not cap.isOpened():
     print("3. 摄像头驱动是否正常")
     exit(1)
 
+# 等待模型加载完成
+model_loader.join()
+if model is None:
+    print("\n错误: 模型加载失败!")
+    cap.release()
+    exit(1)
+startup.set_ready()
+
+# 摄像头断开时 cap.read() 会自动重连，只有退出时才返回失败
+
+# 加载画面显示配置
+# 窗口只按 display_fps 刷新，两次刷新之间的帧不画框、不显示，节省 CPU
+try:
+    import config
+    display_fps = getattr(config, 'display_fps', 15)
+except ImportError:
+    display_fps = 15
+
+display_interval = 1.0 / display_fps if display_fps else 0.0
+last_display_time = 0.0
+
+# 本帧是否需要画面：到了窗口刷新时间，或录像到了抽帧时间
+def frame_needed(now):
+    return (now - last_display_time >= display_interval or
+            (recorder is not None and recorder.wants_frame()))
+
+def show_frame(frame, now):
+    global last_display_time
+    if now - last_display_time >= display_interval:
+        cv2.imshow("YOLO11 Fall Detection", frame)
+        last_display_time = now
+
+frame_rate = StageStats()
+metrics.Gauge('monitor_fps', '最近 2 秒处理的帧率', lambda: frame_rate.snapshot()["fps"])
+metrics.Gauge('monitor_tracks', '正在跟踪的人数', lambda: fall_detector.snapshot()["tracks"])
+metrics.Gauge('monitor_notification_queue_depth', '等待发送的通知数', lambda: notifier.dispatcher.qsize())
+if governor is not None:
+    metrics.Gauge('monitor_governor_level', '画质调节当前档位（0 为最高）', lambda: governor.index)
+    metrics.Gauge('monitor_governor_load', '每帧处理耗时 × 目标帧率', lambda: governor.load)
+if propagator is not None:
+    metrics.Gauge('monitor_detect_ratio', '做完整检测的帧所占比例', lambda: propagator.snapshot()["detect_ratio"])
+
 while cap.isOpened():
+    t = time.perf_counter()
     success, frame = cap.read()
+    t = observe_stage('capture', t)
     if not success:
         break
+    frame_rate.record(0)
+
+    now = time.monotonic()
 
-    # 3. 使用 YOLO11 进行推理
-    # persist=True 用于跨帧跟踪同一个人的编号
-    results = model.track(frame, persist=True, verbose=False)
-
-    for r in results:
-        if r.keypoints is not None:
-            # 获取人体框和关键点数据
-            boxes = r.boxes.xywh.cpu().numpy()  # [x, y, w, h]
-            keypoints = r.keypoints.data.cpu().numpy()  # [person_idx, landmark_idx, x,y,conf]
-
-            for i, box in enumerate(boxes):
-                x, y, w, h = box
-
-                # --- 判定算法 1: 长宽比判定 ---
-                # 如果宽度 w 大于 高度 h，说明人是横向躺着的
-                aspect_ratio = w / h
-
-                # --- 判定算法 2: 关键点相对高度 ---
-                # 获取鼻子(index 0) 和 脚踝(index 15, 16) 的 Y 坐标
-                person_kpts = keypoints[i]
-                nose_y = person_kpts[0][1]
-                # 取两只脚踝的平均高度
-                ankle_y = (person_kpts[15][1] + person_kpts[16][1]) / 2
-
-                # 垂直距离
-                vertical_dist = ankle_y - nose_y
-
-                # 综合判定逻辑
-                if aspect_ratio > 1.2 or vertical_dist < (h * 0.3):
-                    status = "FALL DETECTED!"
-                    color = (0, 0, 255)  # 红色警告
-                    
-                    # 发送跌倒报警通知
-                    import time
-                    message = f"【跌倒检测报警】\n时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n状态: 检测到人员跌倒\n请及时查看监控画面！"
-                    notifier.send_notification(message, notification_config)
-                else:
-                    status = "Normal"
-                    color = (0, 255, 0)  # 绿色正常
-
-                # 画框和文字显示
-                cv2.rectangle(frame, (int(x - w / 2), int(y - h / 2)),
-                              (int(x + w / 2), int(y + h / 2)), color, 2)
-                cv2.putText(frame, f"{status}",
-                            (int(x - w / 2), int(y - h / 2) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+    # 运动门控：空闲且画面静止时跳过本帧推理
+    # CPU 超预算时画质调节按目标帧率限速，多余的帧同样跳过推理
+    # 先看画质调节：限速跳过的帧不计算运动，也不计入运动门控的推理次数
+    if ((governor is not None and not governor.due()) or
+            (scheduler is not None and not scheduler.should_infer(frame))):
+        if recorder is not None:
+            recorder.add_frame(frame)
+        show_frame(frame, now)
+        # 窗口事件每帧都要处理，否则窗口会失去响应
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+        continue
+
+    busy_start = t
+
+    # 关键帧之间用光流外推上一次的检测结果，跳过检测和姿态估计
+    propagated = propagator.propagate(frame) if propagator is not None else None
+    if propagated is not None:
+        detections = [propagated]
+        t = observe_stage('propagate', t)
+    else:
+        # 3. 使用 YOLO11 进行推理
+        # persist=True 用于跨帧跟踪同一个人的编号
+        # 一次性提取所有人的框、跟踪编号和关键点
+        detections = detect_frame(model, frame, tiler, track=True)
+        t = observe_stage('inference', t)
+        startup.mark('first_detection')
+
+        # 两级检测：只对检测到的人做姿态估计，没人时不调用姿态模型
+        if cascade is not None:
+            cascade.estimate([(frame, persons) for persons in detections])
+            t = observe_stage('pose', t)
+
+        if propagator is not None:
+            propagator.keyframe(frame, np.concatenate(detections))
+
+    if scheduler is not None:
+        scheduler.report(sum(len(persons) for persons in detections))
+
+    # 所有被跟踪的人一次性更新时序状态，倒地的人交给报警引擎去重，消息拼接和发送都在后台完成
+    # 按状态分组，稍后统一画框和文字
+    groups, fall_in_frame = classify_falls(fall_detector, detections, alert_engine)
+    t = observe_stage('postprocess', t)
+
+    # 画质调节：按本帧处理耗时决定是否切换档位
+    # 换成另一个模型实例（不同大小，或非 PyTorch 后端的另一输入尺寸，跟踪器各自独立）时跟踪编号会重新分配，
+    # 清空跌倒历史、新模型跟踪器里上次留下的轨迹和光流外推的关键帧，避免旧编号的历史套到别人身上
+    if governor is not None and governor.record(t - busy_start):
+        previous, model = model, model_variants[governor.key()]
+        if model.yolo is not previous.yolo:
+            fall_detector.reset()
+            model.reset_tracker()
+            if propagator is not None:
+                propagator.reset()
+
+    # 按需画框：窗口不刷新、录像也不抽帧时，画好的框没人看得到
+    if frame_needed(now):
+        if tiler is not None:
+            tiler.draw_rois(frame)
+        for persons, label, color in groups:
+            draw_persons(frame, persons, label, color)
+        t = observe_stage('draw', t)
+
+    # 标注后的画面放入录像缓冲区（按录像帧率抽帧编码），有人跌倒时开始 / 延长录像
+    if recorder is not None:
+        if fall_in_frame:
+            recorder.trigger('fall')
+        recorder.add_frame(frame)
+        observe_stage('record', t)
 
     # 显示画面
-    cv2.imshow("YOLO11 Fall Detection", frame)
+    show_frame(frame, now)
 
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
 cap.release()
 cv2.destroyAllWindows()
+
+# 写完正在录制的事件录像
+if recorder is not None:
+    recorder.stop()
+
+# 发出尚未合并发送的报警，并等待后台队列中的通知发送完毕
+alert_engine.stop()
+notifier.close()
@@ -1,15 +1,40 @@
+import asyncio
 import cv2
-from ultralytics import YOLO
 import os
 import sys
 import time
-import requests
-import base64
 import threading
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import multiprocessing
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+from contextlib import asynccontextmanager
 from notification import NotificationManager
+from backends import load_model, load_variants, model_filename
+from pipeline import FramePipeline
+from streaming import ConnectionManager, FrameCache, StreamEncoder, encode_for_clients, MJPEG_BOUNDARY, BASE_LEVEL
+from multi_camera import MultiCameraDetector
+from cascade import PoseCascade
+from governor import QualityGovernor, default_levels
+from workers import WorkerPool
+from scheduler import MotionGatedScheduler
+from alerts import AlertEngine
+from postprocess import detect_frame, draw_persons
+from tiling import TiledDetector
+from capture import open_camera
+from recorder import ClipRecorder
+from event_store import EventStore, parse_time
+import metrics
+from metrics import observe_stage
+from pipeline import StageStats
+from startup import StartupTracker, FirstResponseMiddleware
+
+# 打包后的 exe 中启动推理子进程需要先调用（未打包时无作用）
+multiprocessing.freeze_support()
+
+# 启动计时：HTTP 服务先启动，模型加载和打开摄像头在后台并行进行，各阶段耗时通过 /ready 查看
+startup = StartupTracker()
 
 # 获取模型文件路径（只读）
 def get_resource_path():
@@ -25,13 +50,117 @@ def get_writable_path():
     else:
         return os.path.dirname(os.path.abspath(__file__))
 
-# 1. 加载 YOLO11 普通检测模型
+# 加载推理后端配置
+# 后端可选 pytorch / onnx / openvino，首次使用时导出并缓存，之后直接加载
+try:
+    import config
+    inference_backend = getattr(config, 'inference_backend', 'pytorch')
+    model_size = getattr(config, 'model_size', 'l')
+    inference_imgsz = getattr(config, 'inference_imgsz', 640)
+    inference_precision = getattr(config, 'inference_precision', 'fp32')
+    warmup_runs = getattr(config, 'warmup_runs', 1)
+    # 多路模式下按摄像头数量导出固定 batch 的模型，实际图片数不同时由 InferenceModel 分组补齐
+    inference_batch = max(1, len(getattr(config, 'camera_sources', None) or []))
+except ImportError:
+    inference_backend = 'pytorch'
+    model_size = 'l'
+    inference_imgsz = 640
+    inference_precision = 'fp32'
+    warmup_runs = 1
+    inference_batch = 1
+
+# 加载多进程推理配置
+# worker_processes > 0 时推理放到独立进程中（各自加载模型、绑定 CPU 核心），
+# 本进程只负责采集、报警、编码和 HTTP / WebSocket，画面通过共享内存传递
+try:
+    import config
+    worker_processes = getattr(config, 'worker_processes', 0)
+    worker_threads = getattr(config, 'worker_threads', None)
+    worker_pin_cores = getattr(config, 'worker_pin_cores', True)
+except ImportError:
+    worker_processes = 0
+    worker_threads = None
+    worker_pin_cores = True
+
+# 加载两级检测配置
+# 第一级小模型低分辨率检测整幅画面找人；多路 / 多进程模式的跌倒判定需要关键点，
+# 由第二级姿态模型只对每个人的裁剪图推理得到
+try:
+    import config
+    cascade_enabled = getattr(config, 'cascade_enabled', True)
+    detector_size = getattr(config, 'detector_size', 'n')
+    detector_imgsz = getattr(config, 'detector_imgsz', 320)
+    pose_model_size = getattr(config, 'pose_model_size', 's')
+    pose_imgsz = getattr(config, 'pose_imgsz', 256)
+    pose_crop_padding = getattr(config, 'pose_crop_padding', 0.15)
+except ImportError:
+    cascade_enabled = True
+    detector_size = 'n'
+    detector_imgsz = 320
+    pose_model_size = 's'
+    pose_imgsz = 256
+    pose_crop_padding = 0.15
+
+# 加载自适应画质调节配置
+# 按目标帧率和 CPU 预算在预加载的模型大小 / 推理尺寸之间自动切换，推流画质下限随之调整
+try:
+    import config
+    governor_enabled = getattr(config, 'governor_enabled', True)
+    governor_target_fps = getattr(config, 'governor_target_fps', 10)
+    governor_cpu_budget = getattr(config, 'governor_cpu_budget', 0.8)
+    governor_levels = getattr(config, 'governor_levels', None)
+except ImportError:
+    governor_enabled = True
+    governor_target_fps = 10
+    governor_cpu_budget = 0.8
+    governor_levels = None
+
+# 1. YOLO11 普通检测模型，在后台启动线程中加载并预热（见 load_models）
 resource_path = get_resource_path()
 writable_path = get_writable_path()
-model_path = os.path.join(resource_path, 'yolo11l.pt')
-print(f"正在加载模型: {model_path}")
-
-model = YOLO(model_path)
+model_path = os.path.join(resource_path, model_filename(detector_size if cascade_enabled else model_size))
+model_spec = {
+    'pt_path': model_path,
+    'backend': inference_backend,
+    'imgsz': detector_imgsz if cascade_enabled else inference_imgsz,
+    'precision': inference_precision,
+    'batch': inference_batch,
+    'cache_dir': os.path.join(writable_path, 'model_cache'),
+    'warmup_runs': warmup_runs
+}
+
+# 第二级姿态模型只在需要跌倒判定的多路 / 多进程模式中加载，单摄像头模式只统计人数
+pose_spec = None
+if cascade_enabled:
+    pose_spec = dict(model_spec, pt_path=os.path.join(resource_path, model_filename(pose_model_size, 'pose')),
+                     imgsz=pose_imgsz, batch=1, task='pose')
+
+governor = None
+model_variants = {}
+model = None
+pose_cascade = None
+if worker_processes > 0:
+    # 模型在各推理进程中加载，本进程不占用模型内存（不做画质调节）
+    print(f"多进程推理模式: {worker_processes} 个推理进程")
+
+def load_models():
+    global governor, model_variants, model, pose_cascade
+    if governor_enabled:
+        # 预加载所有档位，运行中切换不需要再加载模型
+        levels = governor_levels or default_levels(detector_size if cascade_enabled else model_size,
+                                                   model_spec['imgsz'])
+        model_variants = load_variants([tuple(level) for level in levels],
+                                       lambda size: os.path.join(resource_path, model_filename(size)),
+                                       inference_backend, inference_precision, inference_batch,
+                                       model_spec['cache_dir'], warmup_runs)
+        levels = [tuple(level) for level in levels if tuple(level) in model_variants]
+        if levels:
+            governor = QualityGovernor(levels, governor_target_fps, governor_cpu_budget)
+            model = model_variants[governor.key()]
+    if model is None:
+        model = load_model(**model_spec)
+    if camera_sources and pose_spec is not None:
+        pose_cascade = PoseCascade(load_model(**pose_spec), pose_crop_padding)
 
 # 2. 初始化通知管理器
 notifier = NotificationManager()
@@ -47,7 +176,9 @@ try:
         'email_to': getattr(config, 'email_to', None),
         'email_from': getattr(config, 'email_from', None),
         'email_password': getattr(config, 'email_password', None),
-        'smtp_server': getattr(config, 'smtp_server', 'smtp.qq.com')
+        'smtp_server': getattr(config, 'smtp_server', 'smtp.qq.com'),
+        'smtp_port': getattr(config, 'smtp_port', 587),
+        'smtp_starttls': getattr(config, 'smtp_starttls', True)
     }
     print("通知配置已加载")
 except ImportError:
@@ -68,65 +199,302 @@ except ImportError:
     screenshot_dir = os.path.join(writable_path, 'screenshots')
     print(f"使用默认截图路径: {screenshot_dir}")
 
-# 3. 尝试打开摄像头，支持多种后端
-print("正在尝试打开摄像头...")
+# 加载事件录像配置
+# 内存中保留最近几秒已编码的画面，检测到人或跌倒时在后台写成 MP4（含事件前后的画面）
+try:
+    import config
+    clip_recording_enabled = getattr(config, 'clip_recording_enabled', True)
+    clip_path = getattr(config, 'clip_path', None)
+    clip_pre_roll = getattr(config, 'clip_pre_roll', 5)
+    clip_post_roll = getattr(config, 'clip_post_roll', 10)
+    clip_fps = getattr(config, 'clip_fps', 10)
+    clip_quota_mb = getattr(config, 'clip_quota_mb', 2048)
+except ImportError:
+    clip_recording_enabled = True
+    clip_path = None
+    clip_pre_roll = 5
+    clip_post_roll = 10
+    clip_fps = 10
+    clip_quota_mb = 2048
+clip_dir = clip_path or os.path.join(writable_path, 'clips')
+if clip_recording_enabled:
+    print(f"事件录像保存路径: {clip_dir}")
+
+# 加载视频处理模式配置
+# pipeline: 采集/推理/推送三线程流水线（默认）；single: 原单线程循环
+try:
+    import config
+    pipeline_mode = getattr(config, 'pipeline_mode', 'pipeline')
+    pipeline_queue_size = getattr(config, 'pipeline_queue_size', 1)
+except ImportError:
+    pipeline_mode = 'pipeline'
+    pipeline_queue_size = 1
+print(f"视频处理模式: {pipeline_mode}")
 
+# 加载无界面模式配置
+# 无界面模式不打开 OpenCV 窗口，用 Ctrl+C / SIGTERM（systemd、docker stop）退出，
+# 只在有人观看画面时才画框标注，适合作为服务长期运行
+try:
+    import config
+    headless = getattr(config, 'headless', None)
+except ImportError:
+    headless = None
+if headless is None:
+    # 未配置时按有无显示器自动判断：Linux 服务器 / 容器中没有 DISPLAY
+    headless = sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or
+                                                         os.environ.get('WAYLAND_DISPLAY'))
+show_window = not headless
+if headless:
+    print("无界面模式: 不显示视频窗口")
+
+# 加载推流配置
+# 画面只在有观看者时才编码；WebSocket 客户端按各自网速自动调整分辨率、画质和帧率
+# 码率单位 kbps，None 表示不限制；stream_encode_budget 为推流编码最多占用单核 CPU 的比例
+try:
+    import config
+    stream_target_kbps = getattr(config, 'stream_target_kbps', None)
+    stream_max_total_kbps = getattr(config, 'stream_max_total_kbps', None)
+    stream_encode_budget = getattr(config, 'stream_encode_budget', 0.25)
+except ImportError:
+    stream_target_kbps = None
+    stream_max_total_kbps = None
+    stream_encode_budget = 0.25
+
+# 加载运动门控推理调度配置
+# 画面静止且无人时降低推理频率，有运动或有人时立即恢复全速
+try:
+    import config
+    motion_gate_enabled = getattr(config, 'motion_gate_enabled', True)
+    motion_threshold = getattr(config, 'motion_threshold', 0.01)
+    idle_inference_fps = getattr(config, 'idle_inference_fps', 1.0)
+    idle_timeout = getattr(config, 'idle_timeout', 10.0)
+except ImportError:
+    motion_gate_enabled = True
+    motion_threshold = 0.01
+    idle_inference_fps = 1.0
+    idle_timeout = 10.0
+
+def create_scheduler():
+    if not motion_gate_enabled:
+        return None
+    return MotionGatedScheduler(motion_threshold, idle_inference_fps, idle_timeout)
+
+# 加载多路摄像头配置
+# camera_sources 非空时启用多路模式，所有视频源共用一个模型做批量推理
+try:
+    import config
+    camera_sources = getattr(config, 'camera_sources', None) or []
+except ImportError:
+    camera_sources = []
+
+# 加载感兴趣区域 (ROI) 与分块推理配置
+# ROI 只检测画面中的指定矩形；分块把高分辨率画面切成小块分别检测，远处的人也能检出
+try:
+    import config
+    camera_rois = getattr(config, 'camera_rois', None) or {}
+    tiling_enabled = getattr(config, 'tiling_enabled', False)
+    tile_size = getattr(config, 'tile_size', None)
+    tile_overlap = getattr(config, 'tile_overlap', 0.2)
+except ImportError:
+    camera_rois = {}
+    tiling_enabled = False
+    tile_size = None
+    tile_overlap = 0.2
+
+# 单摄像头使用 'default' 的 ROI，多路模式按摄像头名称（cam0 / cam1 ...）查找
+def create_tiler(camera=None):
+    rois = camera_rois.get(camera or 'default')
+    if not rois and not tiling_enabled:
+        return None
+    return TiledDetector(rois, tiling_enabled, tile_size, tile_overlap)
+
+# 加载视频采集配置
+# 上次成功打开的摄像头和后端会缓存到 camera_cache.json，下次启动优先尝试
+try:
+    import config
+    capture_backend = getattr(config, 'capture_backend', 'auto')
+    capture_mjpeg = getattr(config, 'capture_mjpeg', True)
+    capture_width = getattr(config, 'capture_width', None)
+    capture_height = getattr(config, 'capture_height', None)
+    capture_fps = getattr(config, 'capture_fps', None)
+    capture_reconnect_delay = getattr(config, 'capture_reconnect_delay', 1.0)
+except ImportError:
+    capture_backend = 'auto'
+    capture_mjpeg = True
+    capture_width = None
+    capture_height = None
+    capture_fps = None
+    capture_reconnect_delay = 1.0
+
+# 3. 摄像头，在后台启动线程中与模型加载同时打开（见 open_cameras）
 # 优先使用物理USB摄像头（索引 0），如果失败则尝试虚拟摄像头（索引 1）
 camera_indices = [0, 1]  # 0=USB物理摄像头, 1=虚拟摄像头
 
 cap = None
-for camera_idx in camera_indices:
-    print(f"尝试打开摄像头 {camera_idx}...")
-    
-    # 先尝试默认方式打开
-    cap = cv2.VideoCapture(camera_idx)
-    if cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            print(f"成功! 使用摄像头 {camera_idx}")
-            break
-        else:
-            cap.release()
-    
-    # 失败了再尝试用DSHOW后端打开
-    print(f"默认方式打开失败，尝试用DSHOW后端打开摄像头 {camera_idx}...")
-    cap = cv2.VideoCapture(camera_idx, cv2.CAP_DSHOW)
-    if cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            print(f"成功! 使用摄像头 {camera_idx} (DSHOW后端)")
-            break
-        else:
-            cap.release()
-    
-    cap = None
-    print(f"摄像头 {camera_idx} 打开失败，尝试下一个...")
-
-if cap is None or not cap.isOpened():
-    print("\n错误: 无法打开摄像头!")
-    print("请检查:")
-    print("1. 如果使用 OBS 虚拟摄像头，请确保在 OBS 中已启动虚拟摄像机")
-    print("2. 如果使用物理摄像头，请确保未被其他程序占用")
-    print("3. 摄像头驱动是否正常")
-    exit(1)
+multi_detector = None
+
+# 返回是否成功打开；多进程模式下推理进程各自加载模型，也在这里启动
+def open_cameras():
+    global cap, multi_detector
+    print("正在尝试打开摄像头...")
+    if worker_processes > 0:
+        # 多路视频源直接交给推理进程池；单摄像头先按缓存查找可用设备，再交给进程池
+        sources = camera_sources
+        if not sources:
+            camera = open_camera(camera_indices, capture_backend, mjpeg=capture_mjpeg, width=capture_width,
+                                 height=capture_height, fps=capture_fps, reconnect_delay=capture_reconnect_delay)
+            sources = [camera] if camera is not None else []
+        # 每个推理进程一次只处理一帧，按单帧导出模型
+        model_spec['batch'] = 1
+        # 单摄像头沿用 'default' 的 ROI 配置
+        worker_tiler = create_tiler if camera_sources else (lambda name: create_tiler())
+        pool = WorkerPool(model_spec, sources, worker_processes, worker_threads, worker_pin_cores,
+                          create_scheduler, worker_tiler, capture_backend=capture_backend,
+                          reconnect_delay=capture_reconnect_delay, pose_spec=pose_spec,
+                          pose_padding=pose_crop_padding)
+        multi_detector = pool
+        return bool(sources) and pool.start()
+    if camera_sources:
+        print(f"多路摄像头模式: 共 {len(camera_sources)} 路视频源")
+        # 模型还在并行加载，加载完成后再交给多路检测器
+        detector = MultiCameraDetector(None, camera_sources, create_scheduler, create_tiler,
+                                       capture_backend=capture_backend, reconnect_delay=capture_reconnect_delay)
+        multi_detector = detector
+        return detector.start()
+    # 流水线中同时持有的帧最多为推理、推送各 1 帧加两个队列；这些帧作为 exclude 传给 read()，
+    # 采集时跳过，缓冲区环比它多两个，采集端总有空闲缓冲区可用
+    cap = open_camera(camera_indices, capture_backend, ring_size=2 * pipeline_queue_size + 4,
+                      mjpeg=capture_mjpeg, width=capture_width, height=capture_height, fps=capture_fps,
+                      reconnect_delay=capture_reconnect_delay)
+    return cap is not None
 
 # 创建截图保存目录
 if not os.path.exists(screenshot_dir):
     os.makedirs(screenshot_dir)
     print(f"截图保存目录: {screenshot_dir}")
 
-print("\n开始人物检测，检测到人时会发送报警通知和截图...")
-print("按 'q' 键退出程序\n")
-
-last_alert_time = 0
-alert_interval = 60  # 60秒内不重复报警
+# 加载报警去重与限流配置
+try:
+    import config
+    notification_interval = getattr(config, 'notification_interval', 300)
+    alert_burst = getattr(config, 'alert_burst', 3)
+    alert_interval = getattr(config, 'alert_interval', 60)
+    fall_repeat_interval = getattr(config, 'fall_repeat_interval', 30)
+    alert_clear_after = getattr(config, 'alert_clear_after', 10)
+except ImportError:
+    notification_interval = 300
+    alert_burst = 3
+    alert_interval = 60  # 有人持续出现时，60秒后才再次报警
+    fall_repeat_interval = 30
+    alert_clear_after = 10
+
+# 加载事件历史数据库配置
+# 每路每秒的人数统计和报警事件写入 SQLite，可通过 /events、/stats 接口查询
+try:
+    import config
+    event_store_enabled = getattr(config, 'event_store_enabled', True)
+    event_db_path = getattr(config, 'event_db_path', None)
+except ImportError:
+    event_store_enabled = True
+    event_db_path = None
+
+event_store = None
+if event_store_enabled:
+    event_db_path = event_db_path or os.path.join(writable_path, 'events.db')
+    event_store = EventStore(event_db_path)
+    print(f"事件数据库: {event_db_path}")
+
+alert_engine = AlertEngine(
+    notifier,
+    notification_config,
+    screenshot_dir=screenshot_dir,
+    notification_interval=notification_interval,
+    burst=alert_burst,
+    repeat_intervals={'person': alert_interval, 'fall': fall_repeat_interval},
+    clear_after=alert_clear_after,
+    event_store=event_store
+)
+SCREENSHOT_NOTICE_SECONDS = 3.0  # 报警截图保存后画面上显示 "Screenshot Saved" 的秒数
 
 # 全局变量，用于视频流
 latest_frame = None
 latest_person_count = 0
+pipeline = None
+scheduler = create_scheduler()
+tiler = create_tiler()
+
+# 运行状态指标，抓取 /metrics 时才求值
+frame_rate = StageStats()
+
+metrics.Gauge('monitor_fps', '最近 2 秒推送的帧率', lambda: frame_rate.snapshot()["fps"])
+metrics.Gauge('monitor_person_count', '当前画面中的人数', lambda: latest_person_count)
+metrics.Gauge('monitor_dropped_frames_total', '丢弃的帧数', lambda: {
+    ("pipeline",): sum(q.dropped for q in (pipeline.infer_queue, pipeline.publish_queue)) if pipeline else 0,
+    ("websocket",): manager.skipped_total()
+}, labelnames=('where',), kind='counter')
+metrics.Gauge('monitor_websocket_clients', '已连接的 WebSocket 客户端数', lambda: len(manager.active_connections))
+metrics.Gauge('monitor_notification_queue_depth', '等待发送的通知数', lambda: notifier.dispatcher.qsize())
+metrics.Gauge('monitor_notification_dropped_total', '队列满时丢弃的通知数',
+              lambda: notifier.dispatcher.dropped, kind='counter')
+if worker_processes > 0:
+    metrics.Gauge('monitor_worker_inference_fps', '各推理进程最近 2 秒的推理帧率', lambda: {
+        (str(i),): stats.snapshot()["fps"] for i, stats in enumerate(multi_detector.worker_stats)
+    } if multi_detector is not None else {}, labelnames=('worker',))
+metrics.Gauge('monitor_ready', '启动是否完成（模型已加载、摄像头已打开）', lambda: int(startup.ready))
+
+# 视频线程与服务器的生命周期
+stop_event = threading.Event()
+video_thread = None
+startup_thread = None
+server = None  # 由 __main__ 创建的 uvicorn.Server，用 uvicorn main2:app 启动时为 None
+
+# 后台启动：加载模型和打开摄像头同时进行，都完成后开始采集检测
+# 多进程模式下模型在推理进程中加载，只有打开摄像头、启动进程池这一个阶段
+def run_startup():
+    loader = None
+    if worker_processes == 0:
+        loader = threading.Thread(target=startup.run, args=('model', load_models), name="model-loader",
+                                  daemon=True)
+        loader.start()
+    camera_ready = startup.run('workers' if worker_processes > 0 else 'camera', open_cameras)
+    if loader is not None:
+        loader.join()
+    if stop_event.is_set():
+        return
+
+    if not camera_ready:
+        print("\n错误: 无法打开摄像头!")
+        print("请检查:")
+        print("1. 如果使用 OBS 虚拟摄像头，请确保在 OBS 中已启动虚拟摄像机")
+        print("2. 如果使用物理摄像头，请确保未被其他程序占用")
+        print("3. 摄像头驱动是否正常")
+        startup.fail("无法打开摄像头")
+        request_shutdown()
+        return
+    if worker_processes == 0 and model is None:
+        startup.fail("模型加载失败")
+        request_shutdown()
+        return
+    if worker_processes == 0 and multi_detector is not None:
+        multi_detector.model = model
+        multi_detector.pose = pose_cascade
+
+    print("\n开始人物检测，检测到人时会发送报警通知和截图...")
+    start_video()
+    startup.set_ready()
+
+# 服务启动时在后台加载模型、打开摄像头，不等它们完成就开始接受请求（/ready 查看进度）；
+# 收到 Ctrl+C / SIGTERM 后由 uvicorn 触发关闭流程
+@asynccontextmanager
+async def lifespan(app):
+    global startup_thread
+    startup_thread = threading.Thread(target=run_startup, name="startup", daemon=True)
+    startup_thread.start()
+    yield
+    await asyncio.to_thread(stop_services)
 
 # 创建FastAPI应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -136,34 +504,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(FirstResponseMiddleware, tracker=startup)
 
 # WebSocket端点
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"新的WebSocket连接: {len(self.active_connections)} 个客户端")
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print(f"WebSocket连接断开: {len(self.active_connections)} 个客户端")
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"发送WebSocket消息失败: {e}")
-                self.disconnect(connection)
-
-manager = ConnectionManager()
+manager = ConnectionManager(stream_target_kbps, stream_max_total_kbps)
+encoder = StreamEncoder(stream_encode_budget)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # ws://host:8000/ws?format=binary：JPEG 二进制帧 + 小的元数据文本消息
+    # 不带参数时保持旧版 base64 JSON 格式，兼容现有前端
+    binary = websocket.query_params.get('format') == 'binary'
+    await manager.connect(websocket, binary)
     try:
         while True:
             # 等待客户端消息（保持连接）
@@ -171,136 +523,474 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# 已编码帧缓存，单摄像头模式的键为 None，多路模式按摄像头名称区分
+frame_caches = {}
+
+def get_frame_cache(camera=None):
+    cache = frame_caches.get(camera)
+    if cache is None:
+        cache = frame_caches.setdefault(camera, FrameCache())
+    return cache
+
+# 事件录像，与帧缓存一样按摄像头区分；未启用录像时返回 None
+recorders = {}
+
+def get_recorder(camera=None):
+    if not clip_recording_enabled:
+        return None
+    recorder = recorders.get(camera)
+    if recorder is None:
+        recorder = recorders.setdefault(camera, ClipRecorder(
+            clip_dir, camera, clip_pre_roll, clip_post_roll, clip_fps, quota_mb=clip_quota_mb))
+    return recorder
+
+# 按请求参数查找缓存，多路模式下默认第一路，未知摄像头返回 None
+def find_frame_cache(camera=None):
+    if multi_detector is None:
+        return get_frame_cache() if camera is None else None
+    names = [state.name for state in multi_detector.states]
+    if camera is None:
+        camera = names[0]
+    return get_frame_cache(camera) if camera in names else None
+
+# 观看者统计：没有人看画面时跳过画框和编码
+mjpeg_viewers = 0
+last_snapshot_request = 0.0
+SNAPSHOT_OVERLAY_SECONDS = 10  # 最近一次快照请求后继续编码、标注的秒数
+SNAPSHOT_WAIT_SECONDS = 2.0    # 快照请求等待新画面的最长时间
+SNAPSHOT_MAX_AGE = 0.5         # 还没有帧率统计时，缓存画面超过这个秒数视为过期
+
+# 录像按自己的帧率抽帧，只有到了抽帧时间才需要画面；多路模式不指定摄像头时看任意一路
+def recorder_wants_frame(camera=None):
+    if camera is None and multi_detector is not None:
+        return any(recorder.wants_frame() for recorder in list(recorders.values()))
+    recorder = recorders.get(camera)
+    return recorder is not None and recorder.wants_frame()
+
+# 是否需要基准画质的画面：MJPEG 观看者、最近的快照请求和录像共用这一份
+def base_frame_needed(camera=None):
+    return (mjpeg_viewers > 0 or time.monotonic() - last_snapshot_request < SNAPSHOT_OVERLAY_SECONDS or
+            recorder_wants_frame(camera))
+
+def overlay_needed(camera=None):
+    return show_window or bool(manager.active_connections) or base_frame_needed(camera)
+
+# MJPEG 视频流端点，浏览器 <img src="/video.mjpg"> 即可播放，无需 WebSocket 脚本
+# 多路模式下用 ?camera=cam1 选择摄像头
+@app.get("/video.mjpg")
+async def mjpeg_stream(camera: str = None):
+    cache = find_frame_cache(camera)
+    if cache is None:
+        return Response(status_code=404)
+
+    async def generate():
+        global mjpeg_viewers
+        mjpeg_viewers += 1
+        try:
+            seq = 0
+            while True:
+                frame = await cache.wait_newer(seq, timeout=5)
+                if frame is None:
+                    continue
+                seq = frame.seq
+                yield frame.mjpeg_part()
+        finally:
+            mjpeg_viewers -= 1
+
+    return StreamingResponse(generate(), media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}")
+
+# 最新一帧的 JPEG 快照
+# 无人观看时不编码基准画质，缓存中可能是很久以前的画面，也可能从未编码过：
+# 缓存的画面早于约两个帧间隔时，等待本次请求之后编码的新帧（请求本身会让视频线程开始编码），超时返回 503
+@app.get("/snapshot.jpg")
+async def snapshot(camera: str = None):
+    global last_snapshot_request
+    requested = time.time()
+    last_snapshot_request = time.monotonic()
+    cache = find_frame_cache(camera)
+    if cache is None:
+        return Response(status_code=503)
+    frame = cache.latest()
+    fps = frame_rate.snapshot()["fps"]
+    max_age = 2.0 / fps if fps > 0 else SNAPSHOT_MAX_AGE
+    if frame is None or requested - frame.meta.get("time", 0) > max_age:
+        frame = await cache.wait_newer(frame.seq if frame is not None else 0, timeout=SNAPSHOT_WAIT_SECONDS)
+    if frame is None:
+        return Response(status_code=503)
+    return Response(frame.jpeg, media_type="image/jpeg",
+                    headers={"Cache-Control": "no-store", "X-Frame-Seq": str(frame.seq)})
+
+# Prometheus 格式的监控指标：各阶段耗时直方图、FPS、丢帧、连接数、通知队列、CPU 和内存
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# 启动进度：各阶段耗时、首次响应 / 首次检测距进程启动的秒数；启动完成前返回 503
+@app.get("/ready")
+def read_ready():
+    return JSONResponse(startup.snapshot(), status_code=200 if startup.ready else 503)
+
 # 健康检查端点
 @app.get("/")
 def read_root():
+    if model is not None:
+        model_info = model.describe()
+    else:
+        model_info = multi_detector.describe_model() if worker_processes > 0 and multi_detector is not None else None
     return {
-        "status": "running",
+        "status": "running" if startup.ready else "starting",
         "message": "监控服务器运行中",
-        "person_count": latest_person_count
+        "person_count": latest_person_count,
+        "headless": headless,
+        "overlay": overlay_needed(),
+        "model": model_info,
+        "websocket": manager.snapshot(),
+        "stream": encoder.snapshot(),
+        "governor": governor.snapshot() if governor is not None else None,
+        "alerts": alert_engine.snapshot(),
+        "notifications": notifier.stats(),
+        "event_store": event_store.snapshot() if event_store is not None else None,
+        "recordings": {camera or "default": recorder.snapshot() for camera, recorder in recorders.items()},
+        "pipeline": pipeline.snapshot() if pipeline is not None else {"mode": pipeline_mode},
+        "multi_camera": multi_detector.snapshot() if multi_detector is not None else None,
+        "capture": cap.snapshot() if cap is not None else None,
+        "scheduler": scheduler.snapshot() if scheduler is not None and multi_detector is None else None,
+        "tiling": tiler.describe() if tiler is not None and multi_detector is None else None
     }
 
-# 视频流推送线程
-def video_stream_thread():
-    global latest_frame, latest_person_count, last_alert_time
+# 事件历史查询
+# 时间参数 start / end 可以是 Unix 时间戳或 ISO 格式（如 2024-05-01T08:00）
+def require_event_store():
+    if event_store is None:
+        raise HTTPException(status_code=404, detail="事件数据库未启用")
+    return event_store
+
+# 解析时间参数，格式不对时返回 400，而不是让 ValueError 变成 500
+def query_time(value, name):
+    try:
+        return parse_time(value)
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400,
+                            detail=f"参数 {name} 的时间格式无效: {value}（应为 Unix 时间戳或 ISO 格式，如 2024-05-01T08:00）")
+
+# 事件列表，按时间倒序；下一页把返回的 next_before_id 作为 before_id 传入
+@app.get("/events")
+def list_events(camera: str = None, event_type: str = Query(None, alias="type"), start: str = None,
+                end: str = None, limit: int = Query(50, ge=1, le=500), before_id: int = None):
+    return require_event_store().query_events(camera, event_type, query_time(start, 'start'),
+                                              query_time(end, 'end'), limit, before_id)
+
+@app.get("/events/{event_id}")
+def get_event(event_id: int):
+    event = require_event_store().get_event(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="事件不存在")
+    return event
+
+# 事件对应的截图 / 录像文件
+@app.get("/events/{event_id}/snapshot")
+def get_event_snapshot(event_id: int):
+    return event_file(event_id, "snapshot", "image/jpeg")
+
+@app.get("/events/{event_id}/clip")
+def get_event_clip(event_id: int):
+    return event_file(event_id, "clip", "video/mp4")
+
+def event_file(event_id, field, media_type):
+    event = require_event_store().get_event(event_id)
+    path = event.get(field) if event is not None else None
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(path, media_type=media_type)
+
+# 每小时统计：有人的秒数、平均 / 最大人数和各类事件数量
+@app.get("/stats/hourly")
+def hourly_stats(camera: str = None, start: str = None, end: str = None):
+    return require_event_store().hourly_counts(camera, query_time(start, 'start'), query_time(end, 'end'))
+
+# 逐秒人数，默认最近一小时
+@app.get("/stats/frames")
+def frame_stats(camera: str = None, start: str = None, end: str = None,
+                limit: int = Query(3600, ge=1, le=86400)):
+    start = query_time(start, 'start')
+    if start is None:
+        start = time.time() - 3600
+    return require_event_store().frame_stats(camera, start, query_time(end, 'end'), limit)
+
+# 单帧检测：推理、画框、报警，返回标注后的画面和人数
+# 画质调节：记录本帧（多路模式为一个 batch）的处理耗时，档位变化时换用预加载的模型，推流画质下限随之调整
+def apply_governor(seconds):
+    global model
+    if governor is None or not governor.record(seconds):
+        return
+    model = model_variants[governor.key()]
+    if multi_detector is not None:
+        multi_detector.model = model
+    encoder.set_min_floor(governor.current()["stream_floor"])
+
+# 无人观看时（overlay_needed() 为 False）只推理和报警，不画框
+def detect_persons(frame):
+    draw = overlay_needed()
+
+    # 运动门控：空闲且画面静止时跳过本帧推理，沿用上一次的人数
+    # CPU 超预算时画质调节按目标帧率限速，多余的帧同样跳过推理
+    # 先看画质调节：限速跳过的帧不计算运动，也不计入运动门控的推理次数
+    if ((governor is not None and not governor.due()) or
+            (scheduler is not None and not scheduler.should_infer(frame))):
+        if draw:
+            cv2.putText(frame, f"Person Count: {latest_person_count}",
+                        (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return frame, latest_person_count
+
+    # 使用 YOLO11 进行推理（普通检测），配置了 ROI / 分块时只检测对应区域
+    t = start = time.perf_counter()
+    detections = detect_frame(model, frame, tiler)
+    t = observe_stage('inference', t)
+    startup.mark('first_detection')
+
+    # 只检测人（person 类别通常是 0）
+    person_count = sum(len(persons) for persons in detections)
+
+    if scheduler is not None:
+        scheduler.report(person_count)
+
+    # 检测到人时交给报警引擎，由其去重、限流，并在后台保存截图、发送通知
+    if person_count > 0:
+        recorder = get_recorder()
+        clip = recorder.trigger('person') if recorder is not None else None
+        alert_engine.observe(None, None, 'person', frame, person_count, clip=clip)
+    t = observe_stage('postprocess', t)
+    apply_governor(t - start)
+    if not draw:
+        return frame, person_count
+
+    # 所有框一次性绘制
+    if tiler is not None:
+        tiler.draw_rois(frame)
+    for persons in detections:
+        draw_persons(frame, persons, "Person Detected", (0, 255, 0))
+
+    # 在画面左上角显示检测到的人数
+    cv2.putText(frame, f"Person Count: {person_count}",
+                (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
     
-    while cap.isOpened():
-        success, frame = cap.read()
+    # 显示截图状态：报警截图由后台线程在发送通知时保存，保存后的几秒内显示提示
+    if alert_engine.screenshot_saved_since(None, time.time() - SCREENSHOT_NOTICE_SECONDS):
+        cv2.putText(frame, "Screenshot Saved",
+                    (10, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+    observe_stage('draw', t)
+
+    return frame, person_count
+
+# 编码并推送一帧，返回 False 表示请求退出（按了 'q' 或服务器正在关闭）
+# 多路模式下 camera 为摄像头名称，消息中带上 camera 字段，每路单独一个窗口
+def publish_frame(frame, person_count, camera=None):
+    global latest_frame, latest_person_count
+
+    # 保存最新帧
+    latest_frame = frame
+    latest_person_count = person_count
+
+    if event_store is not None:
+        event_store.record_frame(camera, person_count)
+    frame_rate.record(0)
+
+    # 按需编码：只编码观看者需要的画质档位，每个档位只编码一次，所有同档客户端共享
+    # 没有 WebSocket / MJPEG 观看者、快照请求，录像也没到抽帧时间时完全不编码
+    try:
+        t = time.perf_counter()
+        recorder = get_recorder(camera)
+        wanted = manager.wanted_levels(encoder.floor)
+        meta = {
+            "person_count": person_count,
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "time": round(time.time(), 3)  # Unix 时间戳，客户端可据此计算推送延迟
+        }
+        if camera:
+            meta["camera"] = camera
+        frames = encode_for_clients(encoder, get_frame_cache(camera), frame, meta, wanted,
+                                    base_frame_needed(camera))
+        if frames:
+            t = observe_stage('encode', t)
+            # 同一份 JPEG 放入录像的预录缓冲区，无需再次编码
+            if recorder is not None and BASE_LEVEL in frames:
+                recorder.add_jpeg(frames[BASE_LEVEL].jpeg)
+            # 投递到服务器事件循环，由各客户端的发送协程异步推送
+            manager.publish(frames, wanted)
+            observe_stage('broadcast', t)
+    except Exception as e:
+        print(f"WebSocket推送失败: {e}")
+
+    # 显示画面（无界面模式下跳过）
+    if show_window:
+        window_name = f"YOLO11 Person Detection - {camera}" if camera else "YOLO11 Person Detection"
+        cv2.imshow(window_name, frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            request_shutdown()
+
+    return not stop_event.is_set()
+
+# 读取一帧并记录等待摄像头的时间；exclude 为仍在使用、不能被覆盖的帧（流水线模式）
+def read_camera(exclude=()):
+    t = time.perf_counter()
+    result = cap.read(exclude)
+    observe_stage('capture', t)
+    return result
+
+# 视频流推送线程（单线程模式，采集/推理/推送依次执行）
+def video_stream_thread():
+    while cap.isOpened() and not stop_event.is_set():
+        success, frame = read_camera()
         if not success:
             break
 
-        # 使用 YOLO11 进行推理（普通检测）
-        results = model(frame, verbose=False)
-
-        person_count = 0
-        current_time = 0
-        screenshot_saved = False
-
-        for r in results:
-            if r.boxes is not None:
-                # 获取检测框数据
-                boxes = r.boxes.xywh.cpu().numpy()  # [x, y, w, h]
-                classes = r.boxes.cls.cpu().numpy()  # 类别
-
-                for i, box in enumerate(boxes):
-                    x, y, w, h = box
-                    cls = int(classes[i])
-
-                    # 只检测人（person 类别通常是 0）
-                    if cls == 0:
-                        person_count += 1
-                        status = "Person Detected"
-                        color = (0, 255, 0)  # 绿色
-
-                        # 画框和文字显示
-                        cv2.rectangle(frame, (int(x - w / 2), int(y - h / 2)),
-                                      (int(x + w / 2), int(y + h / 2)), color, 2)
-                        cv2.putText(frame, f"{status}",
-                                    (int(x - w / 2), int(y - h / 2) - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-
-        # 检测到人时保存截图并发送报警
-        current_time = time.time()
-        
-        if person_count > 0:
-            # 检查是否需要发送报警（超过报警间隔）
-            if current_time - last_alert_time > alert_interval:
-                # 保存截图
-                timestamp = time.strftime('%Y%m%d_%H%M%S')
-                screenshot_path = os.path.join(screenshot_dir, f'detection_{timestamp}.jpg')
-                cv2.imwrite(screenshot_path, frame)
-                screenshot_saved = True
-                
-                # 构建报警消息
-                message = f"【人物检测报警】\n\n时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n状态: 检测到 {person_count} 人\n\n截图已保存到: {screenshot_path}\n\n请及时查看监控画面！"
-                
-                # 发送报警通知
-                notifier.send_notification(message, notification_config)
-                
-                last_alert_time = current_time
-                print(f"[{time.strftime('%H:%M:%S')}] 发送报警通知: 检测到 {person_count} 人")
-                print(f"[{time.strftime('%H:%M:%S')}] 截图已保存: {screenshot_path}")
-        else:
-            print(f"[{time.strftime('%H:%M:%S')}] 未检测到人")
-
-        # 在画面左上角显示检测到的人数
-        cv2.putText(frame, f"Person Count: {person_count}",
-                    (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        # 显示截图状态
-        if screenshot_saved:
-            cv2.putText(frame, "Screenshot Saved",
-                        (10, 60),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-            screenshot_saved = False
-
-        # 保存最新帧
-        latest_frame = frame
-        latest_person_count = person_count
-
-        # 压缩视频帧并发送到WebSocket
-        try:
-            # 压缩为JPEG
-            ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-            if ret:
-                # 转换为base64
-                frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                # 构建消息
-                ws_message = {
-                    "type": "video",
-                    "data": {
-                        "frame": frame_base64,
-                        "person_count": person_count,
-                        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                }
-                # 广播到所有WebSocket客户端
-                import asyncio
-                asyncio.run(manager.broadcast(ws_message))
-        except Exception as e:
-            print(f"WebSocket推送失败: {e}")
-
-        # 显示画面
-        cv2.imshow("YOLO11 Person Detection", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        frame, person_count = detect_persons(frame)
+        if not publish_frame(frame, person_count):
             break
 
     cap.release()
-    cv2.destroyAllWindows()
+    close_windows()
 
-if __name__ == "__main__":
-    # 启动视频流线程
-    video_thread = threading.Thread(target=video_stream_thread, daemon=True)
+# 视频流推送线程（流水线模式，采集/推理/推送各占一个线程）
+def pipeline_stream_thread():
+    global pipeline
+
+    pipeline = FramePipeline(
+        read_camera,
+        detect_persons,
+        lambda result: publish_frame(*result),
+        queue_size=pipeline_queue_size
+    )
+    pipeline.start()
+    pipeline.join()
+
+    cap.release()
+    close_windows()
+
+# 视频流推送线程（多路模式，各路最新帧合并为一次批量推理）
+def multi_camera_stream_thread():
+    global latest_person_count
+
+    keep_running = True
+    while keep_running and multi_detector.is_alive() and not stop_event.is_set():
+        # CPU 超预算时按目标帧率限速，等待期间各路只保留最新一帧
+        if governor is not None:
+            wait = governor.next_due()
+            if wait > 0:
+                time.sleep(wait)
+            governor.due()
+        start = time.perf_counter()
+        processed = multi_detector.tick(draw=overlay_needed())
+        if not processed:
+            time.sleep(0.005)
+            continue
+        apply_governor(time.perf_counter() - start)
+        startup.mark('first_detection')
+
+        current_time = time.time()
+        for state, frame in processed:
+            # 开始 / 延长该路的事件录像
+            clip = None
+            recorder = get_recorder(state.name)
+            if recorder is not None:
+                if state.fall_detected:
+                    clip = recorder.trigger('fall')
+                elif state.person_count > 0:
+                    clip = recorder.trigger('person')
+
+            # 报警引擎按摄像头分别去重、限流
+            fired = False
+            if state.fall_detected:
+                fired = alert_engine.observe(state.name, None, 'fall', frame, clip=clip)
+            if state.person_count > 0:
+                fired = alert_engine.observe(state.name, None, 'person', frame, state.person_count,
+                                             clip=clip) or fired
+            if fired:
+                state.last_alert_time = current_time
+
+            if overlay_needed(state.name):
+                cv2.putText(frame, f"{state.name} Person Count: {state.person_count}",
+                            (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            if not publish_frame(frame, state.person_count, state.name):
+                keep_running = False
+
+        latest_person_count = multi_detector.total_person_count()
+
+    close_windows()
+
+# 窗口要在创建它的视频线程中关闭
+def close_windows():
+    if show_window:
+        cv2.destroyAllWindows()
+
+# 服务器启动时调用：按模式启动视频流线程
+def start_video():
+    global video_thread
+
+    if multi_detector is not None:
+        stream_target = multi_camera_stream_thread
+    elif pipeline_mode == 'single':
+        stream_target = video_stream_thread
+    else:
+        stream_target = pipeline_stream_thread
+    video_thread = threading.Thread(target=stream_target, name="video-stream", daemon=True)
     video_thread.start()
-    
-    # 启动FastAPI服务器
+
+# 按 'q' 键时调用：停止视频线程并让服务器退出
+def request_shutdown():
+    stop_event.set()
+    if server is not None:
+        server.should_exit = True
+
+# 服务器关闭时调用：停止视频线程，再依次关闭录像、报警、通知和数据库
+def stop_services():
+    stop_event.set()
+    # 启动还没完成时等它结束（加载模型无法中途打断），再释放它打开的摄像头和进程
+    if startup_thread is not None:
+        startup_thread.join(timeout=30)
+    # 打断阻塞在读帧 / 重连上的采集
+    if cap is not None:
+        cap.release()
+    if pipeline is not None:
+        pipeline.stop()
+    if video_thread is not None:
+        video_thread.join(timeout=5)
+
+    # 停止采集和推理进程
+    if multi_detector is not None:
+        multi_detector.stop()
+
+    # 写完正在录制的事件录像
+    for recorder in recorders.values():
+        recorder.stop()
+
+    # 发出尚未合并发送的报警，并等待后台队列中的通知发送完毕
+    alert_engine.stop()
+    notifier.close()
+
+    # 报警事件写入后再关闭数据库
+    if event_store is not None:
+        event_store.stop()
+    print("监控服务已停止")
+
+if __name__ == "__main__":
+    # 启动FastAPI服务器，视频流线程随服务器启动和关闭
     print("\n启动监控服务器...")
     print("服务器地址: http://0.0.0.0:8000")
     print("WebSocket地址: ws://0.0.0.0:8000/ws")
     print("健康检查: http://0.0.0.0:8000/")
-    print("\n按 'q' 键退出程序\n")
-    
+    print("启动进度: http://0.0.0.0:8000/ready")
+    if show_window:
+        print("\n按 'q' 键或 Ctrl+C 退出程序\n")
+    else:
+        print("\n按 Ctrl+C 或发送 SIGTERM 退出程序\n")
+
     # 运行服务器
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=8000))
+    server.run()
+    if startup.error:
+        sys.exit(1)
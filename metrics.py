@@ -0,0 +1,259 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 各阶段耗时的桶边界（秒），覆盖 0.5 毫秒到 10 秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# 指标注册表：渲染为 Prometheus 文本格式
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def unregister(self, metric):
+        with self._lock:
+            if metric in self.metrics:
+                self.metrics.remove(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"采集指标 {metric.name} 失败: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# 直方图：observe() 只做一次二分查找和三次累加，热路径上开销约 1 微秒
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.observations = 0
+        self._children = {}  # 标签值 -> [各桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labelvalues)
+            if child is None:
+                child = self._children[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            child[0][index] += 1
+            child[1] += value
+            child[2] += 1
+            self.observations += 1
+
+    def total(self):
+        with self._lock:
+            return sum(child[1] for child in self._children.values())
+
+    def samples(self):
+        with self._lock:
+            children = {k: ([*v[0]], v[1], v[2]) for k, v in self._children.items()}
+        for labelvalues, (counts, total, count) in sorted(children.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, labelvalues, ('le', _format_value(float(bound)))),
+                       cumulative)
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum", labels, round(total, 6)
+            yield f"{self.name}_count", labels, count
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+# 抓取时才求值的指标：func 返回一个数值，或 {标签值元组: 数值}
+# 热路径上零开销，适合 FPS、连接数、队列长度这类已有统计
+class Gauge:
+    def __init__(self, name, help, func, labelnames=(), kind='gauge', registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        if registry is not None:
+            registry.register(self)
+
+    def samples(self):
+        value = self.func()
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for labelvalues, v in sorted(value.items()):
+                yield self.name, _format_labels(self.labelnames, labelvalues), v
+        else:
+            yield self.name, '', value
+
+
+# ---------- 热路径各阶段耗时 ----------
+
+STAGE_SECONDS = Histogram('monitor_stage_seconds', '热路径各阶段耗时（秒）', ('stage',))
+NOTIFICATION_SECONDS = Histogram('monitor_notification_send_seconds', '单次通知发送耗时（秒）',
+                                 ('channel', 'result'))
+
+
+# 记录从 start 到现在的阶段耗时，返回当前时间，便于连续计时：
+#   t = time.perf_counter(); ...; t = observe_stage('inference', t); ...; t = observe_stage('draw', t)
+def observe_stage(stage, start):
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - start, stage)
+    return now
+
+
+# 测量本机上一次 observe_stage 的开销（秒）
+def measure_overhead(runs=20000):
+    probe = Histogram('probe', '', ('stage',), registry=None)
+    start = time.perf_counter()
+    for _ in range(runs):
+        now = time.perf_counter()
+        probe.observe(now - start, 'probe')
+    return (time.perf_counter() - start) / runs
+
+
+_overhead_per_observation = None
+
+
+# 埋点开销占被测代码总耗时的比例，目标低于 1%
+def overhead_ratio():
+    global _overhead_per_observation
+    if _overhead_per_observation is None:
+        _overhead_per_observation = measure_overhead()
+    measured = STAGE_SECONDS.total()
+    if measured <= 0:
+        return 0.0
+    return round(_overhead_per_observation * STAGE_SECONDS.observations / measured, 6)
+
+
+Gauge('monitor_instrumentation_overhead_ratio', '埋点开销占被测阶段总耗时的比例', overhead_ratio)
+
+
+# ---------- 进程资源 ----------
+
+if psutil is not None:
+    _process = psutil.Process()
+    _process.cpu_percent(None)
+
+    Gauge('process_cpu_percent', '进程 CPU 占用率（自上次抓取以来，单核为 100）',
+          lambda: _process.cpu_percent(None))
+    Gauge('process_cpu_seconds_total', '进程累计 CPU 时间（秒）',
+          lambda: round(sum(_process.cpu_times()[:2]), 3), kind='counter')
+    Gauge('process_resident_memory_bytes', '进程常驻内存（字节）', lambda: _process.memory_info().rss)
+    Gauge('process_threads', '进程线程数', lambda: _process.num_threads())
+    Gauge('system_cpu_percent', '整机 CPU 占用率', lambda: psutil.cpu_percent(None))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# 没有 FastAPI 的脚本（如 main.py）用独立的小型 HTTP 服务暴露 /metrics，
+# 传入 startup（StartupTracker）时同时提供 /ready
+class _MetricsHandler(BaseHTTPRequestHandler):
+    startup = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            self._send(200, CONTENT_TYPE, render().encode('utf-8'))
+        elif path == '/ready' and self.startup is not None:
+            body = json.dumps(self.startup.snapshot(), ensure_ascii=False).encode('utf-8')
+            self._send(200 if self.startup.ready else 503, 'application/json', body)
+        else:
+            self.send_error(404)
+            return
+        if self.startup is not None:
+            self.startup.mark('first_response')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0', startup=None):
+    handler = type('MetricsHandler', (_MetricsHandler,), {'startup': startup})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"监控指标: http://{host}:{port}/metrics")
+    if startup is not None:
+        print(f"启动进度: http://{host}:{port}/ready")
+    return server
@@ -0,0 +1,220 @@
+import threading
+import time
+
+import cv2
+
+from capture import Capture
+from metrics import observe_stage
+from pipeline import StageStats
+from postprocess import single_frame_fall, has_keypoints, draw_persons
+from tiling import TiledDetector
+
+
+# 解析配置里的视频源：纯数字视为摄像头索引，其余（RTSP / 文件路径）原样交给 OpenCV
+def parse_source(source):
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source.strip())
+    return source
+
+
+def is_file_source(source):
+    return isinstance(source, str) and '://' not in source
+
+
+# 单路视频源：后台线程持续读帧，只保留最新一帧，避免摄像头缓冲区堆积旧画面
+# 帧读入 3 个复用缓冲区轮流使用：最新帧、正在被检测的帧、正在写入的帧互不覆盖
+class CameraSource:
+    def __init__(self, name, source, backend='auto', reconnect_delay=1.0):
+        self.name = name
+        self.source = parse_source(source)
+        self.cap = Capture(self.source, backend, ring_size=3, reconnect_delay=reconnect_delay)
+        self.alive = False
+        self._frame = None
+        self._taken = None  # 最近一次 latest() 交出、可能仍在使用的帧
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._frame_interval = 0
+
+    def start(self):
+        if not self.cap.open():
+            print(f"[{self.name}] 无法打开视频源: {self.source}")
+            return False
+
+        # 文件源按原始帧率回放，否则会瞬间读完
+        if is_file_source(self.source):
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            if fps and fps > 0:
+                self._frame_interval = 1.0 / fps
+
+        self.alive = True
+        self._thread = threading.Thread(target=self._reader_loop, name=f"camera-{self.name}", daemon=True)
+        self._thread.start()
+        print(f"[{self.name}] 视频源已打开: {self.source}")
+        return True
+
+    def stop(self):
+        self.alive = False
+        self.cap.release()  # 同时打断正在进行的重连
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def latest(self):
+        with self._lock:
+            self._taken = self._frame
+            return self._seq, self._frame
+
+    def _reader_loop(self):
+        while self.alive:
+            start = time.monotonic()
+            # 网络流 / 摄像头断开时 read() 内部自动重连，只有文件读完或停止时才失败
+            with self._lock:
+                held = (self._frame, self._taken)
+            success, frame = self.cap.read(exclude=held)
+            if not success:
+                print(f"[{self.name}] 视频源已结束，停止该路")
+                self.alive = False
+                break
+            with self._lock:
+                self._frame = frame
+                self._seq += 1
+            if self._frame_interval:
+                remaining = self._frame_interval - (time.monotonic() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        self.cap.release()
+
+
+# 每路摄像头各自的检测状态（人数、跌倒状态、报警冷却）
+class CameraState:
+    def __init__(self, name, scheduler=None, tiler=None):
+        self.name = name
+        self.scheduler = scheduler  # 运动门控调度器，为 None 时每帧都推理
+        self.tiler = tiler or TiledDetector()  # ROI / 分块，默认整幅画面作为一块
+        self.person_count = 0
+        self.fall_detected = False
+        self.last_alert_time = 0
+        self.last_seq = 0
+        self.frames = 0
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "person_count": self.person_count,
+            "fall_detected": self.fall_detected,
+            "frames": self.frames,
+            "last_alert_time": self.last_alert_time,
+            "scheduler": self.scheduler.snapshot() if self.scheduler is not None else None,
+            "tiling": self.tiler.describe()
+        }
+
+
+# 统计检测结果，draw 为 True 时在画面上标注，返回 (人数, 是否有人跌倒)
+# 没有关键点的人只统计人数；有关键点（姿态模型 / 两级检测）的人额外使用单帧跌倒判定规则
+def analyze_result(frame, persons, draw=True):
+    falls = single_frame_fall(persons) & has_keypoints(persons)
+    if draw:
+        draw_persons(frame, persons[~falls], "Person Detected", (0, 255, 0))
+        draw_persons(frame, persons[falls], "FALL DETECTED!", (0, 0, 255))
+    return len(persons), bool(falls.any())
+
+
+# 多路摄像头批量检测：每个 tick 收集各路的最新帧，拼成一个 batch 调用一次 YOLO，
+# 再把结果分发回各路状态。N 路共用一个模型实例，CPU 上比 N 个进程各自加载模型快得多
+class MultiCameraDetector:
+    def __init__(self, model, sources, scheduler_factory=None, tiler_factory=None,
+                 capture_backend='auto', reconnect_delay=1.0, pose=None):
+        self.model = model
+        self.pose = pose  # 两级检测的 PoseCascade，为 None 时只用检测模型的结果
+        self.sources = []
+        self.states = []
+        for i, source in enumerate(sources):
+            name = f"cam{i}"
+            self.sources.append(CameraSource(name, source, capture_backend, reconnect_delay))
+            scheduler = scheduler_factory() if scheduler_factory is not None else None
+            tiler = tiler_factory(name) if tiler_factory is not None else None
+            self.states.append(CameraState(name, scheduler, tiler))
+        self.batch_stats = StageStats()
+        self.frame_stats = StageStats()
+
+    def start(self):
+        opened = [source.start() for source in self.sources]
+        return any(opened)
+
+    def stop(self):
+        for source in self.sources:
+            source.stop()
+
+    def is_alive(self):
+        return any(source.alive for source in self.sources)
+
+    def total_person_count(self):
+        return sum(state.person_count for state in self.states)
+
+    # 执行一次批量推理，返回本次处理过的 [(state, 标注后的画面), ...]；没有新帧时返回空列表
+    # 被运动门控跳过的帧不进入 batch，原样返回并沿用该路上一次的检测状态
+    # 配置了 ROI / 分块的摄像头贡献多张裁剪图，所有摄像头的裁剪图仍合并为一次调用
+    # draw 为 False 时（无人观看）只更新状态，不在画面上标注
+    def tick(self, draw=True):
+        batch = []
+        skipped = []
+        for source, state in zip(self.sources, self.states):
+            seq, frame = source.latest()
+            if frame is None or seq == state.last_seq:
+                continue
+            state.last_seq = seq
+            if state.scheduler is not None and not state.scheduler.should_infer(frame):
+                skipped.append((state, frame))
+                continue
+            batch.append((state, frame))
+
+        if not batch:
+            return skipped
+
+        start = time.monotonic()
+        plans = []
+        images = []
+        for state, frame in batch:
+            tiles, crops = state.tiler.plan(frame, state.tiler.tile_size_for(self.model))
+            plans.append(tiles)
+            images += crops
+        t = time.perf_counter()
+        results = self.model(images, verbose=False)
+        t = observe_stage('inference', t)
+
+        detections = []
+        offset = 0
+        for (state, frame), tiles in zip(batch, plans):
+            detections.append(state.tiler.merge(results[offset:offset + len(tiles)], tiles))
+            offset += len(tiles)
+
+        # 各路检测到的人一起裁剪，合并成一次姿态推理
+        if self.pose is not None:
+            self.pose.estimate([(frame, persons) for (_, frame), persons in zip(batch, detections)])
+            t = observe_stage('pose', t)
+
+        processed = []
+        for (state, frame), persons in zip(batch, detections):
+            if draw:
+                state.tiler.draw_rois(frame)
+            state.person_count, state.fall_detected = analyze_result(frame, persons, draw)
+            state.frames += 1
+            if state.scheduler is not None:
+                state.scheduler.report(state.person_count)
+            processed.append((state, frame))
+        observe_stage('postprocess', t)
+
+        duration = time.monotonic() - start
+        self.batch_stats.record(duration)
+        for _ in processed:
+            self.frame_stats.record(duration / len(processed))
+        return processed + skipped
+
+    def snapshot(self):
+        return {
+            "mode": "multi_camera",
+            "batch": self.batch_stats.snapshot(),
+            "total_fps": self.frame_stats.snapshot()["fps"],
+            "pose": self.pose.snapshot() if self.pose is not None else None,
+            "cameras": [state.to_dict() for state in self.states]
+        }
@@ -1,14 +1,132 @@
-import requests
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import queue
+import threading
 import time
+from metrics import NOTIFICATION_SECONDS
+
+# 后台通知分发器：有界队列 + 工作线程池，失败按指数退避重试
+# 调用方只负责入队，立即返回，网络慢或 webhook 卡住都不会阻塞视频处理线程
+class NotificationDispatcher:
+    def __init__(self, send_func, workers=2, queue_size=100, max_retries=3, backoff=1.0):
+        self.send_func = send_func  # (channel, message, config) -> bool
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.dropped = 0
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"notify-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # 入队，队列满时丢弃最旧的一条，保证最新的报警能发出去
+    def submit(self, channel, message, config):
+        job = (channel, message, config, time.monotonic())
+        while True:
+            try:
+                self._queue.put_nowait(job)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    with self._lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    # 等待队列中的通知全部处理完，主要用于退出前
+    def flush(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _worker_loop(self):
+        while True:
+            channel, message, config, enqueued_at = self._queue.get()
+            try:
+                self._deliver(channel, message, config, enqueued_at)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, channel, message, config, enqueued_at):
+        attempts = 0
+        success = False
+        while True:
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                success = self.send_func(channel, message, config)
+            except Exception as e:
+                print(f"{channel} 通知发送异常: {e}")
+                success = False
+            NOTIFICATION_SECONDS.observe(time.perf_counter() - start, channel, 'ok' if success else 'error')
+            if success or attempts > self.max_retries:
+                break
+            delay = self.backoff * (2 ** (attempts - 1))
+            print(f"{channel} 通知发送失败，{delay:.1f} 秒后第 {attempts} 次重试")
+            time.sleep(delay)
+
+        latency = time.monotonic() - enqueued_at
+        with self._lock:
+            stats = self._stats.setdefault(channel, {
+                "sent": 0, "failed": 0, "retries": 0,
+                "last_latency_ms": 0.0, "max_latency_ms": 0.0, "total_latency_ms": 0.0
+            })
+            stats["sent" if success else "failed"] += 1
+            stats["retries"] += attempts - 1
+            latency_ms = latency * 1000
+            stats["last_latency_ms"] = round(latency_ms, 1)
+            stats["max_latency_ms"] = round(max(stats["max_latency_ms"], latency_ms), 1)
+            stats["total_latency_ms"] += latency_ms
+
+    def snapshot(self):
+        with self._lock:
+            channels = {}
+            for channel, stats in self._stats.items():
+                delivered = stats["sent"] + stats["failed"]
+                channels[channel] = {
+                    "sent": stats["sent"],
+                    "failed": stats["failed"],
+                    "retries": stats["retries"],
+                    "avg_latency_ms": round(stats["total_latency_ms"] / delivered, 1) if delivered else 0.0,
+                    "last_latency_ms": stats["last_latency_ms"],
+                    "max_latency_ms": stats["max_latency_ms"]
+                }
+            return {
+                "queue_depth": self._queue.qsize(),
+                "dropped": self.dropped,
+                "channels": channels
+            }
 
 class NotificationManager:
-    def __init__(self):
+    def __init__(self, workers=2, queue_size=100, max_retries=3, backoff=1.0):
         self.last_notification_time = 0
         self.notification_interval = 300  # 5分钟内不重复通知
 
+        # 复用的 HTTP 会话（keep-alive 连接池），避免每次报警重新建立 TLS 连接；
+        # 第一次发 webhook 时才创建，没配置 webhook 时启动不用导入 requests
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._pool_size = max(4, workers)
+
+        # 复用的 SMTP 连接，发送前用 NOOP 检查是否仍然可用
+        self._smtp = None
+        self._smtp_key = None
+        self._smtp_lock = threading.Lock()
+
+        self.dispatcher = NotificationDispatcher(self._send_channel, workers, queue_size, max_retries, backoff)
+
     def should_notify(self):
         current_time = time.time()
         if current_time - self.last_notification_time > self.notification_interval:
@@ -28,7 +146,7 @@ class NotificationManager:
                     "text": message
                 }
             }
-            response = requests.post(webhook_url, json=data, timeout=10)
+            response = self.session.post(webhook_url, json=data, timeout=10)
             if response.status_code == 200:
                 result = response.json()
                 if result.get('code') == 0:
@@ -56,7 +174,7 @@ class NotificationManager:
                     "content": message
                 }
             }
-            response = requests.post(webhook_url, json=data, timeout=10)
+            response = self.session.post(webhook_url, json=data, timeout=10)
             if response.status_code == 200:
                 print(f"企业微信通知发送成功: {message}")
                 return True
@@ -81,7 +199,37 @@ class NotificationManager:
             print(f"短信通知发送异常: {e}")
             return False
 
-    def send_email(self, message, to_email=None, from_email=None, smtp_password=None, smtp_server="smtp.qq.com"):
+    # 获取可复用的 SMTP 连接，连接失效或账号变化时重新登录
+    def _get_smtp(self, from_email, smtp_password, smtp_server, smtp_port, use_tls):
+        key = (smtp_server, smtp_port, from_email)
+        if self._smtp is not None and self._smtp_key == key:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=10)
+        if use_tls:
+            server.starttls()
+        if smtp_password:
+            server.login(from_email, smtp_password)
+        self._smtp = server
+        self._smtp_key = key
+        return server
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._smtp = None
+        self._smtp_key = None
+
+    def send_email(self, message, to_email=None, from_email=None, smtp_password=None, smtp_server="smtp.qq.com",
+                   smtp_port=587, use_tls=True):
         if not to_email or not from_email or not smtp_password:
             print("未配置邮件参数，跳过邮件通知")
             return False
@@ -94,11 +242,14 @@ class NotificationManager:
 
             msg.attach(MIMEText(message, 'plain', 'utf-8'))
 
-            server = smtplib.SMTP(smtp_server, 587)
-            server.starttls()
-            server.login(from_email, smtp_password)
-            server.sendmail(from_email, to_email, msg.as_string())
-            server.quit()
+            with self._smtp_lock:
+                try:
+                    server = self._get_smtp(from_email, smtp_password, smtp_server, smtp_port, use_tls)
+                    server.sendmail(from_email, to_email, msg.as_string())
+                except Exception:
+                    # 连接可能已损坏，丢弃后由重试重新建立
+                    self._close_smtp()
+                    raise
 
             print(f"邮件通知发送成功: {message}")
             return True
@@ -106,11 +257,61 @@ class NotificationManager:
             print(f"邮件通知发送异常: {e}")
             return False
 
+    # 由后台工作线程调用，按渠道发送一条通知
+    def _send_channel(self, channel, message, config):
+        if channel == 'feishu':
+            return self.send_feishu(message, config['feishu_webhook'])
+        if channel == 'wechat':
+            return self.send_wechat(message, config['wechat_webhook'])
+        if channel == 'sms':
+            return self.send_sms(message, config['sms_phone'], config['sms_api_key'])
+        if channel == 'email':
+            return self.send_email(
+                message,
+                config['email_to'],
+                config['email_from'],
+                config['email_password'],
+                config.get('smtp_server', 'smtp.qq.com'),
+                config.get('smtp_port', 587),
+                config.get('smtp_starttls', True)
+            )
+        print(f"未知的通知渠道: {channel}")
+        return False
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def stats(self):
+        return self.dispatcher.snapshot()
+
+    # 退出前等待队列中的通知发完
+    def close(self, timeout=10):
+        self.dispatcher.flush(timeout)
+        with self._smtp_lock:
+            self._close_smtp()
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+
     def send_notification(self, message, config=None):
         if not self.should_notify():
             print("通知间隔未到，跳过本次通知")
             return
 
+        self.dispatch(message, config)
+
+    # 不经过 notification_interval 限流直接发送，频率由调用方控制（如 AlertEngine 的令牌桶）
+    def dispatch(self, message, config=None):
         if config is None:
             config = {}
 
@@ -121,24 +322,19 @@ class NotificationManager:
         print(f"内容: {message}")
         print(f"{'='*50}\n")
 
+        # 各渠道分别入队，由后台线程池发送，这里立即返回
         # 发送飞书通知（优先）
         if config.get('feishu_webhook'):
-            self.send_feishu(message, config['feishu_webhook'])
+            self.dispatcher.submit('feishu', message, config)
 
         # 发送企业微信通知
         if config.get('wechat_webhook'):
-            self.send_wechat(message, config['wechat_webhook'])
+            self.dispatcher.submit('wechat', message, config)
 
         # 发送短信通知
         if config.get('sms_phone') and config.get('sms_api_key'):
-            self.send_sms(message, config['sms_phone'], config['sms_api_key'])
+            self.dispatcher.submit('sms', message, config)
 
         # 发送邮件通知
         if config.get('email_to') and config.get('email_from') and config.get('email_password'):
-            self.send_email(
-                message,
-                config['email_to'],
-                config['email_from'],
-                config['email_password'],
-                config.get('smtp_server', 'smtp.qq.com')
-            )
+            self.dispatcher.submit('email', message, config)
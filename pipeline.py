@@ -0,0 +1,184 @@
+import collections
+import threading
+import time
+
+
+# 有界"丢弃最旧"队列：生产者永不阻塞，队列满时直接丢掉最旧的一项
+# 用于阶段之间传递帧，保证下游拿到的永远是最新画面
+# on_drop(item) 在丢弃时调用，用于释放被丢弃项占用的资源
+class LatestQueue:
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = max(1, int(maxsize))
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(dropped)
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed, timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self):
+        return len(self._items)
+
+
+# 单个阶段的统计：滑动窗口内的 FPS 和平均耗时
+class StageStats:
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._samples = collections.deque()  # (完成时间, 耗时)
+        self._lock = threading.Lock()
+
+    def record(self, duration):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._samples.append((now, duration))
+            while self._samples and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            durations = [d for t, d in self._samples if now - t <= self.window]
+        avg_ms = sum(durations) / len(durations) * 1000 if durations else 0.0
+        return {
+            "fps": round(len(durations) / self.window, 1),
+            "avg_ms": round(avg_ms, 1),
+            "frames": self.count
+        }
+
+
+# 采集 -> 推理 -> 编码/推送 三级流水线
+# 每一级独立线程，级间用 LatestQueue 连接：推理慢于摄像头时旧帧被丢弃，
+# 端到端延迟始终有界，摄像头缓冲区也不会堆积过期画面
+# 采集到推送完成之前帧一直被持有：read_frame 收到所有持有中的帧作为 exclude，
+# 采集端（复用缓冲区的 Capture）不会把新画面解码到仍在推理、画框或推送的帧上
+class FramePipeline:
+    def __init__(self, read_frame, infer, publish, queue_size=1):
+        self.read_frame = read_frame  # exclude -> (success, frame)
+        self.infer = infer            # frame -> result
+        self.publish = publish        # result -> 返回 False 表示请求停止
+        self.infer_queue = LatestQueue(queue_size, on_drop=lambda item: self._release(item[0]))
+        self.publish_queue = LatestQueue(queue_size, on_drop=lambda item: self._release(item[0]))
+        self._held = {}  # 帧序号 -> 采集到、尚未推送完成的帧
+        self._held_lock = threading.Lock()
+        self.stats = {
+            "capture": StageStats(),
+            "inference": StageStats(),
+            "publish": StageStats()
+        }
+        self.end_to_end = StageStats()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for name, target in (("capture", self._capture_loop),
+                             ("inference", self._inference_loop),
+                             ("publish", self._publish_loop)):
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        self.infer_queue.close()
+        self.publish_queue.close()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def is_running(self):
+        return not self._stop_event.is_set()
+
+    def held_frames(self):
+        with self._held_lock:
+            return tuple(self._held.values())
+
+    def _release(self, seq):
+        with self._held_lock:
+            self._held.pop(seq, None)
+
+    def snapshot(self):
+        return {
+            "mode": "pipeline",
+            "stages": {name: stats.snapshot() for name, stats in self.stats.items()},
+            "queues": {
+                "inference": {"depth": self.infer_queue.qsize(), "dropped": self.infer_queue.dropped},
+                "publish": {"depth": self.publish_queue.qsize(), "dropped": self.publish_queue.dropped}
+            },
+            "latency_ms": self.end_to_end.snapshot()["avg_ms"]
+        }
+
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            success, frame = self.read_frame(self.held_frames())
+            if not success:
+                print("摄像头读取失败，停止流水线")
+                break
+            captured_at = time.monotonic()
+            self.stats["capture"].record(captured_at - start)
+            seq += 1
+            with self._held_lock:
+                self._held[seq] = frame
+            self.infer_queue.put((seq, captured_at, frame))
+        self.stop()
+
+    def _inference_loop(self):
+        while not self._stop_event.is_set():
+            item = self.infer_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame = item
+            start = time.monotonic()
+            try:
+                result = self.infer(frame)
+            except Exception as e:
+                print(f"推理阶段异常: {e}")
+                self._release(seq)
+                continue
+            self.stats["inference"].record(time.monotonic() - start)
+            self.publish_queue.put((seq, captured_at, result))
+
+    def _publish_loop(self):
+        while not self._stop_event.is_set():
+            item = self.publish_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, result = item
+            start = time.monotonic()
+            try:
+                keep_running = self.publish(result)
+            except Exception as e:
+                print(f"推送阶段异常: {e}")
+                continue
+            finally:
+                self._release(seq)
+            finished_at = time.monotonic()
+            self.stats["publish"].record(finished_at - start)
+            self.end_to_end.record(finished_at - captured_at)
+            if keep_running is False:
+                self.stop()
@@ -0,0 +1,123 @@
+import sys
+
+import cv2
+import numpy as np
+
+NUM_KEYPOINTS = 17
+
+
+# 不主动导入 torch：结果是张量时 torch 必然已由 ultralytics 导入
+def _is_tensor(x):
+    torch = sys.modules.get('torch')
+    return torch is not None and isinstance(x, torch.Tensor)
+
+
+# 每个人一条记录的紧凑结构化数组
+PERSON_DTYPE = np.dtype([
+    ('xyxy', np.float32, (4,)),           # 左上角、右下角
+    ('xywh', np.float32, (4,)),           # 中心点、宽高
+    ('conf', np.float32),
+    ('track_id', np.int32),               # 未跟踪时为 -1
+    ('aspect_ratio', np.float32),         # 宽 / 高
+    ('vertical_dist', np.float32),        # 脚踝平均高度 - 鼻子高度，无关键点时为 NaN
+    ('keypoints', np.float32, (NUM_KEYPOINTS, 3))  # 无关键点时全为 0（置信度 0）
+])
+
+
+# 从一个 YOLO 结果中提取所有人
+# 检测框和关键点先在设备上拼成一个张量，只做一次设备到主机的拷贝，
+# 之后用 NumPy 掩码一次性过滤类别并计算所有人的几何特征，人数多少开销几乎不变
+def extract_persons(r, person_class=0):
+    if r.boxes is None or len(r.boxes) == 0:
+        return np.zeros(0, dtype=PERSON_DTYPE)
+
+    data = r.boxes.data  # [x1, y1, x2, y2, (track_id), conf, cls]
+    box_cols = data.shape[1]
+    kpts = r.keypoints.data if r.keypoints is not None and len(r.keypoints) == len(r.boxes) else None
+    if kpts is not None and kpts.shape[1] != NUM_KEYPOINTS:
+        kpts = None
+
+    if kpts is not None:
+        flat = kpts.reshape(kpts.shape[0], -1)
+        if _is_tensor(data):
+            data = sys.modules['torch'].cat([data, flat.to(data.dtype)], dim=1)
+        else:
+            data = np.concatenate([data, flat], axis=1)
+    if _is_tensor(data):
+        data = data.cpu().numpy()  # 唯一一次设备到主机拷贝
+    arr = np.asarray(data, dtype=np.float32)
+
+    arr = arr[arr[:, box_cols - 1] == person_class]
+    n = len(arr)
+    persons = np.zeros(n, dtype=PERSON_DTYPE)
+    if n == 0:
+        return persons
+
+    xyxy = arr[:, :4]
+    wh = xyxy[:, 2:] - xyxy[:, :2]
+    persons['xyxy'] = xyxy
+    persons['xywh'][:, :2] = xyxy[:, :2] + wh / 2
+    persons['xywh'][:, 2:] = wh
+    persons['conf'] = arr[:, box_cols - 2]
+    persons['track_id'] = arr[:, 4].astype(np.int32) if box_cols == 7 else -1
+    persons['aspect_ratio'] = wh[:, 0] / np.maximum(wh[:, 1], 1e-6)
+
+    if kpts is not None:
+        dims = kpts.shape[2]
+        k = arr[:, box_cols:].reshape(n, NUM_KEYPOINTS, dims)
+        persons['keypoints'][:, :, :dims] = k
+        if dims == 2:
+            persons['keypoints'][:, :, 2] = 1.0
+        # 鼻子(index 0) 与两只脚踝(index 15, 16) 平均高度的垂直距离
+        persons['vertical_dist'] = (k[:, 15, 1] + k[:, 16, 1]) / 2 - k[:, 0, 1]
+    else:
+        persons['vertical_dist'] = np.nan
+
+    return persons
+
+
+# 单帧检测：推理并提取所有人，返回 [人员数组, ...]
+# track 为 True 时跨帧跟踪（跌倒判定需要跟踪编号）；配置了 ROI / 分块（tiler）时只检测对应区域
+# main.py、main2.py 和 benchmark.py 共用，测出的耗时与实际运行一致
+def detect_frame(model, frame, tiler=None, track=False):
+    if tiler is not None:
+        return [tiler.track(model, frame) if track else tiler.detect(model, frame)]
+    if track:
+        results = model.track(frame, persist=True, verbose=False)
+    else:
+        results = model(frame, verbose=False)
+    return [extract_persons(r) for r in results]
+
+
+# 单帧跌倒规则（长宽比或鼻子-脚踝距离），用于没有跟踪编号的场景
+def single_frame_fall(persons):
+    heights = persons['xywh'][:, 3]
+    return (persons['aspect_ratio'] > 1.2) | (persons['vertical_dist'] < heights * 0.3)
+
+
+def has_keypoints(persons):
+    return ~np.isnan(persons['vertical_dist'])
+
+
+# 把裁剪图上的坐标平移回整幅画面（原地修改），未检出的关键点（置信度 0）保持为 0
+def offset_persons(persons, dx, dy):
+    if len(persons) == 0 or (dx == 0 and dy == 0):
+        return persons
+    shift = np.array([dx, dy], dtype=np.float32)
+    persons['xyxy'] += np.tile(shift, 2)
+    persons['xywh'][:, :2] += shift
+    visible = persons['keypoints'][:, :, 2] > 0
+    persons['keypoints'][:, :, :2] += visible[:, :, None] * shift
+    return persons
+
+
+# 用同一种颜色和文字标注一组人：所有框一次 polylines 调用画完
+def draw_persons(frame, persons, label, color):
+    if len(persons) == 0:
+        return
+    corners = persons['xyxy'].astype(np.int32)
+    polygons = corners[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    cv2.polylines(frame, list(polygons), True, color, 2)
+    for x1, y1 in corners[:, :2].tolist():
+        cv2.putText(frame, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from cascade import box_iou
+
+
+# 关键帧检测 + 光流外推
+# 只在关键帧上跑完整的检测（和姿态估计），中间帧在缩小的灰度图上用稀疏光流（Lucas-Kanade）
+# 跟踪每个人的关键点和框内角点：关键点按各自的光流移动，人框按所有点位移的中位数平移，跟踪编号保持不变。
+# 每个点做前向-后向一致性检查，跟丢的点太多（外推不可信）或位移过大（动作剧烈，如正在跌倒）时提前重新检测
+class KeyframePropagator:
+    def __init__(self, interval=3, min_confidence=0.5, motion_spike=0.1, keypoint_conf=0.3,
+                 points_per_person=12, max_width=640, fb_threshold=1.0):
+        self.interval = max(1, int(interval))  # 每 interval 帧至少检测一次
+        self.min_confidence = min_confidence    # 每个人跟踪成功的点所占比例的下限
+        self.motion_spike = motion_spike        # 单帧位移超过人框高度的该比例时重新检测
+        self.keypoint_conf = keypoint_conf
+        self.points_per_person = points_per_person
+        self.max_width = max_width
+        self.fb_threshold = fb_threshold        # 前向-后向误差上限（缩小后的像素）
+        self.lk_params = dict(winSize=(21, 21), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+        self.keyframes = 0
+        self.propagated = 0
+        self.redetects = {"confidence": 0, "motion": 0}
+        self.confidence = 1.0
+        self._gray = None
+        self._scale = 1.0
+        self._persons = None
+        self._points = None    # (P, 2) 缩小后画面中的坐标
+        self._owner = None     # (P,) 点属于第几个人
+        self._kp_index = None  # (P,) 关键点编号，框内角点为 -1
+        self._since = 0
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.max_width / float(w))
+        if scale < 1.0:
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return gray, scale
+
+    # 关键帧：记录检测结果，在每个人的可见关键点和框内角点上布置跟踪点
+    def keyframe(self, frame, persons):
+        gray, scale = self._prepare(frame)
+        h, w = gray.shape
+        points, owner, kp_index = [], [], []
+        for i in range(len(persons)):
+            kpts = persons['keypoints'][i]
+            visible = np.flatnonzero(kpts[:, 2] >= self.keypoint_conf)
+            points.append(kpts[visible, :2] * scale)
+            owner += [i] * len(visible)
+            kp_index += visible.tolist()
+
+            x1, y1, x2, y2 = (persons['xyxy'][i] * scale).astype(int).tolist()
+            x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+            if x2 - x1 < 8 or y2 - y1 < 8:
+                continue
+            corners = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.points_per_person, 0.01, 5)
+            if corners is not None:
+                points.append(corners.reshape(-1, 2) + (x1, y1))
+                owner += [i] * len(corners)
+                kp_index += [-1] * len(corners)
+
+        self._points = np.concatenate(points).astype(np.float32) if points else np.zeros((0, 2), np.float32)
+        self._owner = np.asarray(owner, dtype=np.intp)
+        self._kp_index = np.asarray(kp_index, dtype=np.intp)
+        self._persons = persons.copy()
+        self._gray = gray
+        self._scale = scale
+        self._since = 0
+        self.confidence = 1.0
+        self.keyframes += 1
+
+    # 非关键帧：返回外推后的人员数组；到了关键帧或外推不可信时返回 None，调用方应重新检测并调用 keyframe()
+    def propagate(self, frame):
+        if self._persons is None or self._since + 1 >= self.interval:
+            return None
+        n = len(self._persons)
+        if n == 0:
+            # 上个关键帧没人：新出现的人最迟在下一个关键帧检出
+            self._since += 1
+            self.propagated += 1
+            return self._persons.copy()
+
+        gray, scale = self._prepare(frame)
+        if scale != self._scale or gray.shape != self._gray.shape or len(self._points) == 0:
+            return None
+
+        p0 = self._points.reshape(-1, 1, 2)
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, p0, None, **self.lk_params)
+        back, st2, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, p1, None, **self.lk_params)
+        p1 = p1.reshape(-1, 2)
+        fb_error = np.linalg.norm(self._points - back.reshape(-1, 2), axis=1)
+        good = (st1.ravel() == 1) & (st2.ravel() == 1) & (fb_error < self.fb_threshold)
+
+        owner = self._owner
+        counts = np.bincount(owner, minlength=n)
+        confidence = np.bincount(owner[good], minlength=n) / np.maximum(counts, 1)
+        self.confidence = float(confidence.min())
+        if self.confidence < self.min_confidence or self.confidence == 0:
+            self.redetects["confidence"] += 1
+            return None
+
+        # 每个人的位移取跟踪成功的点的中位数，换算回原画面坐标
+        delta = (p1 - self._points) / scale
+        shift = np.zeros((n, 2), dtype=np.float32)
+        for i in range(n):
+            shift[i] = np.median(delta[good & (owner == i)], axis=0)
+        persons = self._persons.copy()
+        heights = np.maximum(persons['xywh'][:, 3], 1.0)
+        if (np.linalg.norm(shift, axis=1) / heights > self.motion_spike).any():
+            self.redetects["motion"] += 1
+            return None
+
+        persons['xyxy'] += np.tile(shift, 2)
+        persons['xywh'][:, :2] += shift
+        # 没有单独跟踪的关键点随人框平移，跟踪成功的关键点用各自的光流位置
+        visible = persons['keypoints'][:, :, 2] > 0
+        persons['keypoints'][:, :, :2] += visible[:, :, None] * shift[:, None, :]
+        tracked = good & (self._kp_index >= 0)
+        persons['keypoints'][owner[tracked], self._kp_index[tracked], :2] = p1[tracked] / scale
+        k = persons['keypoints']
+        has_kpts = ~np.isnan(persons['vertical_dist'])
+        persons['vertical_dist'][has_kpts] = ((k[:, 15, 1] + k[:, 16, 1]) / 2 - k[:, 0, 1])[has_kpts]
+
+        # 跟丢的点不再参与后续帧
+        self._points = p1[good]
+        self._owner = owner[good]
+        self._kp_index = self._kp_index[good]
+        self._gray = gray
+        self._persons = persons
+        self._since += 1
+        self.propagated += 1
+        return persons.copy()
+
+    # 丢弃上一个关键帧（如换了检测模型，旧的跟踪编号失效），下一帧重新检测
+    def reset(self):
+        self._persons = None
+
+    def snapshot(self):
+        total = self.keyframes + self.propagated
+        return {
+            "interval": self.interval,
+            "keyframes": self.keyframes,
+            "propagated": self.propagated,
+            "detect_ratio": round(self.keyframes / total, 3) if total else 0.0,
+            "redetects": dict(self.redetects),
+            "confidence": round(self.confidence, 3)
+        }
+
+
+# 贪心匹配两组人框，返回 [(参考下标, 结果下标, IoU), ...]
+def match_boxes(reference, result, iou_threshold=0.5):
+    iou = box_iou(reference, result)
+    pairs = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        pairs.append((int(i), int(j), float(iou[i, j])))
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return pairs
+
+
+# 以每帧检测的结果为参考，评估不同关键帧间隔下外推结果的准确度
+# 关键帧上的检测结果与参考相同，因此每帧只需检测一次，各间隔共用
+def evaluate(frames, reference, intervals, keypoint_conf=0.3, **propagator_args):
+    report = []
+    for interval in intervals:
+        propagator = KeyframePropagator(interval, keypoint_conf=keypoint_conf, **propagator_args)
+        matched = ref_total = out_total = count_hits = 0
+        ious, kpt_errors, durations = [], [], []
+        for frame, ref in zip(frames, reference):
+            start = time.perf_counter()
+            persons = propagator.propagate(frame)
+            if persons is None:
+                persons = ref
+                propagator.keyframe(frame, ref)
+            else:
+                durations.append(time.perf_counter() - start)
+
+            pairs = match_boxes(ref['xyxy'], persons['xyxy'])
+            matched += len(pairs)
+            ref_total += len(ref)
+            out_total += len(persons)
+            count_hits += len(ref) == len(persons)
+            for i, j, iou in pairs:
+                ious.append(iou)
+                # 关键点误差按人框高度归一化，只统计两边都可见的关键点
+                a, b = ref['keypoints'][i], persons['keypoints'][j]
+                both = (a[:, 2] >= keypoint_conf) & (b[:, 2] >= keypoint_conf)
+                if both.any():
+                    dist = np.linalg.norm(a[both, :2] - b[both, :2], axis=1)
+                    kpt_errors.append(float(dist.mean()) / max(float(ref['xywh'][i, 3]), 1.0))
+
+        entry = dict(propagator.snapshot(),
+                     frames=len(frames),
+                     recall=round(matched / ref_total, 4) if ref_total else 1.0,
+                     precision=round(matched / out_total, 4) if out_total else 1.0,
+                     mean_iou=round(float(np.mean(ious)), 4) if ious else None,
+                     keypoint_error=round(float(np.mean(kpt_errors)), 4) if kpt_errors else None,
+                     count_accuracy=round(count_hits / len(frames), 4) if frames else 0.0,
+                     propagate_ms=round(float(np.mean(durations)) * 1000, 3) if durations else 0.0)
+        print(json.dumps(entry, ensure_ascii=False))
+        report.append(entry)
+    return report
+
+
+if __name__ == "__main__":
+    from backends import load_model, model_filename, read_clip
+    from cascade import PoseCascade
+    from postprocess import extract_persons
+
+    parser = argparse.ArgumentParser(description="评估关键帧间隔对检测准确度的影响")
+    parser.add_argument('--evaluate', required=True, metavar='CLIP', help="录制好的视频文件")
+    parser.add_argument('--intervals', nargs='+', type=int, default=[1, 2, 3, 5, 8])
+    parser.add_argument('--backend', default='pytorch')
+    parser.add_argument('--size', default='n', help="检测模型大小")
+    parser.add_argument('--imgsz', type=int, default=320)
+    parser.add_argument('--pose', default='s', help="两级检测的姿态模型大小，设为 none 则只评估人框")
+    parser.add_argument('--pose-imgsz', type=int, default=256)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--output', help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    frames = read_clip(args.evaluate, args.frames)
+    if not frames:
+        raise SystemExit(f"无法读取视频: {args.evaluate}")
+
+    app_path = os.path.dirname(os.path.abspath(__file__))
+    model = load_model(os.path.join(app_path, model_filename(args.size)), args.backend, args.imgsz)
+    cascade = None
+    if args.pose != 'none':
+        cascade = PoseCascade(load_model(os.path.join(app_path, model_filename(args.pose, 'pose')), args.backend,
+                                         args.pose_imgsz, task='pose'))
+
+    # 参考结果：每帧都检测
+    start = time.perf_counter()
+    reference = []
+    for frame in frames:
+        persons = extract_persons(model(frame, verbose=False)[0])
+        if cascade is not None:
+            cascade.estimate([(frame, persons)])
+        reference.append(persons)
+    detect_ms = (time.perf_counter() - start) / len(frames) * 1000
+    print(f"每帧检测平均耗时 {detect_ms:.1f} ms，共 {len(frames)} 帧")
+
+    results = evaluate(frames, reference, args.intervals)
+    print("\n按关键帧间隔:")
+    for item in results:
+        est_ms = item['detect_ratio'] * detect_ms + (1 - item['detect_ratio']) * item['propagate_ms']
+        print(f"  k={item['interval']:<3} 检测比例 {item['detect_ratio']:.2f}  召回 {item['recall']:.3f}  "
+              f"精确 {item['precision']:.3f}  IoU {item['mean_iou'] or 0:.3f}  "
+              f"关键点误差 {item['keypoint_error'] or 0:.3f}  人数准确 {item['count_accuracy']:.3f}  "
+              f"估算每帧 {est_ms:.1f} ms")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"detect_ms": round(detect_ms, 3), "intervals": results}, f, ensure_ascii=False, indent=2)
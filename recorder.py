@@ -0,0 +1,246 @@
+import glob
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+# 一段正在录制的事件视频
+class Clip:
+    def __init__(self, path, event_type, started, end_time):
+        self.path = path
+        self.event_type = event_type
+        self.started = started
+        self.end_time = end_time
+        self.events = {event_type}
+
+
+# 同一录像目录的所有 ClipRecorder（如 main2.py 每路摄像头一个）共享一把清理锁和正在写入的文件集合：
+# 一路摄像头清理旧录像时不会删掉另一路还在写入的录像，配额按整个目录的总大小计算
+class _ClipDirectory:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writing = set()
+
+
+_clip_dirs = {}
+_clip_dirs_lock = threading.Lock()
+
+
+def _clip_directory(clip_dir):
+    key = os.path.normcase(os.path.realpath(clip_dir))
+    with _clip_dirs_lock:
+        return _clip_dirs.setdefault(key, _ClipDirectory())
+
+
+# 事件录像：内存中保留最近 pre_roll 秒已编码的 JPEG，事件发生时由后台线程写成 MP4，
+# 包含事件前 pre_roll 秒和最后一次触发后 post_roll 秒的画面。
+# - 检测线程只做追加字节和入队，解码、写文件、清理旧录像都在后台线程完成
+# - 缓冲区按时间和总字节数双重限制；写盘跟不上时丢弃新帧而不阻塞检测
+# - 录像目录超过 quota_mb 时删除最旧的录像；共用目录的多个录像器合计计算配额
+class ClipRecorder:
+    def __init__(self, clip_dir, name=None, pre_roll=5.0, post_roll=10.0, fps=10.0,
+                 max_clip_seconds=120.0, max_buffer_mb=32, quota_mb=2048, jpeg_quality=70, queue_size=300):
+        self.clip_dir = clip_dir
+        self.name = name
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.frame_interval = 1.0 / fps
+        self.max_clip_seconds = max_clip_seconds
+        self.max_buffer_bytes = int(max_buffer_mb * 1024 * 1024)
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.jpeg_quality = jpeg_quality
+        self.queue_size = queue_size
+        os.makedirs(clip_dir, exist_ok=True)
+        self._directory = _clip_directory(clip_dir)
+
+        self.clips = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.last_clip = None
+        self._buffer = deque()  # (时间戳, JPEG 字节)
+        self._buffer_bytes = 0
+        self._last_frame_time = 0.0
+        self._clip = None
+        self._pending_frames = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._writer_loop, name=f"recorder-{name or 'main'}", daemon=True)
+        self._thread.start()
+
+    # 按录像帧率抽帧，未到时间的帧不需要编码
+    def wants_frame(self, now=None):
+        if now is None:
+            now = time.time()
+        return now - self._last_frame_time >= self.frame_interval
+
+    # 未编码的画面：只在需要时才编码
+    def add_frame(self, frame, now=None):
+        if now is None:
+            now = time.time()
+        if not self.wants_frame(now):
+            return
+        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if ret:
+            self.add_jpeg(buffer.tobytes(), now)
+
+    # 已编码的 JPEG（如 main2.py 推流时编码好的画面）直接复用
+    def add_jpeg(self, jpeg, now=None):
+        if now is None:
+            now = time.time()
+        if not self.wants_frame(now):
+            return
+        self._last_frame_time = now
+        with self._lock:
+            self._buffer.append((now, jpeg))
+            self._buffer_bytes += len(jpeg)
+            while self._buffer and (now - self._buffer[0][0] > self.pre_roll or
+                                    self._buffer_bytes > self.max_buffer_bytes):
+                self._buffer_bytes -= len(self._buffer.popleft()[1])
+
+            clip = self._clip
+            if clip is None:
+                return
+            if now > clip.end_time or now - clip.started > self.max_clip_seconds:
+                self._clip = None
+                self._queue.put(('close', clip, None))
+            elif self._pending_frames >= self.queue_size:
+                self.dropped += 1
+            else:
+                self._pending_frames += 1
+                self._queue.put(('frame', clip, (now, jpeg)))
+
+    # 有事件时每帧调用：没有录像时开始一段新录像，已在录像时延长结束时间；返回录像文件路径
+    def trigger(self, event_type, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            clip = self._clip
+            if clip is None:
+                parts = ['clip', event_type]
+                if self.name:
+                    parts.append(str(self.name))
+                parts.append(time.strftime('%Y%m%d_%H%M%S', time.localtime(now)))
+                path = os.path.join(self.clip_dir, '_'.join(parts) + '.mp4')
+                pre_roll = list(self._buffer)
+                started = pre_roll[0][0] if pre_roll else now
+                clip = Clip(path, event_type, started, now + self.post_roll)
+                self._clip = clip
+                self.clips += 1
+                self.last_clip = path
+                self._queue.put(('open', clip, pre_roll))
+            else:
+                clip.end_time = max(clip.end_time, now + self.post_roll)
+                clip.events.add(event_type)
+            return clip.path
+
+    def is_recording(self):
+        return self._clip is not None
+
+    def stop(self):
+        with self._lock:
+            if self._clip is not None:
+                self._queue.put(('close', self._clip, None))
+                self._clip = None
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "recording": self._clip is not None,
+                "buffered_frames": len(self._buffer),
+                "buffered_kb": round(self._buffer_bytes / 1024, 1),
+                "pending_frames": self._pending_frames,
+                "clips": self.clips,
+                "dropped_frames": self.dropped,
+                "deleted_clips": self.deleted,
+                "last_clip": self.last_clip
+            }
+
+    def _writer_loop(self):
+        writers = {}  # clip -> [VideoWriter, 画面尺寸, 已写帧数]
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            action, clip, payload = item
+            try:
+                if action == 'open':
+                    with self._directory.lock:
+                        self._directory.writing.add(clip.path)
+                    writers[clip] = [None, None, 0]
+                    for frame in payload:
+                        self._write(clip, writers[clip], *frame)
+                elif action == 'frame':
+                    with self._lock:
+                        self._pending_frames -= 1
+                    if clip in writers:
+                        self._write(clip, writers[clip], *payload)
+                elif action == 'close':
+                    state = writers.pop(clip, None)
+                    if state is not None and state[0] is not None:
+                        state[0].release()
+                        print(f"[{time.strftime('%H:%M:%S')}] 事件录像已保存: {clip.path}")
+                    with self._directory.lock:
+                        self._directory.writing.discard(clip.path)
+                    self._rotate()
+            except Exception as e:
+                print(f"事件录像写入失败: {e}")
+
+        for clip, state in writers.items():
+            if state[0] is not None:
+                state[0].release()
+            with self._directory.lock:
+                self._directory.writing.discard(clip.path)
+
+    # 解码并写入一帧；实际帧率低于录像帧率时重复上一帧补齐，保证回放速度与现实一致
+    def _write(self, clip, state, timestamp, jpeg):
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return
+        writer, size, written = state
+        if writer is None:
+            size = (frame.shape[1], frame.shape[0])
+            writer = cv2.VideoWriter(clip.path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, size)
+            state[0], state[1] = writer, size
+        elif (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size)
+        target = int((timestamp - clip.started) * self.fps) + 1
+        repeats = min(max(1, target - written), int(self.fps * 2))
+        for _ in range(repeats):
+            writer.write(frame)
+        state[2] = written + repeats
+
+    # 磁盘配额：录像总大小超过 quota 时从最旧的开始删除（任何录像器正在写入的除外）
+    # 持有目录锁，共用目录的录像器不会同时清理
+    def _rotate(self):
+        with self._directory.lock:
+            self._rotate_locked(self._directory.writing)
+
+    def _rotate_locked(self, exclude):
+        clips = []
+        for path in glob.glob(os.path.join(self.clip_dir, 'clip_*.mp4')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            clips.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in clips)
+        for _, size, path in sorted(clips):
+            if total <= self.quota_bytes:
+                break
+            if path in exclude:
+                continue
+            try:
+                os.remove(path)
+                self.deleted += 1
+                total -= size
+                print(f"录像目录超出配额，已删除: {path}")
+            except OSError:
+                pass
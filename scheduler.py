@@ -0,0 +1,80 @@
+import time
+
+import cv2
+
+
+# 运动门控的推理调度器
+# 在缩小的灰度图上做帧差，得到廉价的运动分数，据此决定本帧是否跑完整的 YOLO：
+# - 有运动或最近看到过人：全速推理，保证不漏掉跌倒
+# - 连续 idle_timeout 秒无运动且无人：降到 idle_fps 的低频推理
+class MotionGatedScheduler:
+    def __init__(self, motion_threshold=0.01, idle_fps=1.0, idle_timeout=10.0,
+                 downscale_width=160, pixel_threshold=25):
+        self.motion_threshold = motion_threshold
+        self.idle_interval = 1.0 / idle_fps if idle_fps and idle_fps > 0 else 0
+        self.idle_timeout = idle_timeout
+        self.downscale_width = downscale_width
+        self.pixel_threshold = pixel_threshold
+
+        self.motion_score = 0.0
+        self.runs = 0
+        self.skips = 0
+        self._prev_small = None
+        self._last_active_time = time.monotonic()  # 启动时按活跃状态处理
+        self._last_infer_time = 0
+
+    # 计算运动分数：变化像素占比（0~1）
+    def _compute_motion(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.downscale_width / float(w)
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self._prev_small is None or self._prev_small.shape != small.shape:
+            self._prev_small = small
+            return 1.0  # 第一帧视为有运动，立即推理一次
+
+        diff = cv2.absdiff(small, self._prev_small)
+        self._prev_small = small
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def is_idle(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return now - self._last_active_time > self.idle_timeout
+
+    # 判断本帧是否需要推理，并更新运行/跳过计数
+    def should_infer(self, frame):
+        now = time.monotonic()
+        self.motion_score = self._compute_motion(frame)
+        if self.motion_score >= self.motion_threshold:
+            self._last_active_time = now
+
+        if not self.is_idle(now) or now - self._last_infer_time >= self.idle_interval:
+            self.runs += 1
+            self._last_infer_time = now
+            return True
+
+        self.skips += 1
+        return False
+
+    # 推理后回报检测到的人数：画面中有人时保持全速
+    def report(self, person_count):
+        if person_count > 0:
+            self._last_active_time = time.monotonic()
+
+    def snapshot(self):
+        total = self.runs + self.skips
+        return {
+            "mode": "idle" if self.is_idle() else "active",
+            "motion_score": round(self.motion_score, 4),
+            "runs": self.runs,
+            "skips": self.skips,
+            "run_ratio": round(self.runs / total, 3) if total else 0.0,
+            "skip_ratio": round(self.skips / total, 3) if total else 0.0
+        }
+
@@ -0,0 +1,113 @@
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 进程创建时间：包含打包程序解压、解释器启动和模块导入的耗时；没有 psutil 时从调用时开始算
+def process_start_time():
+    if psutil is not None:
+        try:
+            return psutil.Process().create_time()
+        except Exception:
+            pass
+    return time.time()
+
+
+# 启动计时：记录各启动阶段（加载模型、打开摄像头……）的开始时间、耗时和结果，
+# 以及第一次 HTTP 响应、第一次检测完成等时间点，时间均为距进程启动的秒数
+class StartupTracker:
+    def __init__(self, start_time=None):
+        self.start_time = start_time if start_time is not None else process_start_time()
+        self.phases = {}
+        self.marks = {}
+        self.ready = False
+        self.error = None
+        self._lock = threading.Lock()
+        # 进程启动到创建本对象之间：解释器启动和模块导入
+        self.phases["boot"] = {"status": "done", "start": 0.0, "seconds": round(self.elapsed(), 3)}
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    @contextmanager
+    def phase(self, name):
+        entry = {"status": "running", "start": round(self.elapsed(), 3), "seconds": None}
+        with self._lock:
+            self.phases[name] = entry
+        start = time.perf_counter()
+        try:
+            yield entry
+        except BaseException as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            raise
+        else:
+            entry["status"] = "done"
+        finally:
+            entry["seconds"] = round(time.perf_counter() - start, 3)
+            print(f"启动阶段 {name}: {entry['seconds']:.2f} 秒")
+
+    # 执行一个阶段，出错时记录并返回 None，供后台启动线程使用
+    def run(self, name, func, *args):
+        try:
+            with self.phase(name):
+                return func(*args)
+        except Exception as e:
+            print(f"启动阶段 {name} 失败: {e}")
+            return None
+
+    # 记录某个时间点，只有第一次有效；在每帧都会调用的路径上只是一次字典查找
+    def mark(self, name):
+        if name in self.marks:
+            return False
+        with self._lock:
+            if name in self.marks:
+                return False
+            self.marks[name] = round(self.elapsed(), 3)
+        print(f"启动计时 {name}: 进程启动后 {self.marks[name]:.2f} 秒")
+        return True
+
+    def set_ready(self):
+        self.ready = True
+        self.mark("ready")
+
+    def fail(self, error):
+        self.error = error
+
+    def snapshot(self):
+        with self._lock:
+            phases = {name: dict(entry) for name, entry in self.phases.items()}
+            marks = dict(self.marks)
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "uptime": round(self.elapsed(), 3),
+            "phases": phases,
+            "time_to_first_response": marks.get("first_response"),
+            "time_to_ready": marks.get("ready"),
+            "time_to_first_detection": marks.get("first_detection")
+        }
+
+
+# ASGI 中间件：记录第一次 HTTP 响应的时间，之后直接透传，不再包装 send
+class FirstResponseMiddleware:
+    def __init__(self, app, tracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_response" in self.tracker.marks:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self.tracker.mark("first_response")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
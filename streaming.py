@@ -0,0 +1,402 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+
+import cv2
+from fastapi import WebSocket
+
+from metrics import observe_stage
+
+
+MJPEG_BOUNDARY = "frame"
+
+# 推流画质档位 (缩放比例, JPEG 质量)，从高到低；每个 WebSocket 客户端按自己的网速在档位间切换
+QUALITY_LEVELS = ((1.0, 80), (1.0, 70), (0.75, 60), (0.5, 50), (0.5, 35))
+# 基准档位（原尺寸、质量 70）：MJPEG、快照、录像以及新连接的客户端使用
+BASE_LEVEL = 1
+
+ADAPT_INTERVAL = 2.0   # 客户端每隔多少秒评估一次是否升降档
+CONGESTED_RATIO = 0.3  # 一个周期内被跳过的帧超过该比例时降档
+UPGRADE_WINDOWS = 2    # 连续多少个周期畅通才升档，避免来回切换
+
+
+def dump_json(message):
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+# 编码一次、所有客户端共享的帧
+class EncodedFrame:
+    def __init__(self, seq, jpeg, meta):
+        self.seq = seq
+        self.jpeg = jpeg  # JPEG 字节
+        self.meta = meta  # person_count、timestamp 等元数据
+        self._json_message = None
+        self._mjpeg_part = None
+
+    # 二进制模式下，每帧之前先发的一条小元数据消息
+    def meta_message(self):
+        data = dict(self.meta, seq=self.seq, size=len(self.jpeg))
+        return dump_json({"type": "meta", "data": data})
+
+    # 兼容旧版前端的 base64 JSON 消息，首次需要时才生成，所有旧版客户端共用一份
+    def json_message(self):
+        if self._json_message is None:
+            start = time.perf_counter()
+            data = dict(self.meta, frame=base64.b64encode(self.jpeg).decode('utf-8'))
+            self._json_message = dump_json({"type": "video", "data": data})
+            observe_stage('base64', start)
+        return self._json_message
+
+    # MJPEG multipart 的一段，首次需要时才生成，所有 MJPEG 观看者共用一份
+    def mjpeg_part(self):
+        if self._mjpeg_part is None:
+            header = f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(self.jpeg)}\r\n\r\n"
+            self._mjpeg_part = header.encode('ascii') + self.jpeg + b"\r\n"
+        return self._mjpeg_part
+
+
+def _resolve_waiters(futures, frame):
+    for future in futures:
+        if not future.done():
+            future.set_result(frame)
+
+
+# 共享的已编码帧缓存：每个推理 tick 只编码一次，按帧序号区分新旧
+# WebSocket、MJPEG、快照等所有观看者都从这里取，新增观看者只多一次 socket 写入
+class FrameCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._waiters = {}  # 事件循环 -> [Future, ...]
+
+    # 推进帧序号：只为 WebSocket 编码了降档画面、没有存入缓存的帧也占用一个序号
+    def next_seq(self):
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    # 线程安全：在视频线程中调用，存入新帧并唤醒所有等待中的协程
+    def put(self, jpeg, meta, seq=None):
+        with self._lock:
+            if seq is None:
+                self._seq += 1
+                seq = self._seq
+            frame = EncodedFrame(seq, jpeg, meta)
+            self._frame = frame
+            waiters, self._waiters = self._waiters, {}
+        for loop, futures in waiters.items():
+            try:
+                loop.call_soon_threadsafe(_resolve_waiters, futures, frame)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        return frame
+
+    def latest(self):
+        return self._frame
+
+    # 等待序号大于 seq 的新帧，超时返回 None
+    async def wait_newer(self, seq, timeout=None):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            frame = self._frame
+            if frame is not None and frame.seq > seq:
+                return frame
+            future = loop.create_future()
+            self._waiters.setdefault(loop, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            # 超时或被取消时从等待列表中移除，否则在下一次 put 之前一直占着
+            if not future.done() or future.cancelled():
+                self._discard_waiter(loop, future)
+
+    def _discard_waiter(self, loop, future):
+        with self._lock:
+            futures = self._waiters.get(loop)
+            if futures is None:
+                return
+            try:
+                futures.remove(future)
+            except ValueError:
+                return
+            if not futures:
+                del self._waiters[loop]
+
+
+# 单个客户端：只保留最新一帧的槽位 + 独立的发送协程
+# 慢客户端发送期间到达的帧只会覆盖槽位，直接跳到最新一帧，不会拖慢其他客户端
+# 每个客户端按实测发送速度和码率上限自适应：
+# - target_bps（字节/秒）限制码率，发送完一帧后按其大小推算下一帧最早何时可以发送，帧率随之下降
+# - 一个周期内被跳过 / 因码率推迟的帧过多时降一档画质；连续几个周期畅通且网速有余量时升一档
+class ClientSession:
+    def __init__(self, websocket: WebSocket, binary=False, target_bps=None):
+        self.websocket = websocket
+        self.binary = binary
+        self.target_bps = target_bps
+        self.level = BASE_LEVEL
+        self.sent = 0
+        self.skipped = 0
+        self.deferred = 0          # 因码率上限推迟（未编码）的帧数
+        self.bytes_sent = 0
+        self.throughput = 0.0      # 实测发送速度（字节/秒，指数平均）
+        self.bitrate = 0.0         # 最近一个周期的实际码率（字节/秒）
+        self.task = None
+        self._pending = None
+        self._ready = asyncio.Event()
+        self._next_send = 0.0
+        self._good_windows = 0
+        self._window = [time.monotonic(), 0, 0, 0]  # 周期开始时间、已发送、跳过 + 推迟、字节数
+        # wants_frame() 在视频线程、offer() / _on_sent() 在事件循环中修改统计周期、档位和发送时间，用锁保护
+        self._lock = threading.Lock()
+
+    # 视频线程调用：本帧是否需要为该客户端编码
+    # 上一帧还没开始发送，或码率预算还没恢复时返回 False，省下编码
+    def wants_frame(self, now=None):
+        if self._pending is not None:
+            return False
+        with self._lock:
+            if self.target_bps and (now or time.monotonic()) < self._next_send:
+                self.deferred += 1
+                self._window[2] += 1
+                return False
+        return True
+
+    def offer(self, frame):
+        if self._pending is not None:
+            with self._lock:
+                self.skipped += 1
+                self._window[2] += 1
+        self._pending = frame
+        self._ready.set()
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            start = time.monotonic()
+            if self.binary:
+                await self.websocket.send_text(frame.meta_message())
+                await self.websocket.send_bytes(frame.jpeg)
+            else:
+                await self.websocket.send_text(frame.json_message())
+            now = time.monotonic()
+            self._on_sent(len(frame.jpeg), now - start, now)
+
+    def _on_sent(self, size, duration, now):
+        with self._lock:
+            self._record_sent(size, duration, now)
+
+    def _record_sent(self, size, duration, now):
+        self.sent += 1
+        self.bytes_sent += size
+        rate = size / max(duration, 1e-4)
+        self.throughput = rate if self.throughput == 0 else self.throughput * 0.8 + rate * 0.2
+        if self.target_bps:
+            self._next_send = now + size / self.target_bps
+        window = self._window
+        window[1] += 1
+        window[3] += size
+        if now - window[0] >= ADAPT_INTERVAL:
+            self._adapt(now)
+
+    def _adapt(self, now):
+        start, sent, missed, size = self._window
+        self._window = [now, 0, 0, 0]
+        self.bitrate = size / (now - start)
+        if sent + missed == 0:
+            return
+        if missed / (sent + missed) > CONGESTED_RATIO:
+            self._good_windows = 0
+            self.level = min(self.level + 1, len(QUALITY_LEVELS) - 1)
+            return
+        # 升一档画面约大 50%，网速和码率上限都要留有余量
+        headroom = self.throughput >= 2 * self.bitrate * 1.5
+        within_target = not self.target_bps or self.bitrate * 1.5 <= self.target_bps
+        if missed == 0 and headroom and within_target:
+            self._good_windows += 1
+            if self._good_windows >= UPGRADE_WINDOWS and self.level > 0:
+                self.level -= 1
+                self._good_windows = 0
+        else:
+            self._good_windows = 0
+
+    def to_dict(self):
+        return {
+            "format": "binary" if self.binary else "json",
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "deferred": self.deferred,
+            "level": self.level,
+            "bitrate_kbps": round(self.bitrate * 8 / 1000, 1),
+            "throughput_kbps": round(self.throughput * 8 / 1000, 1),
+            "target_kbps": round(self.target_bps * 8 / 1000, 1) if self.target_bps else None
+        }
+
+
+# WebSocket 连接管理
+# 视频线程调用 publish() 交出编码好的帧，通过 run_coroutine_threadsafe 投递到 uvicorn 自己的事件循环，
+# 每个客户端由各自的协程发送，视频线程从不等待网络
+# target_kbps 为每个客户端的码率上限；max_total_kbps 为所有客户端的总上限，观看者越多每人分到的越少
+class ConnectionManager:
+    def __init__(self, target_kbps=None, max_total_kbps=None):
+        self.active_connections: list[WebSocket] = []
+        self.sessions = {}
+        self.loop = None
+        self.target_kbps = target_kbps
+        self.max_total_kbps = max_total_kbps
+        self.skipped_closed = 0  # 已断开客户端被跳过的帧数
+
+    async def connect(self, websocket: WebSocket, binary=False):
+        await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+        session = ClientSession(websocket, binary)
+        session.task = asyncio.create_task(self._run_session(session))
+        self.sessions[websocket] = session
+        self.active_connections.append(websocket)
+        self._update_budgets()
+        print(f"新的WebSocket连接: {len(self.active_connections)} 个客户端")
+
+    def disconnect(self, websocket: WebSocket):
+        session = self.sessions.pop(websocket, None)
+        if session is None:
+            return
+        self.active_connections.remove(websocket)
+        self.skipped_closed += session.skipped
+        if session.task is not None and session.task is not asyncio.current_task():
+            session.task.cancel()
+        self._update_budgets()
+        print(f"WebSocket连接断开: {len(self.active_connections)} 个客户端")
+
+    # 每个客户端的码率预算（字节/秒）
+    def _update_budgets(self):
+        sessions = list(self.sessions.values())
+        budgets = [kbps for kbps in (self.target_kbps,
+                                     self.max_total_kbps / len(sessions) if self.max_total_kbps and sessions else None)
+                   if kbps]
+        target_bps = min(budgets) * 1000 / 8 if budgets else None
+        for session in sessions:
+            session.target_bps = target_bps
+
+    async def _run_session(self, session):
+        try:
+            await session.run()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"发送WebSocket消息失败: {e}")
+            self.disconnect(session.websocket)
+
+    # 视频线程调用：本帧需要编码的画质档位 {客户端: 档位}，floor 为编码器因 CPU 紧张设定的最低档位
+    def wanted_levels(self, floor=0):
+        now = time.monotonic()
+        return {session: max(session.level, floor)
+                for session in list(self.sessions.values()) if session.wants_frame(now)}
+
+    # 线程安全：在视频线程中调用，frames 为 {档位: 已编码帧}，每个客户端取自己档位的帧，不等待发送完成
+    def publish(self, frames, wanted):
+        loop = self.loop
+        if loop is None or not wanted:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._dispatch(frames, wanted), loop)
+        except RuntimeError:
+            # 事件循环已关闭（服务器退出中）
+            pass
+
+    async def _dispatch(self, frames, wanted):
+        for session, level in wanted.items():
+            frame = frames.get(level)
+            if frame is not None and session.websocket in self.sessions:
+                session.offer(frame)
+
+    # 所有客户端（含已断开的）因发送跟不上而跳过的帧数
+    def skipped_total(self):
+        return self.skipped_closed + sum(session.skipped for session in list(self.sessions.values()))
+
+    def snapshot(self):
+        return {
+            "count": len(self.active_connections),
+            "target_kbps": self.target_kbps,
+            "max_total_kbps": self.max_total_kbps,
+            "clients": [session.to_dict() for session in list(self.sessions.values())]
+        }
+
+
+# 按需编码一帧：wanted 为 ConnectionManager.wanted_levels() 的结果 {客户端: 档位}，
+# 每个档位只编码一次，所有同档客户端共享；base_needed 为 True 时（MJPEG / 快照 / 录像）额外编码基准画质并存入 cache
+# 返回 {档位: EncodedFrame}，交给 ConnectionManager.publish() 推送；main2.py 和 benchmark.py 共用
+def encode_for_clients(encoder, cache, frame, meta, wanted, base_needed=False):
+    levels = set(wanted.values())
+    if base_needed:
+        levels.add(BASE_LEVEL)
+    if not levels:
+        return {}
+    seq = cache.next_seq()
+    frames = {}
+    for level in sorted(levels):
+        jpeg = encoder.encode(frame, level)
+        if jpeg is None:
+            continue
+        frames[level] = cache.put(jpeg, meta, seq) if level == BASE_LEVEL else EncodedFrame(seq, jpeg, meta)
+    return frames
+
+
+# 按需编码：每帧只编码有人需要的档位，每个档位只编码一次
+# 编码耗时占墙钟时间的比例超过 cpu_budget（单核的比例）时整体抬高最低档位，降到预算的三分之一以下再逐档恢复，
+# 推理繁忙时先降推流画质，不拖累检测帧率
+class StreamEncoder:
+    def __init__(self, cpu_budget=0.25, window=2.0):
+        self.cpu_budget = cpu_budget
+        self.window = window
+        self.floor = 0
+        self.min_floor = 0  # 由画质调节设置的下限，CPU 空闲时也不会高于这一档
+        self.encoded = {}  # 档位 -> 编码次数
+        self._window_start = time.monotonic()
+        self._window_seconds = 0.0
+        self.load = 0.0
+
+    def encode(self, frame, level):
+        scale, quality = QUALITY_LEVELS[level]
+        start = time.perf_counter()
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        self._account(time.perf_counter() - start)
+        self.encoded[level] = self.encoded.get(level, 0) + 1
+        return buffer.tobytes() if ret else None
+
+    def _account(self, seconds):
+        self._window_seconds += seconds
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        self.load = self._window_seconds / elapsed
+        self._window_start, self._window_seconds = now, 0.0
+        if self.load > self.cpu_budget and self.floor < len(QUALITY_LEVELS) - 1:
+            self.floor += 1
+            print(f"推流编码占用 {self.load:.0%} CPU，画质下限降到第 {self.floor} 档")
+        elif self.load < self.cpu_budget / 3 and self.floor > self.min_floor:
+            self.floor -= 1
+
+    def set_min_floor(self, level):
+        self.min_floor = min(max(0, level), len(QUALITY_LEVELS) - 1)
+        self.floor = max(self.floor, self.min_floor)
+
+    def snapshot(self):
+        return {
+            "floor": self.floor,
+            "min_floor": self.min_floor,
+            "load": round(self.load, 3),
+            "cpu_budget": self.cpu_budget,
+            "encoded": {str(QUALITY_LEVELS[level]): count for level, count in sorted(self.encoded.items())}
+        }
@@ -0,0 +1,35 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+# 程序模块都在仓库根目录下，没有打包成 Python 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 用临时目录里的截图目录和事件数据库导入 main2，不启动摄像头和模型（不进入 lifespan）
+# main2 在导入时注册监控指标，整个测试会话只导入一次
+@pytest.fixture(scope="session")
+def main2(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('main2')
+    config = types.ModuleType('config')
+    config.screenshot_path = str(tmp_path / 'screenshots')
+    config.event_db_path = str(tmp_path / 'events.db')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(sys.modules, 'config', config)
+        monkeypatch.delitem(sys.modules, 'main2', raising=False)
+        module = importlib.import_module('main2')
+        try:
+            yield module
+        finally:
+            module.alert_engine.stop()
+            module.event_store.stop()
+            sys.modules.pop('main2', None)
+
+
+@pytest.fixture
+def client(main2):
+    from fastapi.testclient import TestClient
+    return TestClient(main2.app)
@@ -0,0 +1,127 @@
+import time
+
+import numpy as np
+
+import alerts
+from alerts import AlertEngine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.messages = []
+
+    def dispatch(self, message, config=None):
+        self.messages.append(message)
+
+
+def make_engine(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(alerts.time, 'monotonic', clock)
+    notifier = RecordingNotifier()
+    # 合并窗口设得很长，由测试手动调用 _flush 控制发送时机
+    engine = AlertEngine(notifier, {}, notification_interval=300, burst=3,
+                         repeat_intervals={'person': 60, 'fall': 30}, clear_after=1000, digest_window=1000)
+    return engine, notifier, clock
+
+
+def test_fall_is_not_held_behind_person_alerts(monkeypatch):
+    engine, notifier, clock = make_engine(monkeypatch)
+    try:
+        start = clock.now
+        for t in (0, 60, 120):
+            clock.now = start + t
+            assert engine.observe('cam0', None, 'person', count=1)
+            engine._flush()
+        assert len(notifier.messages) == 3
+
+        # 令牌已用完：例行报警被限流
+        clock.now = start + 180
+        assert engine.observe('cam0', None, 'person', count=1)
+        engine._flush()
+        assert len(notifier.messages) == 3
+
+        # 跌倒立即发出，并带上排队中的有人报警
+        clock.now = start + 240
+        assert engine.observe('cam0', 1, 'fall')
+        engine._flush()
+        assert len(notifier.messages) == 4
+        assert '跌倒' in notifier.messages[-1] and '检测到 1 人' in notifier.messages[-1]
+        assert engine.snapshot()["urgent_sent"] == 1
+    finally:
+        engine.stop()
+
+
+def test_urgent_send_does_not_consume_tokens(monkeypatch):
+    engine, notifier, clock = make_engine(monkeypatch)
+    try:
+        for i in range(5):
+            clock.now += 31
+            assert engine.observe('cam0', i, 'fall')
+            engine._flush()
+        assert len(notifier.messages) == 5
+        assert engine.bucket.tokens == 3
+    finally:
+        engine.stop()
+
+
+# 报警被限流时截图还没有保存，画面上不能提示 "Screenshot Saved"；真正发送时才保存截图
+def test_screenshot_saved_only_after_alert_is_sent(monkeypatch, tmp_path):
+    engine, notifier, clock = make_engine(monkeypatch)
+    engine.screenshot_dir = str(tmp_path)
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    try:
+        engine.bucket.tokens = 0
+        since = time.time()
+        assert engine.observe(None, None, 'person', frame, 1)
+        engine._flush()
+        assert notifier.messages == []
+        assert not engine.screenshot_saved_since(None, since)
+
+        clock.now += 300
+        engine._flush()
+        assert len(notifier.messages) == 1
+        assert engine.screenshot_saved_since(None, since)
+        assert len(list(tmp_path.glob('detection_*.jpg'))) == 1
+    finally:
+        engine.stop()
+
+
+class RecordingEventStore:
+    def __init__(self):
+        self.events = []
+
+    def record_event(self, camera, event_type, track_id=None, person_count=None, **kwargs):
+        self.events.append((camera, event_type, person_count, kwargs.get("detail")))
+
+
+# 同一事件在一个令牌周期内报警两次：两条都要出现在消息里，也都要写入事件历史
+def test_repeat_alerts_before_send_are_all_kept(monkeypatch):
+    engine, notifier, clock = make_engine(monkeypatch)
+    store = RecordingEventStore()
+    engine.event_store = store
+    try:
+        engine.bucket.tokens = 0
+        assert engine.observe('cam0', None, 'person', count=1)
+        engine._flush()
+        clock.now += 60
+        assert engine.observe('cam0', None, 'person', count=2)
+        engine._flush()
+        assert notifier.messages == []
+        assert engine.snapshot()["pending"] == 2
+
+        clock.now += 300
+        engine._flush()
+        assert len(notifier.messages) == 1
+        assert '检测到 1 人' in notifier.messages[0] and '检测到 2 人' in notifier.messages[0]
+        assert [e[:3] for e in store.events if e[1] == 'person'] == [('cam0', 'person', 1), ('cam0', 'person', 2)]
+        assert store.events[-1][1] == 'alert_sent' and store.events[-1][3]["events"] == 2
+    finally:
+        engine.stop()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from backends import InferenceModel
+
+
+# 模拟固定 batch 导出的模型：输入数量不等于导出的 batch 时像 ONNX Runtime 一样报错
+class FixedBatchYOLO:
+    def __init__(self, batch):
+        self.batch = batch
+        self.calls = []
+
+    def _predict(self, source, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        if len(images) != self.batch:
+            raise RuntimeError(f"Got invalid dimensions for input: expected {self.batch}, got {len(images)}")
+        self.calls.append(kwargs)
+        return [int(image[0, 0, 0]) for image in images]
+
+    def __call__(self, source, **kwargs):
+        return self._predict(source, **kwargs)
+
+    def track(self, source, **kwargs):
+        return self._predict(source, **kwargs)
+
+
+def images(count):
+    return [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(count)]
+
+
+def test_fixed_batch_model_rejects_wrong_size():
+    yolo = FixedBatchYOLO(4)
+    with pytest.raises(RuntimeError):
+        yolo(images(3))
+
+
+@pytest.mark.parametrize("count", [1, 3, 4, 5, 9])
+def test_wrong_size_batch_is_split_and_padded(count):
+    yolo = FixedBatchYOLO(4)
+    model = InferenceModel(yolo, 'onnx', 320, 'fp32', 'model.onnx', batch=4)
+    assert model(images(count), verbose=False) == list(range(count))
+    assert len(yolo.calls) == -(-count // 4)
+    assert all(call['imgsz'] == 320 for call in yolo.calls)
+
+
+def test_single_image_is_padded_to_batch():
+    yolo = FixedBatchYOLO(2)
+    model = InferenceModel(yolo, 'openvino', 640, 'fp32', 'model_openvino_model', batch=2)
+    assert model(images(1)[0]) == [0]
+    assert model.track(images(1)[0], persist=True) == [0]
+    model.warmup(runs=1)
+
+
+def test_dynamic_model_is_called_once():
+    yolo = FixedBatchYOLO(5)
+    model = InferenceModel(yolo, 'pytorch', 640, 'fp32', 'model.pt')
+    assert model(images(5)) == list(range(5))
+    assert len(yolo.calls) == 1
+
+
+class FakeTracker:
+    def __init__(self):
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+def test_reset_tracker_resets_every_stream():
+    yolo = FixedBatchYOLO(1)
+    model = InferenceModel(yolo, 'pytorch', 640, 'fp32', 'model.pt')
+    model.reset_tracker()  # 还没跟踪过，没有 predictor
+
+    class Predictor:
+        trackers = [FakeTracker(), FakeTracker()]
+
+    yolo.predictor = Predictor()
+    model.reset_tracker()
+    assert [tracker.resets for tracker in Predictor.trackers] == [1, 1]
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+import benchmark
+from fall_detection import FallDetector, classify_falls
+from postprocess import PERSON_DTYPE
+from streaming import BASE_LEVEL, QUALITY_LEVELS, FrameCache, StreamEncoder, encode_for_clients
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.boxes = FakeBoxes(data)
+        self.keypoints = None
+
+
+# 每帧检出一个人；跟踪时带上跟踪编号
+class FakeModel:
+    def __init__(self):
+        self.calls = {"predict": 0, "track": 0}
+
+    def __call__(self, source, **kwargs):
+        self.calls["predict"] += 1
+        return [FakeResult(np.array([[10, 10, 60, 160, 0.9, 0]], dtype=np.float32))]
+
+    def track(self, source, **kwargs):
+        self.calls["track"] += 1
+        return [FakeResult(np.array([[10, 10, 60, 160, 1, 0.9, 0]], dtype=np.float32))]
+
+
+def write_frames(directory, count):
+    for i in range(count):
+        cv2.imwrite(str(directory / f"{i:03d}.jpg"), np.full((120, 160, 3), i * 10, dtype=np.uint8))
+
+
+def test_benchmark_runs_shared_frame_steps(tmp_path):
+    write_frames(tmp_path, 5)
+    for mode, call in (('fall', 'track'), ('detect', 'predict')):
+        model = FakeModel()
+        report = benchmark.run_benchmark(model, str(tmp_path), mode=mode)
+        assert report["frames"] == 5
+        assert model.calls[call] == 5
+        assert report["avg_person_count"] == 1.0
+        # 编码走 StreamEncoder：每帧编码一次基准画质
+        assert report["encoder"]["encoded"] == {str(QUALITY_LEVELS[BASE_LEVEL]): 5}
+        assert report["stages"]["encode"]["total_s"] > 0
+
+
+def test_classify_falls_groups_untracked_as_normal():
+    persons = np.zeros(2, dtype=PERSON_DTYPE)
+    persons['xywh'] = [[50, 50, 20, 80], [100, 50, 20, 80]]
+    persons['track_id'] = [3, -1]
+    groups, fall_in_frame = classify_falls(FallDetector(), [persons])
+    assert not fall_in_frame
+    labels = {label: len(group) for group, label, _ in groups}
+    assert labels["Normal"] == 2
+    assert labels["FALL DETECTED!"] == 0
+
+
+def test_encode_for_clients_skips_when_nobody_watches():
+    encoder = StreamEncoder()
+    cache = FrameCache()
+    frame = np.zeros((40, 40, 3), dtype=np.uint8)
+    assert encode_for_clients(encoder, cache, frame, {}, {}) == {}
+    assert cache.latest() is None
+
+    frames = encode_for_clients(encoder, cache, frame, {"person_count": 0}, {}, base_needed=True)
+    assert list(frames) == [BASE_LEVEL]
+    assert cache.latest() is frames[BASE_LEVEL]
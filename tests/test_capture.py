@@ -0,0 +1,88 @@
+import threading
+import time
+
+import numpy as np
+
+from capture import Capture
+from loadtest import SyntheticCamera
+from pipeline import FramePipeline
+
+
+# 替身 VideoCapture：每帧整幅画面填上递增的帧号，有缓冲区时原地解码
+class CountingVideoCapture:
+    def __init__(self):
+        self.count = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        self.count += 1
+        if image is None:
+            image = np.empty((4, 4, 3), dtype=np.uint8)
+        image[:] = self.count % 256
+        return True, image
+
+    def release(self):
+        pass
+
+
+def make_capture(ring_size=4):
+    capture = Capture('video.mp4', ring_size=ring_size)
+    capture.cap = CountingVideoCapture()
+    return capture
+
+
+def test_held_frame_is_not_overwritten():
+    capture = make_capture(ring_size=4)
+    _, held = capture.read()
+    value = int(held[0, 0, 0])
+    for _ in range(10):
+        success, frame = capture.read(exclude=(held,))
+        assert success and frame is not held
+    assert (held == value).all()
+
+
+def test_synthetic_camera_skips_held_frame():
+    camera = SyntheticCamera(64, 48, fps=0, persons=1, ring_size=3)
+    _, held = camera.read()
+    snapshot = held.copy()
+    for _ in range(6):
+        _, frame = camera.read(exclude=(held,))
+        assert frame is not held
+    assert (held == snapshot).all()
+
+
+# 推理、推送都比采集慢：每一帧从采集到推送完成都不能被后面的采集覆盖
+def test_pipeline_frames_are_not_overwritten_while_in_use():
+    capture = make_capture(ring_size=2 * 1 + 4)
+    overwritten = []
+    published = []
+
+    def infer(frame):
+        value = int(frame[0, 0, 0])
+        time.sleep(0.005)
+        return frame, value
+
+    def publish(result):
+        frame, value = result
+        time.sleep(0.005)
+        if not (frame == value).all():
+            overwritten.append(value)
+        published.append(value)
+        return len(published) < 30
+
+    def read_frame(exclude):
+        time.sleep(0.001)
+        return capture.read(exclude)
+
+    pipeline = FramePipeline(read_frame, infer, publish, queue_size=1)
+    pipeline.start()
+    finished = threading.Event()
+    threading.Thread(target=lambda: (pipeline.join(), finished.set()), daemon=True).start()
+    assert finished.wait(10)
+
+    assert len(published) >= 30
+    assert overwritten == []
+    # 推送完成和被队列丢弃的帧都已释放
+    assert len(pipeline.held_frames()) <= 2
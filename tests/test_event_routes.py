@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/events", "/stats/hourly", "/stats/frames"])
+def test_invalid_time_is_bad_request(client, path):
+    response = client.get(path, params={"start": "yesterday"})
+    assert response.status_code == 400
+    assert "start" in response.json()["detail"]
+
+    response = client.get(path, params={"end": "2024-13-01"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/events", "/stats/hourly", "/stats/frames"])
+def test_valid_times_are_accepted(client, path):
+    response = client.get(path, params={"start": "2024-05-01T08:00", "end": "1714600000"})
+    assert response.status_code == 200
@@ -0,0 +1,40 @@
+import time
+
+import numpy as np
+
+from fall_detection import FallDetector, STANDING, classify_falls
+from postprocess import PERSON_DTYPE
+
+
+def test_reset_forgets_all_tracks():
+    detector = FallDetector(capacity=2)
+    boxes = np.array([[50, 50, 20, 80], [100, 50, 20, 80]], dtype=np.float32)
+    detector.update(np.array([1, 2]), boxes, now=0.0)
+    assert detector.snapshot()["tracks"] == 2
+
+    detector.reset()
+    assert detector.snapshot()["tracks"] == 0
+    assert detector.state_of(1) is None
+
+    # 新编号复用释放出的缓冲区，历史从头开始
+    states = detector.update(np.array([1, 2]), boxes, now=0.1)
+    assert detector.capacity == 2
+    assert (states == STANDING).all()
+    assert detector.snapshot()["tracks"] == 2
+
+
+# 画面里没人、或只有还没分配跟踪编号的人时不会调用 update()，离开的目标也要按时过期
+def test_stale_tracks_expire_without_tracked_detections():
+    detector = FallDetector(evict_after=2.0)
+    boxes = np.array([[50, 50, 20, 80]], dtype=np.float32)
+    detector.update(np.array([1]), boxes, now=time.monotonic() - 10)
+    assert detector.snapshot()["tracks"] == 1
+
+    untracked = np.zeros(1, dtype=PERSON_DTYPE)
+    untracked['track_id'] = -1
+    classify_falls(detector, [untracked])
+    assert detector.snapshot()["tracks"] == 0
+
+    detector.update(np.array([2]), boxes, now=time.monotonic() - 10)
+    classify_falls(detector, [])
+    assert detector.state_of(2) is None
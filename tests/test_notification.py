@@ -0,0 +1,260 @@
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notification import NotificationDispatcher, NotificationManager
+
+
+# ---------- 本地替身服务 ----------
+
+# 飞书 webhook 替身：按 statuses 依次返回状态码（用完后返回 200），记录每个请求的时间和客户端端口
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), WebhookHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/hook"
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive，才能看出连接是否复用
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length))
+        server = self.server
+        server.requests.append({"time": time.monotonic(), "port": self.client_address[1], "payload": payload})
+        status = server.statuses.pop(0) if server.statuses else 200
+        body = json.dumps({"code": 0 if status == 200 else 1}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# SMTP 替身：只实现 smtplib 发信用到的命令，记录连接数、命令和收到的邮件
+# drop_after_mail 为 True 时每封邮件收完后服务端断开连接，模拟空闲连接被服务器关闭
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop_after_mail=False):
+        self.drop_after_mail = drop_after_mail
+        self.connections = 0
+        self.commands = []
+        self.messages = []
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            server.commands.append(verb)
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'AUTH':
+                self.reply('235 authenticated')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 ok')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    lines.append(data)
+                server.messages.append(b''.join(lines))
+                self.reply('250 queued')
+                if server.drop_after_mail:
+                    return
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def webhook():
+    servers = []
+
+    def start(statuses=()):
+        servers.append(serve(WebhookServer(statuses)))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(drop_after_mail=False):
+        servers.append(serve(SMTPServer(drop_after_mail)))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def email_config(port):
+    return {
+        'email_to': 'to@example.com',
+        'email_from': 'from@example.com',
+        'email_password': 'secret',
+        'smtp_server': '127.0.0.1',
+        'smtp_port': port,
+        'smtp_starttls': False
+    }
+
+
+# ---------- 测试 ----------
+
+def test_webhook_retries_with_exponential_backoff(webhook):
+    server = webhook(statuses=[500, 500])
+    manager = NotificationManager(workers=1, max_retries=3, backoff=0.1)
+    try:
+        manager.dispatch("报警", {'feishu_webhook': server.url})
+        assert manager.dispatcher.flush(timeout=5)
+    finally:
+        manager.close()
+
+    assert len(server.requests) == 3
+    gaps = [b["time"] - a["time"] for a, b in zip(server.requests, server.requests[1:])]
+    assert gaps[0] >= 0.1 and gaps[1] >= 0.2
+    stats = manager.stats()["channels"]["feishu"]
+    assert stats["sent"] == 1 and stats["failed"] == 0 and stats["retries"] == 2
+
+
+def test_webhook_gives_up_after_max_retries(webhook):
+    server = webhook(statuses=[500] * 10)
+    manager = NotificationManager(workers=1, max_retries=2, backoff=0.01)
+    try:
+        manager.dispatch("报警", {'feishu_webhook': server.url})
+        assert manager.dispatcher.flush(timeout=5)
+    finally:
+        manager.close()
+
+    assert len(server.requests) == 3
+    assert manager.stats()["channels"]["feishu"]["failed"] == 1
+
+
+def test_http_session_is_reused_across_sends(webhook):
+    server = webhook()
+    manager = NotificationManager(workers=1)
+    try:
+        for i in range(3):
+            manager.dispatch(f"报警 {i}", {'feishu_webhook': server.url})
+            assert manager.dispatcher.flush(timeout=5)
+        session = manager.session
+        manager.dispatch("报警 3", {'feishu_webhook': server.url})
+        assert manager.dispatcher.flush(timeout=5)
+        assert manager.session is session
+    finally:
+        manager.close()
+
+    # 同一个 keep-alive 连接：客户端端口不变
+    assert len(server.requests) == 4
+    assert len({request["port"] for request in server.requests}) == 1
+    assert server.requests[0]["payload"]["content"]["text"] == "报警 0"
+
+
+def test_smtp_connection_is_reused_after_noop(smtp_server):
+    server = smtp_server()
+    manager = NotificationManager(workers=1)
+    try:
+        for i in range(3):
+            manager.dispatch(f"邮件 {i}", email_config(server.port))
+            assert manager.dispatcher.flush(timeout=5)
+    finally:
+        manager.close()
+
+    assert server.connections == 1
+    assert len(server.messages) == 3
+    # 第二、三封发送前各用 NOOP 检查一次连接，只登录一次
+    assert server.commands.count('NOOP') == 2
+    assert server.commands.count('AUTH') == 1
+    assert server.commands[-1] == 'QUIT'
+
+
+def test_smtp_reconnects_when_noop_fails(smtp_server):
+    server = smtp_server(drop_after_mail=True)
+    manager = NotificationManager(workers=1, backoff=0.01)
+    try:
+        for i in range(2):
+            manager.dispatch(f"邮件 {i}", email_config(server.port))
+            assert manager.dispatcher.flush(timeout=5)
+    finally:
+        manager.close()
+
+    assert server.connections == 2
+    assert len(server.messages) == 2
+    assert manager.stats()["channels"]["email"]["sent"] == 2
+
+
+def test_full_queue_drops_oldest_job():
+    release = threading.Event()
+    started = threading.Event()
+    delivered = []
+
+    def send(channel, message, config):
+        started.set()
+        release.wait(5)
+        delivered.append(message)
+        return True
+
+    dispatcher = NotificationDispatcher(send, workers=1, queue_size=2)
+    dispatcher.submit('feishu', 'm0', {})
+    assert started.wait(5)  # m0 已被工作线程取走，正在发送
+    for message in ('m1', 'm2', 'm3'):
+        dispatcher.submit('feishu', message, {})
+    assert dispatcher.dropped == 1
+    assert dispatcher.qsize() == 2
+
+    release.set()
+    assert dispatcher.flush(timeout=5)
+    assert delivered == ['m0', 'm2', 'm3']
+    assert dispatcher.snapshot()["dropped"] == 1
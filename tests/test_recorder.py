@@ -0,0 +1,46 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from recorder import ClipRecorder
+
+
+def _jpeg():
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', frame)[1].tobytes()
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+# 两路摄像头共用录像目录：一路录像结束后清理旧录像，不能删掉另一路正在写入的录像
+def test_rotation_keeps_other_cameras_clip_in_progress(tmp_path):
+    jpeg = _jpeg()
+    cam0 = ClipRecorder(str(tmp_path), 'cam0', pre_roll=1.0, post_roll=100.0, fps=10.0, quota_mb=0)
+    cam1 = ClipRecorder(str(tmp_path), 'cam1', pre_roll=1.0, post_roll=0.0, fps=10.0, quota_mb=0)
+    try:
+        now = time.time()
+        cam0.add_jpeg(jpeg, now)
+        writing = cam0.trigger('fall', now)
+        cam0.add_jpeg(jpeg, now + 0.5)
+        assert _wait(lambda: os.path.exists(writing) and os.path.getsize(writing) > 0)
+
+        cam1.add_jpeg(jpeg, now)
+        finished = cam1.trigger('fall', now)
+        cam1.add_jpeg(jpeg, now + 0.5)
+        assert _wait(lambda: cam1.deleted == 1)
+
+        assert not os.path.exists(finished)
+        assert os.path.exists(writing)
+        assert cam0.is_recording()
+    finally:
+        cam0.stop()
+        cam1.stop()
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def cache(main2, monkeypatch):
+    monkeypatch.setattr(main2, 'frame_caches', {})
+    monkeypatch.setattr(main2, 'SNAPSHOT_WAIT_SECONDS', 0.5)
+    return main2.get_frame_cache()
+
+
+def put_later(cache, jpeg, delay=0.1):
+    def put():
+        time.sleep(delay)
+        cache.put(jpeg, {"time": time.time()})
+    thread = threading.Thread(target=put)
+    thread.start()
+    return thread
+
+
+# 空闲了很久：缓存里是一分钟前的画面，应等待请求之后编码的新画面
+def test_idle_snapshot_waits_for_fresh_frame(client, cache):
+    cache.put(b'old', {"time": time.time() - 60})
+    thread = put_later(cache, b'new')
+    response = client.get('/snapshot.jpg')
+    thread.join()
+    assert response.status_code == 200
+    assert response.content == b'new'
+
+
+# 从未编码过画面：同样等待新画面，而不是直接返回 503
+def test_snapshot_without_any_frame_waits(client, cache):
+    thread = put_later(cache, b'first')
+    response = client.get('/snapshot.jpg')
+    thread.join()
+    assert response.status_code == 200
+    assert response.content == b'first'
+
+
+def test_stale_snapshot_times_out_with_503(client, cache):
+    cache.put(b'old', {"time": time.time() - 60})
+    response = client.get('/snapshot.jpg')
+    assert response.status_code == 503
+
+
+def test_fresh_cached_frame_is_returned_immediately(client, cache):
+    cache.put(b'fresh', {"time": time.time()})
+    start = time.monotonic()
+    response = client.get('/snapshot.jpg')
+    assert response.content == b'fresh'
+    assert time.monotonic() - start < 0.4
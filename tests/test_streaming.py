@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+from streaming import ADAPT_INTERVAL, ClientSession, FrameCache
+
+
+def test_wait_newer_timeout_removes_waiter():
+    cache = FrameCache()
+
+    async def wait():
+        return await cache.wait_newer(0, timeout=0.01)
+
+    for _ in range(5):
+        assert asyncio.run(wait()) is None
+    assert cache._waiters == {}
+
+
+def test_wait_newer_cancel_removes_waiter():
+    cache = FrameCache()
+
+    async def main():
+        task = asyncio.create_task(cache.wait_newer(0))
+        await asyncio.sleep(0.01)
+        assert len(sum(cache._waiters.values(), [])) == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert cache._waiters == {}
+
+
+def test_wait_newer_returns_put_frame():
+    cache = FrameCache()
+
+    async def main():
+        task = asyncio.create_task(cache.wait_newer(0, timeout=5))
+        await asyncio.sleep(0.01)
+        cache.put(b'jpeg', {"person_count": 1})
+        return await task
+
+    frame = asyncio.run(main())
+    assert frame.seq == 1 and frame.jpeg == b'jpeg'
+    assert cache._waiters == {}
+
+
+# 视频线程不断因码率上限推迟帧，事件循环同时记录发送并每次都结束统计周期：
+# 结束周期时读到的推迟数要和周期实际累计的一致，推迟的帧不能丢失或算错周期
+def test_client_session_window_counts_survive_concurrent_updates():
+    session = ClientSession(None, binary=True, target_bps=1)
+    session._next_send = float('inf')
+    session._window[0] = 0.0
+    counted = []
+    adapt = session._adapt
+
+    # 读取本周期的推迟数后让出 CPU，视频线程若不受锁约束就会在此期间继续累加
+    def record_window(now):
+        counted.append(session._window[2])
+        time.sleep(0.001)
+        adapt(now)
+
+    session._adapt = record_window
+    stop = threading.Event()
+
+    def video_thread():
+        while not stop.is_set():
+            session.wants_frame(now=1.0)
+
+    thread = threading.Thread(target=video_thread)
+    thread.start()
+    now = 0.0
+    for _ in range(100):
+        now += ADAPT_INTERVAL
+        session._on_sent(1000, 0.01, now)
+    stop.set()
+    thread.join()
+
+    assert session.deferred > 0 and len(counted) == 100
+    assert sum(counted) + session._window[2] == session.deferred
@@ -0,0 +1,79 @@
+import numpy as np
+
+from backends import InferenceModel
+from tiling import TiledDetector
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.boxes = FakeBoxes(data)
+        self.keypoints = None
+
+
+# 固定 batch 导出的检测模型：每张裁剪图左上角检出一个人，输入数量不对时报错
+class FixedBatchDetector:
+    def __init__(self, batch):
+        self.batch = batch
+        self.calls = 0
+
+    def __call__(self, source, **kwargs):
+        if len(source) != self.batch:
+            raise RuntimeError(f"expected batch {self.batch}, got {len(source)}")
+        self.calls += 1
+        box = np.array([[10, 10, 60, 160, 0.9, 0]], dtype=np.float32)
+        return [FakeResult(box) for _ in source]
+
+
+def test_tiles_run_in_chunks_of_exported_batch():
+    yolo = FixedBatchDetector(3)
+    model = InferenceModel(yolo, 'onnx', 640, 'fp32', 'model.onnx', batch=3)
+    tiler = TiledDetector(tiling=True, tile_size=640, overlap=0.2)
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    tiles, _ = tiler.plan(frame)
+    assert len(tiles) % 3 != 0  # 最后一组需要补齐
+    persons = tiler.detect(model, frame)
+
+    assert yolo.calls == -(-len(tiles) // 3)
+    # 每块一个人，映射回整幅画面后互不重叠
+    assert len(persons) == len(tiles)
+    assert sorted(map(tuple, persons['xyxy'][:, :2].astype(int))) == sorted((x + 10, y + 10) for x, y, _, _ in tiles)
+
+
+# 记录送入模型的裁剪图尺寸
+class RecordingDetector:
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, source, **kwargs):
+        self.shapes += [crop.shape[:2] for crop in source]
+        return [FakeResult(np.zeros((0, 6), dtype=np.float32)) for _ in source]
+
+
+def test_default_tiles_match_model_input_and_are_not_resized():
+    yolo = RecordingDetector()
+    model = InferenceModel(yolo, 'pytorch', 320, 'fp32', 'yolo11n.pt')
+    tiler = TiledDetector(tiling=True)
+    tiler.detect(model, np.zeros((1080, 1920, 3), dtype=np.uint8))
+
+    assert yolo.shapes
+    # 每块都不大于模型输入尺寸，推理时不会被缩小
+    assert all(h == 320 and w == 320 for h, w in yolo.shapes)
+    assert tiler.describe()["tile_size"] == 320
+
+
+def test_tiles_larger_than_model_input_warn_once(capsys):
+    model = InferenceModel(RecordingDetector(), 'pytorch', 320, 'fp32', 'yolo11n.pt')
+    tiler = TiledDetector(tiling=True, tile_size=640)
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    tiler.detect(model, frame)
+    tiler.detect(model, frame)
+    assert capsys.readouterr().out.count("大于检测模型输入尺寸") == 1
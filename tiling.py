@@ -0,0 +1,141 @@
+import math
+
+import cv2
+import numpy as np
+
+from postprocess import PERSON_DTYPE, extract_persons, offset_persons
+
+
+# 贪心 NMS：IoU 超过阈值，或小框大部分落在大框里（分块边界处被切开的半个人）都视为重复
+def nms(boxes, scores, iou_threshold=0.5, ios_threshold=0.85):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.intp)
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        inter_h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = inter_w * inter_h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_threshold) & (ios <= ios_threshold)]
+    return np.asarray(keep, dtype=np.intp)
+
+
+# 在一个方向上均匀排布有重叠的分块起点
+def _tile_starts(start, length, size, overlap):
+    if length <= size:
+        return [start], length
+    step = max(1, int(size * (1 - overlap)))
+    count = math.ceil((length - size) / step) + 1
+    return np.linspace(start, start + length - size, count).astype(int).tolist(), size
+
+
+# 感兴趣区域 (ROI) 裁剪 + 分块推理
+# - ROI：只检测配置的矩形区域（如床边），其余区域完全不参与推理
+# - 分块：把高分辨率画面切成有重叠的 tile_size 小块，原始分辨率送入模型，远处的小人也能检出；
+#   tile_size 为 None 时取检测模型的输入尺寸（model.imgsz），小块推理时不会被缩小。指定的尺寸大于输入尺寸时，
+#   小块会被模型缩小后再检测，失去分块的意义，此时打印一次警告
+# 所有区域 / 分块合并成一个 batch 调用一次模型（固定 batch 导出的模型由 InferenceModel 按导出的 batch 分组），
+# 结果映射回整幅画面坐标后用 NMS 去重
+class TiledDetector:
+    def __init__(self, rois=None, tiling=False, tile_size=None, overlap=0.2, nms_iou=0.5, person_class=0):
+        self.rois = list(rois or [])
+        self.tiling = tiling
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.nms_iou = nms_iou
+        self.person_class = person_class
+        self.effective_tile_size = tile_size
+        self._warned = set()
+
+    # ROI 转换为像素坐标：四个值都不大于 1 时视为相对画面的比例
+    def regions(self, frame_shape):
+        h, w = frame_shape[:2]
+        if not self.rois:
+            return [(0, 0, w, h)]
+        regions = []
+        for x1, y1, x2, y2 in self.rois:
+            if max(x1, y1, x2, y2) <= 1.0:
+                x1, x2 = x1 * w, x2 * w
+                y1, y2 = y1 * h, y2 * h
+            x1, x2 = int(max(0, min(x1, x2))), int(min(w, max(x1, x2)))
+            y1, y2 = int(max(0, min(y1, y2))), int(min(h, max(y1, y2)))
+            if x2 > x1 and y2 > y1:
+                regions.append((x1, y1, x2, y2))
+        return regions or [(0, 0, w, h)]
+
+    # 本次推理使用的小块边长：默认与模型输入尺寸相同
+    def tile_size_for(self, model):
+        imgsz = getattr(model, 'imgsz', None)
+        size = self.tile_size or imgsz or 640
+        if self.tiling and imgsz and size > imgsz and (size, imgsz) not in self._warned:
+            self._warned.add((size, imgsz))
+            print(f"分块边长 {size} 大于检测模型输入尺寸 {imgsz}，小块会被缩小后检测；"
+                  f"建议将 tile_size 设为 None 或 {imgsz}")
+        self.effective_tile_size = size
+        return size
+
+    # 生成本帧要推理的所有块：返回 [(x1, y1, x2, y2), ...] 和对应的裁剪图
+    def plan(self, frame, tile_size=None):
+        tile_size = tile_size or self.tile_size or 640
+        tiles = []
+        for rx1, ry1, rx2, ry2 in self.regions(frame.shape):
+            if not self.tiling:
+                tiles.append((rx1, ry1, rx2, ry2))
+                continue
+            xs, tw = _tile_starts(rx1, rx2 - rx1, tile_size, self.overlap)
+            ys, th = _tile_starts(ry1, ry2 - ry1, tile_size, self.overlap)
+            tiles += [(x, y, x + tw, y + th) for y in ys for x in xs]
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in tiles]
+        return tiles, crops
+
+    # 各块结果映射回整幅画面坐标并去重
+    def merge(self, results, tiles):
+        parts = []
+        for r, (x1, y1, _, _) in zip(results, tiles):
+            persons = extract_persons(r, self.person_class)
+            offset_persons(persons, x1, y1)
+            parts.append(persons)
+        if not parts:
+            return np.zeros(0, dtype=PERSON_DTYPE)
+        persons = np.concatenate(parts)
+        if len(tiles) > 1 and len(persons) > 1:
+            persons = persons[nms(persons['xyxy'], persons['conf'], self.nms_iou)]
+        return persons
+
+    def detect(self, model, frame):
+        tiles, crops = self.plan(frame, self.tile_size_for(model))
+        results = model(crops, verbose=False)
+        return self.merge(results, tiles)
+
+    # 跟踪需要稳定的坐标系：只裁剪到所有 ROI 的外接矩形，不分块
+    def track(self, model, frame):
+        regions = self.regions(frame.shape)
+        x1 = min(r[0] for r in regions)
+        y1 = min(r[1] for r in regions)
+        x2 = max(r[2] for r in regions)
+        y2 = max(r[3] for r in regions)
+        crop = np.ascontiguousarray(frame[y1:y2, x1:x2])
+        results = model.track(crop, persist=True, verbose=False)
+        return self.merge(results, [(x1, y1, x2, y2)] * len(results))
+
+    # 在画面上用灰色细线标出检测区域，方便现场调整 ROI
+    def draw_rois(self, frame, color=(128, 128, 128)):
+        if not self.rois:
+            return
+        for x1, y1, x2, y2 in self.regions(frame.shape):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
+
+    def describe(self):
+        return {
+            "rois": len(self.rois),
+            "tiling": self.tiling,
+            "tile_size": self.effective_tile_size,
+            "overlap": self.overlap
+        }
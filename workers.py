@@ -0,0 +1,468 @@
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from capture import Capture
+from multi_camera import CameraState, analyze_result, parse_source
+from pipeline import StageStats
+
+# 帧槽状态：等待推理 / 推理中 / 已出结果待推送 / 推送中。不在字典里的槽是空闲的
+PENDING, INFLIGHT, READY, PUBLISHING = 'pending', 'inflight', 'ready', 'publishing'
+
+
+# 共享内存帧环：每路摄像头一块共享内存，划分为固定尺寸的帧槽
+# 主进程的采集线程把画面直接解码进槽里，推理进程按槽号读取同一块内存，画面不经过 pickle 复制
+# 接口与 capture.FrameRing 一致，可直接替换 Capture.ring
+class SharedFrameRing:
+    def __init__(self, slots, shape, name=None):
+        self.shape = tuple(shape)
+        self.slot_size = int(np.prod(self.shape))
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=self.slot_size * slots if create else 0)
+        self.buffers = [np.ndarray(self.shape, np.uint8, buffer=self.shm.buf, offset=i * self.slot_size)
+                        for i in range(slots)]
+        self.held = lambda: ()  # 返回当前不能覆盖的槽号
+        self.last_index = None   # 最近一次写入的槽号
+        self._index = 0
+        self._closed = False
+
+    # 推理进程中按名称挂载
+    @classmethod
+    def attach(cls, name, slots, shape):
+        return cls(slots, shape, name)
+
+    def spec(self):
+        return self.shm.name, len(self.buffers), self.shape
+
+    # 选一个空闲槽；全部被占用时等待（采集线程在此处自然限速）
+    def next(self, exclude=()):
+        while not self._closed:
+            held = self.held()
+            for _ in range(len(self.buffers)):
+                index = self._index
+                self._index = (index + 1) % len(self.buffers)
+                if index not in held:
+                    self.last_index = index
+                    return index, self.buffers[index]
+            time.sleep(0.005)
+        raise RuntimeError("共享帧环已关闭")
+
+    # 摄像头分辨率与建环时不同（如重连后）时缩放后复制进槽
+    def store(self, index, frame):
+        if frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        np.copyto(self.buffers[index], frame)
+
+    def close(self, unlink=False):
+        self._closed = True
+        self.buffers = []
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # 仍有画面引用着这块内存，随进程退出释放
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# 可用的 CPU 核心：优先取当前进程的亲和性设置（容器 / taskset 限制后的核心）
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+# 把核心均分给各推理进程，第一个核心留给主进程（采集、编码、HTTP / WebSocket）
+# 核心数不够时每个进程一个核心，轮流复用
+def plan_cores(workers, cores=None):
+    cores = list(cores if cores is not None else available_cores())
+    if len(cores) > workers:
+        cores = cores[1:]
+    if len(cores) < workers:
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    per_worker = len(cores) // workers
+    return [cores[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+
+
+# 推理进程启动时绑定核心并限制线程数，避免多个进程的线程池互相抢占
+def _configure_process(cores, threads):
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    if cores:
+        try:
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, cores)
+            else:
+                import psutil
+                psutil.Process().cpu_affinity(list(cores))
+        except Exception as e:
+            print(f"绑定 CPU 核心失败: {e}")
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+# 推理进程入口：加载模型，循环读取任务 (摄像头, 槽号, 帧序号)，只把检测结果（人员数组）发回主进程
+def _worker_main(worker_id, cores, threads, model_spec, pose_spec, pose_padding, ring_specs, tilers, tasks, results):
+    _configure_process(cores, threads)
+    from backends import load_model
+    from cascade import PoseCascade
+
+    model = load_model(**model_spec)
+    cascade = PoseCascade(load_model(**pose_spec), pose_padding) if pose_spec is not None else None
+    rings = [SharedFrameRing.attach(*spec) if spec is not None else None for spec in ring_specs]
+    results.put(('ready', worker_id, os.getpid()))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        camera, slot, seq = task
+        start = time.perf_counter()
+        try:
+            frame = rings[camera].buffers[slot]
+            persons = tilers[camera].detect(model, frame)
+            if cascade is not None:
+                cascade.estimate([(frame, persons)])
+        except Exception as e:
+            print(f"[worker{worker_id}] 推理失败: {e}")
+            persons = None
+        results.put(('result', worker_id, camera, slot, seq, persons, time.perf_counter() - start))
+
+    for ring in rings:
+        if ring is not None:
+            ring.close()
+
+
+# spawn 方式的子进程默认会重新执行主脚本，而 main2.py 在模块级加载模型、打开摄像头，
+# 启动子进程期间把主模块声明为本模块，子进程只导入 workers.py
+@contextmanager
+def _spawn_from_this_module():
+    main = sys.modules['__main__']
+    saved = getattr(main, '__spec__', None)
+    if getattr(sys, 'frozen', False):
+        yield  # 打包后的 exe 由 freeze_support() 处理
+        return
+    main.__spec__ = types.SimpleNamespace(name=__name__)
+    try:
+        yield
+    finally:
+        main.__spec__ = saved
+
+
+# 主进程中的一路摄像头：采集线程把画面写进共享帧环，并记录每个槽的状态
+class _SharedCamera:
+    def __init__(self, index, name, capture, state):
+        self.index = index
+        self.name = name
+        self.capture = capture
+        self.state = state
+        self.ring = None
+        self.slots = {}        # 槽号 -> [状态, 帧序号]
+        self.pending = None    # 等待推理的最新槽号
+        self.inflight = 0
+        self.ready_seq = 0     # 已出结果的最新帧序号，更旧的结果直接丢弃
+        self.seq = 0
+        self.dropped = 0
+        self.alive = False
+        self.thread = None
+        self.frame_interval = 0
+
+
+# 多进程推理：每个推理进程各自加载模型、绑定一组 CPU 核心，
+# 主进程负责采集、画框、报警、编码和 HTTP / WebSocket，画面通过共享内存帧环交给推理进程
+# - 任务队列由所有推理进程共享，空闲的进程先取，多路摄像头的总帧率随核心数增加
+# - 每路最多 max_inflight 帧同时在推理，来不及处理的帧直接被更新的帧替换，不会排队积压
+# - 对外接口与 MultiCameraDetector 相同，可直接用于多路推送线程
+class WorkerPool:
+    def __init__(self, model_spec, sources, workers=2, threads_per_worker=None, pin_cores=True,
+                 scheduler_factory=None, tiler_factory=None, capture_backend='auto', reconnect_delay=1.0,
+                 pose_spec=None, pose_padding=0.15):
+        self.model_spec = dict(model_spec)
+        # 两级检测：推理进程在检测之后对每个人的裁剪图做姿态估计
+        self.pose_spec = dict(pose_spec) if pose_spec is not None else None
+        self.pose_padding = pose_padding
+        self.workers = max(1, workers)
+        self.core_plan = plan_cores(self.workers) if pin_cores else [None] * self.workers
+        cores_per_worker = len(self.core_plan[0]) if pin_cores else max(1, len(available_cores()) // self.workers)
+        self.threads_per_worker = threads_per_worker or cores_per_worker
+        self.max_inflight = max(1, math.ceil(self.workers / max(1, len(sources))))
+
+        self.cameras = []
+        self.states = []
+        for i, source in enumerate(sources):
+            name = f"cam{i}"
+            # 单摄像头模式下传入的是已打开的 Capture
+            if isinstance(source, Capture):
+                capture = source
+            else:
+                capture = Capture(parse_source(source), capture_backend, reconnect_delay=reconnect_delay)
+            scheduler = scheduler_factory() if scheduler_factory is not None else None
+            tiler = tiler_factory(name) if tiler_factory is not None else None
+            state = CameraState(name, scheduler, tiler)
+            self.cameras.append(_SharedCamera(i, name, capture, state))
+            self.states.append(state)
+
+        self.frame_stats = StageStats()
+        self.worker_stats = [StageStats() for _ in range(self.workers)]
+        self.worker_pids = [None] * self.workers
+        self.processes = []
+        self.running = False
+        self._ready = {}  # 摄像头序号 -> (槽号, 人员数组或 None)
+        self._cond = threading.Condition()
+        self._context = multiprocessing.get_context('spawn')
+        self._tasks = None
+        self._results = None
+        self._result_thread = None
+
+    # 非 PyTorch 后端在主进程中先导出一次，各推理进程直接加载缓存，避免同时导出
+    @staticmethod
+    def _prepare_model(spec):
+        if spec is None or spec.get('backend', 'pytorch') == 'pytorch':
+            return
+        from backends import export_model
+        try:
+            export_model(spec['pt_path'], spec['backend'], spec.get('imgsz', 640), spec.get('precision', 'fp32'),
+                         spec.get('batch', 1), spec.get('cache_dir'))
+        except Exception as e:
+            print(f"导出 {spec['backend']} 模型失败: {e}，推理进程回退到 pytorch")
+            spec['backend'] = 'pytorch'
+
+    def start(self):
+        for cam in self.cameras:
+            capture = cam.capture
+            if capture.cap is None and not capture.open():
+                print(f"[{cam.name}] 无法打开视频源: {capture.source}")
+                continue
+            # 帧槽：等待推理 1 + 推理中 max_inflight + 待推送 1 + 推送中 1 + 正在写入 1
+            cam.ring = SharedFrameRing(self.max_inflight + 4, capture.frame_shape)
+            cam.ring.held = lambda cam=cam: self._held_slots(cam)
+            capture.ring = cam.ring
+            if capture.is_file:
+                fps = capture.get(cv2.CAP_PROP_FPS)
+                if fps and fps > 0:
+                    cam.frame_interval = 1.0 / fps
+            print(f"[{cam.name}] 视频源已打开: {capture.source}")
+        opened = [cam for cam in self.cameras if cam.ring is not None]
+        if not opened:
+            return False
+
+        self._prepare_model(self.model_spec)
+        self._prepare_model(self.pose_spec)
+        ring_specs = [cam.ring.spec() if cam.ring is not None else None for cam in self.cameras]
+        tilers = [cam.state.tiler for cam in self.cameras]
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        with _spawn_from_this_module():
+            for worker_id, cores in enumerate(self.core_plan):
+                process = self._context.Process(
+                    target=_worker_main, name=f"inference-worker{worker_id}", daemon=True,
+                    args=(worker_id, cores, self.threads_per_worker, self.model_spec, self.pose_spec,
+                          self.pose_padding, ring_specs, tilers, self._tasks, self._results))
+                process.start()
+                self.processes.append(process)
+        print(f"已启动 {self.workers} 个推理进程，每个 {self.threads_per_worker} 线程，"
+              f"核心分配: {self.core_plan if self.core_plan[0] is not None else '不绑定'}")
+
+        self.running = True
+        self._result_thread = threading.Thread(target=self._result_loop, name="worker-results", daemon=True)
+        self._result_thread.start()
+        for cam in opened:
+            cam.alive = True
+            cam.thread = threading.Thread(target=self._reader_loop, args=(cam,), name=f"camera-{cam.name}",
+                                          daemon=True)
+            cam.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        for cam in self.cameras:
+            cam.alive = False
+            if cam.ring is not None:
+                cam.ring._closed = True  # 唤醒等待空闲槽的采集线程
+            cam.capture.release()
+        for cam in self.cameras:
+            if cam.thread is not None:
+                cam.thread.join(timeout=2)
+        if self._tasks is None:
+            return
+        for _ in self.processes:
+            self._tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self._result_thread is not None:
+            self._result_thread.join(timeout=2)
+        # 释放队列的信号量，进程被信号结束时不会留下泄漏警告
+        for q in (self._tasks, self._results):
+            if q is not None:
+                q.close()
+                q.join_thread()
+        self._tasks = self._results = None
+        for cam in self.cameras:
+            if cam.ring is not None:
+                cam.ring.close(unlink=True)
+
+    def is_alive(self):
+        return (any(cam.alive for cam in self.cameras) and
+                any(process.is_alive() for process in self.processes))
+
+    def total_person_count(self):
+        return sum(state.person_count for state in self.states)
+
+    # ---------- 帧槽调度（持有 _cond 时调用） ----------
+
+    def _held_slots(self, cam):
+        with self._cond:
+            return set(cam.slots)
+
+    def _dispatch(self, cam):
+        if cam.pending is None or cam.inflight >= self.max_inflight:
+            return
+        slot, cam.pending = cam.pending, None
+        entry = cam.slots[slot]
+        scheduler = cam.state.scheduler
+        if scheduler is not None and not scheduler.should_infer(cam.ring.buffers[slot]):
+            self._make_ready(cam, slot, entry[1], None)
+            return
+        entry[0] = INFLIGHT
+        cam.inflight += 1
+        self._tasks.put((cam.index, slot, entry[1]))
+
+    def _make_ready(self, cam, slot, seq, persons):
+        previous = self._ready.get(cam.index)
+        if previous is not None:
+            # 上一个结果还没被取走，被更新的结果替换
+            del cam.slots[previous[0]]
+            cam.dropped += 1
+        cam.slots[slot] = [READY, seq]
+        cam.ready_seq = seq
+        self._ready[cam.index] = (slot, persons)
+        self._cond.notify()
+
+    # ---------- 采集线程与结果线程 ----------
+
+    def _reader_loop(self, cam):
+        while cam.alive:
+            start = time.monotonic()
+            # 网络流 / 摄像头断开时 read() 内部自动重连，只有文件读完或停止时才失败
+            try:
+                success, _ = cam.capture.read()
+            except RuntimeError:
+                success = False
+            if not success:
+                if self.running:
+                    print(f"[{cam.name}] 视频源已结束，停止该路")
+                cam.alive = False
+                break
+            with self._cond:
+                if cam.pending is not None:
+                    del cam.slots[cam.pending]
+                    cam.dropped += 1
+                cam.seq += 1
+                cam.pending = cam.ring.last_index
+                cam.slots[cam.pending] = [PENDING, cam.seq]
+                self._dispatch(cam)
+            if cam.frame_interval:
+                remaining = cam.frame_interval - (time.monotonic() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+    def _result_loop(self):
+        while self.running:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if message[0] == 'ready':
+                _, worker_id, pid = message
+                self.worker_pids[worker_id] = pid
+                print(f"推理进程 {worker_id} 已就绪 (pid {pid})")
+                continue
+
+            _, worker_id, camera, slot, seq, persons, duration = message
+            self.worker_stats[worker_id].record(duration)
+            cam = self.cameras[camera]
+            with self._cond:
+                cam.inflight -= 1
+                if persons is None or seq <= cam.ready_seq:
+                    # 推理失败，或更新的帧已经先出结果
+                    cam.slots.pop(slot, None)
+                else:
+                    self._make_ready(cam, slot, seq, persons)
+                self._dispatch(cam)
+
+    # ---------- 与 MultiCameraDetector 相同的接口 ----------
+
+    # 取出各路已出结果的帧，画框并更新状态，返回 [(state, 标注后的画面), ...]
+    # 返回的画面是共享内存中的槽，下一次 tick() 时才会被释放复用
+    def tick(self, draw=True, timeout=0.05):
+        with self._cond:
+            for cam in self.cameras:
+                for slot in [s for s, entry in cam.slots.items() if entry[0] == PUBLISHING]:
+                    del cam.slots[slot]
+            if not self._ready:
+                self._cond.wait(timeout)
+            ready, self._ready = self._ready, {}
+            for index, (slot, _) in ready.items():
+                self.cameras[index].slots[slot][0] = PUBLISHING
+
+        processed = []
+        for index, (slot, persons) in ready.items():
+            cam = self.cameras[index]
+            state = cam.state
+            frame = cam.ring.buffers[slot]
+            if persons is not None:
+                if draw:
+                    state.tiler.draw_rois(frame)
+                state.person_count, state.fall_detected = analyze_result(frame, persons, draw)
+                state.frames += 1
+                if state.scheduler is not None:
+                    state.scheduler.report(state.person_count)
+                self.frame_stats.record(0)
+            processed.append((state, frame))
+        return processed
+
+    def describe_model(self):
+        return {
+            "backend": self.model_spec.get('backend', 'pytorch'),
+            "imgsz": self.model_spec.get('imgsz', 640),
+            "precision": self.model_spec.get('precision', 'fp32'),
+            "path": self.model_spec.get('pt_path'),
+            "pose_path": self.pose_spec.get('pt_path') if self.pose_spec is not None else None,
+            "processes": self.workers
+        }
+
+    def snapshot(self):
+        return {
+            "mode": "workers",
+            "total_fps": self.frame_stats.snapshot()["fps"],
+            "max_inflight": self.max_inflight,
+            "workers": [{
+                "pid": pid,
+                "alive": process.is_alive(),
+                "cores": cores,
+                "threads": self.threads_per_worker,
+                "inference": stats.snapshot()
+            } for pid, process, cores, stats in zip(self.worker_pids, self.processes, self.core_plan,
+                                                    self.worker_stats)],
+            "cameras": [dict(cam.state.to_dict(), dropped=cam.dropped, capture=cam.capture.snapshot())
+                        for cam in self.cameras]
+        }